@@ -1,12 +1,22 @@
+import json
 import aws_cdk as cdk
 from constructs import Construct
 from aws_cdk import aws_s3 as s3
 from aws_cdk import aws_s3_deployment as s3_deployment
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_glue as glue
+from sec_fs_dataset_transformer.stats import STATS_COLUMNS, STATS_TABLE_NAME
 
 SEC_FS_DATASET_SOURCE_URL = "https://www.sec.gov/files/dera/data/financial-statement-data-sets/"
 
+# Capacity of the transform jobs, selected with -c transform_capacity and -c catchup_transform_capacity.
+# With auto scaling, number_of_workers is the most workers a run can use.
+TRANSFORM_CAPACITY_PROFILES = {
+    "small": {"worker_type": "G.1X", "number_of_workers": 5},
+    "medium": {"worker_type": "G.1X", "number_of_workers": 10},
+    "large": {"worker_type": "G.2X", "number_of_workers": 20},
+}
+
 class AnalyzeSecAwsStack(cdk.Stack):
 
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
@@ -14,6 +24,7 @@ class AnalyzeSecAwsStack(cdk.Stack):
         self.__create_bucket()
         self.__upload_assets()
         self.__create_glue_db()
+        self.__create_stats_table()
         self.__create_job_role()
         self.__create_jobs()
         self.__build_workflows()
@@ -28,13 +39,40 @@ class AnalyzeSecAwsStack(cdk.Stack):
             )
         )
     
+    def __create_stats_table(self):
+        """
+        Create fs_stats, the JSON table of the statistics stored by the transform jobs for each ingested file
+        """
+        stats_table = glue.CfnTable(
+            self,
+            "Stats_Table",
+            catalog_id=self.account,
+            database_name=self.node.get_context("glue_db_name"),
+            table_input=glue.CfnTable.TableInputProperty(
+                name=STATS_TABLE_NAME,
+                table_type="EXTERNAL_TABLE",
+                parameters={"classification": "json"},
+                storage_descriptor=glue.CfnTable.StorageDescriptorProperty(
+                    columns=[glue.CfnTable.ColumnProperty(name=name, type=column_type) for name, column_type in STATS_COLUMNS],
+                    location="s3://{}/DATA/STATS/".format(self.s3_bucket.bucket_name),
+                    input_format="org.apache.hadoop.mapred.TextInputFormat",
+                    output_format="org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat",
+                    serde_info=glue.CfnTable.SerdeInfoProperty(serialization_library="org.openx.data.jsonserde.JsonSerDe")
+                )
+            )
+        )
+        stats_table.add_dependency(self.glue_database)
+
     def __create_jobs(self):
         
         self.catchup_collect_job = self.__create_collect_job(
             job_name="catchup_collect_job",
             script_name="catchup_collect_sec_fs_datasets.py",
             description="This job is made to catchup on SEC Financial Statements since Q1 2009",
-            max_capacity=1
+            max_capacity=1,
+            extra_arguments={
+                "--max_concurrent_quarters": "4"
+            }
         )
 
         self.collect_sec_fs_dataset = self.__create_collect_job(
@@ -42,49 +80,91 @@ class AnalyzeSecAwsStack(cdk.Stack):
             script_name="due_collect_sec_fs_datasets.py",
         )
 
-        self.fs_sub_transform_job = self.__create_transform_job(
-            job_name="fs_sub_transform_job",
-            table_name="fs_sub",
-            write_mode="append",
-            sub_folder="FS_SUB",
-            cluster_cols="adsh",
-            cluster_table="true",
-            num_clusters="3",
-            partition="true"
-        )
+        transform_tables = [
+            self.__table_arguments(
+                table_name="fs_sub",
+                write_mode="overwrite_partitions",
+                sub_folder="FS_SUB",
+                cluster_cols="adsh",
+                sort_cols="adsh",
+                cluster_table="true",
+                num_clusters="auto",
+                partition="true",
+                partition_quarter="true"
+            ),
+            self.__table_arguments(
+                table_name="fs_num",
+                write_mode="overwrite_partitions",
+                sub_folder="FS_NUM",
+                cluster_cols="adsh",
+                sort_cols="adsh,tag,ddate",
+                cluster_table="true",
+                num_clusters="auto",
+                partition="true",
+                partition_quarter="true"
+            ),
+            self.__table_arguments(
+                table_name="fs_pre",
+                write_mode="overwrite_partitions",
+                sub_folder="FS_PRE",
+                cluster_cols="adsh",
+                sort_cols="adsh,report,line",
+                cluster_table="true",
+                num_clusters="auto",
+                partition="true",
+                partition_quarter="true"
+            ),
+            self.__table_arguments(
+                table_name="fs_tag",
+                write_mode="upsert",
+                merge_keys="tag,version",
+                sub_folder="FS_TAG",
+                sort_cols="tag,version",
+                cluster_cols="adsh",
+                cluster_table="false",
+                num_clusters="auto",
+                partition="false"
+            ),
+        ]
 
-        self.fs_num_transform_job = self.__create_transform_job(
-            job_name="fs_num_transform_job",
-            table_name="fs_num",
-            write_mode="append",
-            sub_folder="FS_NUM",
-            cluster_cols="adsh",
-            cluster_table="true",
-            num_clusters="3",
-            partition="true"
-        )
+        # By default a single job transforms every table, so that they share one cluster instead of starting one each.
+        # With -c transform_mode="per_table", each table gets its own job as before.
+        # The catchup workflow has jobs of its own, with the larger capacity it needs to ingest every quarter since 2009.
+        scheduled_capacity = TRANSFORM_CAPACITY_PROFILES[self.node.try_get_context("transform_capacity") or "small"]
+        catchup_capacity = TRANSFORM_CAPACITY_PROFILES[self.node.try_get_context("catchup_transform_capacity") or "large"]
+        # A quarterly increment is small enough to be transformed with PyArrow in a Python shell job, without starting a Spark cluster.
+        # The catchup always uses Spark, which creates the tables. With -c transform_engine="spark", the scheduled workflow uses it as well.
+        scheduled_engine = self.node.try_get_context("transform_engine") or "arrow"
+        if self.node.try_get_context("transform_mode") == "per_table":
+            self.catchup_transform_jobs = [
+                self.__create_transform_job(job_name="{}_catchup_transform_job".format(table["table_name"]), table=table, **catchup_capacity)
+                for table in transform_tables
+            ]
+        else:
+            self.catchup_transform_jobs = [
+                self.__create_multi_table_transform_job(job_name="fs_catchup_transform_job", tables=transform_tables, **catchup_capacity)
+            ]
+        if scheduled_engine == "arrow":
+            self.transform_jobs = [
+                self.__create_arrow_transform_job(job_name="fs_arrow_transform_job", tables=transform_tables)
+            ]
+        elif self.node.try_get_context("transform_mode") == "per_table":
+            self.transform_jobs = [
+                self.__create_transform_job(job_name="{}_transform_job".format(table["table_name"]), table=table, **scheduled_capacity)
+                for table in transform_tables
+            ]
+        else:
+            self.transform_jobs = [
+                self.__create_multi_table_transform_job(job_name="fs_transform_job", tables=transform_tables, **scheduled_capacity)
+            ]
 
-        self.fs_pre_transform_job = self.__create_transform_job(
-            job_name="fs_pre_transform_job",
-            table_name="fs_pre",
-            write_mode="append",
-            sub_folder="FS_PRE",
-            cluster_cols="adsh",
-            cluster_table="true",
-            num_clusters="3",
-            partition="true"
-        )
+        # The fact table inlines the submission and tag attributes into fs_num, it's rebuilt for the quarters transformed since its last run.
+        # The same job maintains the fs_sub_index lookup table.
+        self.fact_job = self.__create_fact_job(job_name="fs_fact_job", **scheduled_capacity)
+        self.catchup_fact_job = self.__create_fact_job(job_name="fs_catchup_fact_job", **catchup_capacity)
 
-        self.fs_tag_transform_job = self.__create_transform_job(
-            job_name="fs_tag_transform_job",
-            table_name="fs_tag",
-            write_mode="overwrite",
-            sub_folder="FS_TAG",
-            cluster_cols="adsh",
-            cluster_table="false",
-            num_clusters="3",
-            partition="false"
-        )
+        # The catchup writes each table in many batches, their partitions are rewritten afterwards into fewer, sorted files
+        self.compaction_job = self.__create_compaction_job(job_name="fs_compaction_job", tables=transform_tables, **catchup_capacity)
 
     def __build_workflows(self):
         # Creation of the scheduled workflow
@@ -117,17 +197,9 @@ class AnalyzeSecAwsStack(cdk.Stack):
             type="CONDITIONAL",
             actions=[
                 glue.CfnTrigger.ActionProperty(
-                    job_name=self.fs_num_transform_job.name
-                ),
-                glue.CfnTrigger.ActionProperty(
-                    job_name=self.fs_pre_transform_job.name
-                ),
-                glue.CfnTrigger.ActionProperty(
-                    job_name=self.fs_sub_transform_job.name
-                ),
-                glue.CfnTrigger.ActionProperty(
-                    job_name=self.fs_tag_transform_job.name
+                    job_name=transform_job.name
                 )
+                for transform_job in self.transform_jobs
             ],
             workflow_name=self.sec_fs_dataset_pipeline.name,
             predicate=glue.CfnTrigger.PredicateProperty(
@@ -142,6 +214,29 @@ class AnalyzeSecAwsStack(cdk.Stack):
             )
         )
 
+        fact_trigger = glue.CfnTrigger(
+            self,
+            "fact_trigger",
+            type="CONDITIONAL",
+            actions=[
+                glue.CfnTrigger.ActionProperty(
+                    job_name=self.fact_job.name
+                )
+            ],
+            workflow_name=self.sec_fs_dataset_pipeline.name,
+            predicate=glue.CfnTrigger.PredicateProperty(
+                logical="AND",
+                conditions=[
+                    glue.CfnTrigger.ConditionProperty(
+                        logical_operator="EQUALS",
+                        job_name=transform_job.name,
+                        state="SUCCEEDED"
+                    )
+                    for transform_job in self.transform_jobs
+                ]
+            )
+        )
+
         # Creation of the catchup workflow
         self.catchup_sec_fs_dataset_pipeline = glue.CfnWorkflow(
             self,
@@ -170,16 +265,54 @@ class AnalyzeSecAwsStack(cdk.Stack):
             type="CONDITIONAL",
             actions=[
                 glue.CfnTrigger.ActionProperty(
-                    job_name=self.fs_num_transform_job.name
-                ),
-                glue.CfnTrigger.ActionProperty(
-                    job_name=self.fs_pre_transform_job.name
-                ),
+                    job_name=transform_job.name
+                )
+                for transform_job in self.catchup_transform_jobs
+            ],
+            workflow_name=self.catchup_sec_fs_dataset_pipeline.name,
+            predicate=glue.CfnTrigger.PredicateProperty(
+                logical="AND",
+                conditions=[
+                    glue.CfnTrigger.ConditionProperty(
+                        logical_operator="EQUALS",
+                        job_name=self.catchup_collect_job.name,
+                        state="SUCCEEDED"
+                    )
+                ]
+            )
+        )
+
+        catchup_fact_trigger = glue.CfnTrigger(
+            self,
+            "catchup_fact_trigger",
+            type="CONDITIONAL",
+            actions=[
                 glue.CfnTrigger.ActionProperty(
-                    job_name=self.fs_sub_transform_job.name
-                ),
+                    job_name=self.catchup_fact_job.name
+                )
+            ],
+            workflow_name=self.catchup_sec_fs_dataset_pipeline.name,
+            predicate=glue.CfnTrigger.PredicateProperty(
+                logical="AND",
+                conditions=[
+                    glue.CfnTrigger.ConditionProperty(
+                        logical_operator="EQUALS",
+                        job_name=transform_job.name,
+                        state="SUCCEEDED"
+                    )
+                    for transform_job in self.catchup_transform_jobs
+                ]
+            )
+        )
+
+        # The compaction moves the files of fs_num and fs_sub, it waits for the fact table to have read them
+        catchup_compaction_trigger = glue.CfnTrigger(
+            self,
+            "catchup_compaction_trigger",
+            type="CONDITIONAL",
+            actions=[
                 glue.CfnTrigger.ActionProperty(
-                    job_name=self.fs_tag_transform_job.name
+                    job_name=self.compaction_job.name
                 )
             ],
             workflow_name=self.catchup_sec_fs_dataset_pipeline.name,
@@ -188,14 +321,14 @@ class AnalyzeSecAwsStack(cdk.Stack):
                 conditions=[
                     glue.CfnTrigger.ConditionProperty(
                         logical_operator="EQUALS",
-                        job_name=self.catchup_collect_job.name,
+                        job_name=self.catchup_fact_job.name,
                         state="SUCCEEDED"
                     )
                 ]
             )
         )
     
-    def __create_collect_job(self, job_name, script_name, description="", max_capacity=0.0625):
+    def __create_collect_job(self, job_name, script_name, description="", max_capacity=0.0625, streaming="true", extra_arguments=None):
         return glue.CfnJob(
             self,
             job_name,
@@ -212,14 +345,138 @@ class AnalyzeSecAwsStack(cdk.Stack):
             default_arguments={
                 "--s3_bucket": self.s3_bucket.bucket_name,
                 "--s3_prefix_dest": "DATA/RAW/",
+                "--s3_prefix_manifest": "DATA/MANIFEST/",
                 "--source_url": SEC_FS_DATASET_SOURCE_URL,
+                "--streaming": streaming,
+                "--output_format": self.node.try_get_context("collector_output_format") or "txt",
+                # Only the byte ranges of these members are downloaded from the archives
+                "--members": self.node.try_get_context("collector_members") or "num.txt,pre.txt,sub.txt,tag.txt",
+                "--ranged": "true",
+                # Provides pyarrow, required by the parquet output format
+                "library-set": "analytics",
                 "--job-language": "python",
                 "--TempDir": "s3://{}/temporary/".format(self.s3_bucket.bucket_name),
-                "--extra-py-files": "s3://{}/sources/libs/sec_fs_dataset_collector-0.1-py3-none-any.whl".format(self.s3_bucket.bucket_name),
+                "--extra-py-files": ",".join([
+                    "s3://{}/sources/libs/sec_fs_dataset_collector-0.1-py3-none-any.whl".format(self.s3_bucket.bucket_name),
+                    "s3://{}/sources/libs/sec_fs_metrics-0.1-py3-none-any.whl".format(self.s3_bucket.bucket_name)
+                ]),
+                # The measures of each stage are published as CloudWatch metrics. The Glue job log groups don't extract
+                # metrics from the Embedded Metric Format, which only suits log groups set up to ingest it.
+                "--metrics_sink": "cloudwatch",
+                **(extra_arguments or {})
+            }
+        )
+
+    def __table_arguments(self, table_name, sub_folder, write_mode, cluster_cols="", cluster_table="", num_clusters="", partition="", partition_quarter="false", malformed_rows="permissive", merge_keys="", sort_cols=""):
+        """
+        Arguments of transform_sec_fs_dataset.py describing a table, without their leading --
+        """
+        return {
+            "archive_s3_prefix": "DATA/ARCHIVE/{}/".format(sub_folder),
+            "cluster_cols": cluster_cols,
+            "cluster_table": cluster_table,
+            "num_clusters": num_clusters,
+            "partition_by_file_year": partition,
+            "partition_by_file_quarter": partition_quarter,
+            "raw_s3_prefix": "DATA/RAW/{}/".format(sub_folder),
+            "table_name": table_name,
+            "table_s3a_location": "s3a://{}/DATA/TRANSFORM/{}/".format(self.s3_bucket.bucket_name, sub_folder),
+            "write_mode": write_mode,
+            "malformed_rows": malformed_rows,
+            "merge_keys": merge_keys,
+            "sort_cols": sort_cols,
+        }
+
+    def __create_transform_job(self, job_name, table, worker_type="G.1X", number_of_workers=5):
+        return self.__create_spark_job(
+            job_name=job_name,
+            script_name="transform_sec_fs_dataset.py",
+            worker_type=worker_type,
+            number_of_workers=number_of_workers,
+            arguments={"--"+name: value for name, value in table.items()}
+        )
+
+    def __create_multi_table_transform_job(self, job_name, tables, worker_type="G.1X", number_of_workers=5, max_concurrent_tables=4):
+        return self.__create_spark_job(
+            job_name=job_name,
+            script_name="transform_sec_fs_datasets.py",
+            worker_type=worker_type,
+            number_of_workers=number_of_workers,
+            arguments={
+                "--tables": json.dumps(tables),
+                "--max_concurrent_tables": str(max_concurrent_tables),
+                # The tables submit their Spark jobs concurrently, they share the executors instead of queuing behind each other
+                "--conf": "spark.scheduler.mode=FAIR"
             }
         )
 
-    def __create_transform_job(self, job_name, table_name, sub_folder, write_mode, cluster_cols="", cluster_table="", num_clusters="", partition="", worker_type="G.1X", number_of_workers=5):
+    def __create_arrow_transform_job(self, job_name, tables, max_capacity=1):
+        return glue.CfnJob(
+            self,
+            job_name,
+            name=job_name,
+            description="This job transforms the tables of the latest quarter with PyArrow",
+            max_capacity=max_capacity,
+            glue_version="3.0",
+            role=self.job_role.role_arn,
+            command=glue.CfnJob.JobCommandProperty(
+                name="pythonshell",
+                python_version="3.9",
+                script_location= "s3://{}/sources/job_scripts/{}".format(self.s3_bucket.bucket_name, "arrow_transform_sec_fs_datasets.py")
+            ),
+            default_arguments={
+                "--s3_bucket": self.s3_bucket.bucket_name,
+                "--database": self.node.get_context("glue_db_name"),
+                "--ledger_s3_prefix": "DATA/LEDGER/",
+                "--max_batch_bytes": str(8 * 1024 * 1024 * 1024),
+                "--target_file_bytes": str(256 * 1024 * 1024),
+                "--stats_s3_prefix": "DATA/STATS/",
+                "--tables": json.dumps(tables),
+                "--metrics_sink": "cloudwatch",
+                "library-set": "analytics",
+                # The version of the analytics library set is too old for the CSV reader and joins the transform uses
+                "--additional-python-modules": "pyarrow==14.0.2",
+                "--job-language": "python",
+                "--TempDir": "s3://{}/temporary/".format(self.s3_bucket.bucket_name),
+                "--extra-py-files": ",".join([
+                    "s3://{}/sources/libs/sec_fs_dataset_transformer-0.1-py3-none-any.whl".format(self.s3_bucket.bucket_name),
+                    "s3://{}/sources/libs/sec_fs_metrics-0.1-py3-none-any.whl".format(self.s3_bucket.bucket_name)
+                ])
+            }
+        )
+
+    def __create_compaction_job(self, job_name, tables, worker_type="G.1X", number_of_workers=5, max_concurrent_tables=4):
+        return self.__create_spark_job(
+            job_name=job_name,
+            script_name="compact_sec_fs_tables.py",
+            worker_type=worker_type,
+            number_of_workers=number_of_workers,
+            arguments={
+                "--tables": json.dumps(tables),
+                "--max_concurrent_tables": str(max_concurrent_tables),
+                # Set to true to rewrite every partition, e.g. to sort the partitions written before sort_cols existed
+                "--force_compaction": "false",
+                "--conf": "spark.scheduler.mode=FAIR"
+            }
+        )
+
+    def __create_fact_job(self, job_name, worker_type="G.1X", number_of_workers=5):
+        return self.__create_spark_job(
+            job_name=job_name,
+            script_name="build_sec_fs_fact_table.py",
+            worker_type=worker_type,
+            number_of_workers=number_of_workers,
+            arguments={
+                "--table_name": "fs_fact",
+                "--table_s3a_location": "s3a://{}/DATA/TRANSFORM/FS_FACT/".format(self.s3_bucket.bucket_name),
+                "--sort_cols": "cik,tag,ddate",
+                # Maps each adsh and cik to its quarter, so that point lookups only scan the partitions they need
+                "--index_table_name": "fs_sub_index",
+                "--index_table_s3a_location": "s3a://{}/DATA/TRANSFORM/FS_SUB_INDEX/".format(self.s3_bucket.bucket_name)
+            }
+        )
+
+    def __create_spark_job(self, job_name, script_name, arguments, worker_type="G.1X", number_of_workers=5):
         return glue.CfnJob(
             self,
             job_name,
@@ -231,20 +488,22 @@ class AnalyzeSecAwsStack(cdk.Stack):
             command=glue.CfnJob.JobCommandProperty(
                 name="glueetl",
                 python_version="3",
-                script_location= "s3://{}/sources/job_scripts/{}".format(self.s3_bucket.bucket_name, "transform_sec_fs_dataset.py")
+                script_location= "s3://{}/sources/job_scripts/{}".format(self.s3_bucket.bucket_name, script_name)
             ),
             default_arguments={
                 "--s3_bucket": self.s3_bucket.bucket_name,
-                "--archive_s3_prefix": "DATA/ARCHIVE/{}/".format(sub_folder),
-                "--cluster_cols": cluster_cols,
-                "--cluster_table": cluster_table,
                 "--database": self.node.get_context("glue_db_name"),
-                "--num_clusters": num_clusters,
-                "--partition_by_file_year": partition,
-                "--raw_s3_prefix": "DATA/RAW/{}/".format(sub_folder),
-                "--table_name": table_name,
-                "--table_s3a_location": "s3a://{}/DATA/TRANSFORM/{}/".format(self.s3_bucket.bucket_name, sub_folder),
-                "--write_mode": write_mode,
+                "--ledger_s3_prefix": "DATA/LEDGER/",
+                "--max_batch_bytes": str(8 * 1024 * 1024 * 1024),
+                # The number of buckets and of files written per partition are planned so that the Parquet files are about this size
+                "--target_file_bytes": str(256 * 1024 * 1024),
+                # The statistics of each ingested file are stored there, as the table fs_stats
+                "--stats_s3_prefix": "DATA/STATS/",
+                "--additional-python-modules": ",".join([
+                    "s3://{}/sources/libs/sec_fs_dataset_transformer-0.1-py3-none-any.whl".format(self.s3_bucket.bucket_name),
+                    "s3://{}/sources/libs/sec_fs_metrics-0.1-py3-none-any.whl".format(self.s3_bucket.bucket_name)
+                ]),
+                "--metrics_sink": "cloudwatch",
                 "--job-language": "python",
                 "--job-bookmark-option": "job-bookmark-disable",
                 "--TempDir": "s3://{}/temporary/".format(self.s3_bucket.bucket_name),
@@ -254,7 +513,8 @@ class AnalyzeSecAwsStack(cdk.Stack):
                 "--spark-event-logs-path": "s3://{}/sparkHistoryLogs/".format(self.s3_bucket.bucket_name),
                 "--enable-glue-datacatalog": "true",
                 "--enable-auto-scaling": "true",
-                "--enable-job-insights": "false"
+                "--enable-job-insights": "false",
+                **arguments
             }
         )
 
@@ -277,6 +537,11 @@ class AnalyzeSecAwsStack(cdk.Stack):
                 )
             ]
         )
+        # The checkpoints of the upserts are only read by the job which wrote them
+        self.s3_bucket.add_lifecycle_rule(
+            prefix="temporary/checkpoints/",
+            expiration=cdk.Duration.days(1)
+        )
 
     def __upload_assets(self):
         """
@@ -295,7 +560,9 @@ class AnalyzeSecAwsStack(cdk.Stack):
             self,
             "Libs_Upload",
             sources=[
-                s3_deployment.Source.asset("./assets/libs/sec_fs_dataset_collector/dist/")
+                s3_deployment.Source.asset("./assets/libs/sec_fs_dataset_collector/dist/"),
+                s3_deployment.Source.asset("./assets/libs/sec_fs_dataset_transformer/dist/"),
+                s3_deployment.Source.asset("./assets/libs/sec_fs_metrics/dist/")
             ],
             destination_bucket=self.s3_bucket,
             destination_key_prefix="sources/libs"
@@ -316,7 +583,22 @@ class AnalyzeSecAwsStack(cdk.Stack):
             )
         self.job_role.add_to_policy(
             iam.PolicyStatement(
-                actions=["s3:GetObject", "s3:PutObject"],
+                actions=["s3:GetObject", "s3:PutObject", "s3:DeleteObject", "s3:AbortMultipartUpload"],
                 resources=[self.s3_bucket.bucket_arn + "/*"]
             )
         )
+        # Lets the jobs publish the measures of their stages
+        self.job_role.add_to_policy(
+            iam.PolicyStatement(
+                actions=["cloudwatch:PutMetricData"],
+                resources=["*"],
+                conditions={"StringEquals": {"cloudwatch:namespace": "SecFsDatasets"}}
+            )
+        )
+        # Without it, reading a missing key (e.g. a quarter's manifest not written yet) fails with AccessDenied instead of NoSuchKey
+        self.job_role.add_to_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=[self.s3_bucket.bucket_arn]
+            )
+        )
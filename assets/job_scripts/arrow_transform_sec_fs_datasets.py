@@ -0,0 +1,28 @@
+"""
+This module transforms several tables with PyArrow in a Python shell job, for the quarterly increments of tables
+created by the Spark transform
+"""
+
+import json
+import sys
+import boto3
+from awsglue.utils import getResolvedOptions
+from sec_fs_dataset_transformer.arrow_transform import transform_tables
+from sec_fs_dataset_transformer.tables import COMMON_OPTIONS
+from sec_fs_metrics.metrics import Metrics, sink_from_uri
+
+s3_client = boto3.Session().client("s3")
+glue_client = boto3.Session().client("glue")
+
+# tables is a JSON list with the table arguments of transform_sec_fs_dataset.py for each table
+args = getResolvedOptions(sys.argv, COMMON_OPTIONS + ["tables"])
+
+failures = transform_tables(
+    s3_client,
+    glue_client,
+    common_options={option: args[option] for option in COMMON_OPTIONS},
+    tables=json.loads(args["tables"]),
+    metrics=Metrics(sink_from_uri(args["metrics_sink"]), job="arrow_transform")
+)
+if failures:
+    raise RuntimeError("Failed to transform the tables {}".format(", ".join(sorted(failures))))
@@ -0,0 +1,24 @@
+"""
+This module rebuilds the partitions of the fact table joining fs_num, fs_sub and fs_tag, and of the index mapping
+submissions and companies to their quarter, for the quarters transformed since their last run
+"""
+
+import sys
+import boto3
+from awsglue.utils import getResolvedOptions
+from pyspark.context import SparkContext
+from awsglue.context import GlueContext
+from awsglue.job import Job
+from sec_fs_dataset_transformer.fact import FACT_OPTIONS, build_fact_table
+from sec_fs_dataset_transformer.lookup import INDEX_OPTIONS, build_index_table
+
+sc = SparkContext.getOrCreate()
+glueContext = GlueContext(sc)
+spark = glueContext.spark_session
+job = Job(glueContext)
+s3_client = boto3.Session().client("s3")
+
+args = getResolvedOptions(sys.argv, FACT_OPTIONS + INDEX_OPTIONS)
+
+build_fact_table(spark, s3_client, args)
+build_index_table(spark, s3_client, args)
@@ -2,19 +2,28 @@
 This module is made to catchup on SEC Financial Statements since Q1 2009
 """
 
-from datetime import date
 import sys
-from sec_fs_dataset_collector.collect_sec_fs_datasets import handle_quarter
+from sec_fs_dataset_collector.collect_sec_fs_datasets import handle_quarters, is_unpublished_quarter, quarters_since, INITIAL_YEAR
+from sec_fs_metrics.metrics import Metrics, sink_from_uri
 from awsglue.utils import getResolvedOptions
 
-args = getResolvedOptions(sys.argv, ["source_url", "s3_bucket", "s3_prefix_dest"])
+args = getResolvedOptions(sys.argv, ["source_url", "s3_bucket", "s3_prefix_dest", "streaming", "max_concurrent_quarters", "s3_prefix_manifest", "output_format", "members", "ranged", "metrics_sink"])
 
-INITIAL_YEAR = 2009
-CURRENT_YEAR = date.today().year
+failures = handle_quarters(
+    quarters=quarters_since(INITIAL_YEAR),
+    s3_bucket=args['s3_bucket'],
+    s3_prefix_dest=args['s3_prefix_dest'],
+    source_url=args['source_url'],
+    streaming=args['streaming'] == "true",
+    max_workers=int(args['max_concurrent_quarters']),
+    s3_prefix_manifest=args['s3_prefix_manifest'],
+    output_format=args['output_format'],
+    members=args['members'].split(","),
+    ranged=args['ranged'] == "true",
+    metrics=Metrics(sink_from_uri(args['metrics_sink']), job="catchup_collect")
+)
 
-for year in range(INITIAL_YEAR, CURRENT_YEAR):
-    for quarter in range(1, 5):
-        handle_quarter(year=str(year), quarter=str(quarter), s3_bucket=args['s3_bucket'], s3_prefix_dest=args['S3_prefix_dest'], source_url=args['source_url'])
-
-for quarter in range(1, date.today().month//3 + 2):
-    handle_quarter(year=str(CURRENT_YEAR), quarter=str(quarter), s3_bucket=args['s3_bucket'], s3_prefix_dest=args['S3_prefix_dest'], source_url=args['source_url'])
\ No newline at end of file
+# The current quarter is usually not published yet, it's not an error
+failures = {file_name: error for file_name, error in failures.items() if not is_unpublished_quarter(error)}
+if failures:
+    raise RuntimeError("Failed to collect the quarters {}".format(", ".join(sorted(failures))))
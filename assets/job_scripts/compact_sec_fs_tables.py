@@ -0,0 +1,33 @@
+"""
+This module compacts the fs_* tables into sorted files of about the target size, after the catchup rewrote them
+"""
+
+import json
+import sys
+from datetime import datetime, timezone
+import boto3
+from awsglue.utils import getResolvedOptions
+from pyspark.context import SparkContext
+from awsglue.context import GlueContext
+from awsglue.job import Job
+from sec_fs_dataset_transformer.compaction import COMMON_OPTIONS, compact_tables
+
+sc = SparkContext.getOrCreate()
+glueContext = GlueContext(sc)
+spark = glueContext.spark_session
+job = Job(glueContext)
+s3_client = boto3.Session().client("s3")
+
+# tables is the same JSON list as the one given to transform_sec_fs_datasets.py
+args = getResolvedOptions(sys.argv, COMMON_OPTIONS + ["tables", "max_concurrent_tables"])
+
+failures = compact_tables(
+    spark,
+    s3_client,
+    common_options={option: args[option] for option in COMMON_OPTIONS},
+    tables=json.loads(args["tables"]),
+    run_id=datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S"),
+    max_workers=int(args["max_concurrent_tables"])
+)
+if failures:
+    raise RuntimeError("Failed to compact the tables {}".format(", ".join(sorted(failures))))
@@ -5,11 +5,14 @@ This module is made to collect the latest available SEC Financial Statement data
 from datetime import date
 import sys
 from sec_fs_dataset_collector.collect_sec_fs_datasets import handle_quarter
+from sec_fs_metrics.metrics import Metrics, sink_from_uri
 from awsglue.utils import getResolvedOptions
 
-args = getResolvedOptions(sys.argv, ["source_url", "s3_bucket", "s3_prefix_dest", "year", "quarter"])
+args = getResolvedOptions(sys.argv, ["source_url", "s3_bucket", "s3_prefix_dest", "year", "quarter", "streaming", "s3_prefix_manifest", "output_format", "members", "ranged", "metrics_sink"])
+
+metrics = Metrics(sink_from_uri(args['metrics_sink']), job="collect")
 
 if not args.get("year") or not args.get("quarter"):
-    handle_quarter(year=str(date.today().year), quarter=str(date.today().month//3 + 1), s3_bucket=args['s3_bucket'], s3_prefix_dest=args['S3_prefix_dest'], source_url=args['source_url'])
+    handle_quarter(year=str(date.today().year), quarter=str(date.today().month//3 + 1), s3_bucket=args['s3_bucket'], s3_prefix_dest=args['s3_prefix_dest'], source_url=args['source_url'], streaming=args['streaming'] == "true", s3_prefix_manifest=args['s3_prefix_manifest'], output_format=args['output_format'], members=args['members'].split(","), ranged=args['ranged'] == "true", metrics=metrics)
 else:
-    handle_quarter(year=args["year"], quarter=args["quarter"], s3_bucket=args["s3_bucket"], s3_prefix_dest=args["s3_prefix_dest"], source_url=args["source_url"])
\ No newline at end of file
+    handle_quarter(year=args["year"], quarter=args["quarter"], s3_bucket=args["s3_bucket"], s3_prefix_dest=args["s3_prefix_dest"], source_url=args["source_url"], streaming=args["streaming"] == "true", s3_prefix_manifest=args["s3_prefix_manifest"], output_format=args["output_format"], members=args["members"].split(","), ranged=args["ranged"] == "true", metrics=metrics)
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""
+This module transforms several tables in a single Spark application, so that they share one cluster
+"""
+
+import json
+import sys
+import boto3
+from awsglue.utils import getResolvedOptions
+from pyspark.context import SparkContext
+from awsglue.context import GlueContext
+from awsglue.job import Job
+from sec_fs_dataset_transformer.transform import COMMON_OPTIONS, set_checkpoint_dir, transform_tables
+from sec_fs_metrics.metrics import Metrics, sink_from_uri
+
+sc = SparkContext.getOrCreate()
+glueContext = GlueContext(sc)
+spark = glueContext.spark_session
+job = Job(glueContext)
+s3_client = boto3.Session().client("s3")
+
+# tables is a JSON list with the table arguments of transform_sec_fs_dataset.py for each table
+args = getResolvedOptions(sys.argv, COMMON_OPTIONS + ["tables", "max_concurrent_tables", "TempDir"])
+set_checkpoint_dir(spark, args["TempDir"])
+
+failures = transform_tables(
+    spark,
+    s3_client,
+    common_options={option: args[option] for option in COMMON_OPTIONS},
+    tables=json.loads(args["tables"]),
+    max_workers=int(args["max_concurrent_tables"]),
+    metrics=Metrics(sink_from_uri(args["metrics_sink"]), job="transform")
+)
+if failures:
+    raise RuntimeError("Failed to transform the tables {}".format(", ".join(sorted(failures))))
@@ -1,27 +1,388 @@
+import contextlib
+import hashlib
+import io
+import os
 import requests
+import shutil
 import tempfile
+import traceback
 import zipfile
 import boto3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+from typing import Dict, Iterable, List, Tuple
+from sec_fs_dataset_collector.manifest import build_manifest, build_member_manifest, conditional_headers, download_info, is_not_modified, is_same_version, load_manifest, manifest_key, member_manifest_key, save_manifest
+from sec_fs_dataset_collector.parquet import IterableStream, convert_tsv_to_parquet
+from sec_fs_dataset_collector.rate_limit import RateLimiter, SEC_MAX_REQUESTS_PER_SECOND
+from sec_fs_dataset_collector.s3_upload import DEFAULT_PART_SIZE, S3MultipartUpload
+from sec_fs_dataset_collector.zip_ranges import RangeRequestsNotSupported, TAIL_SIZE, ZIP64_END_OF_CENTRAL_DIRECTORY_SIZE, content_range_total, fetch_range, find_central_directory, member_ranges, parse_central_directory, parse_zip64_end_of_central_directory
+from sec_fs_dataset_collector.zip_stream import BadZipStream, iter_zip_members
+from sec_fs_metrics.metrics import Metrics, Stage
 
-def fetch_zip_file(url: str, destination: str, file_name: str):
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+INITIAL_YEAR = 2009
+
+# Outcomes of handle_quarter
+COLLECTED = "collected"
+UNCHANGED = "unchanged"
+
+# Formats in which the members can be written to S3, parquet requires pyarrow
+OUTPUT_FORMATS = ("txt", "parquet")
+
+# Destination of the members of a quarterly archive, relative to s3_prefix_dest
+MEMBER_DESTINATIONS = {
+    "num.txt": "FS_NUM/{year}q{quarter}.txt",
+    "pre.txt": "FS_PRE/{year}q{quarter}.txt",
+    "sub.txt": "FS_SUB/{year}q{quarter}.txt",
+    "tag.txt": "FS_TAG/tag.txt", # This file is like a dimension table, it has to be overwritten
+}
+
+# Members written to the same key by every quarter, they are only uploaded when their content changed
+DEDUPLICATED_MEMBERS = ("tag.txt",)
+
+class HashingStream(io.RawIOBase):
+    """
+    Readable binary stream computing the sha256 of what is read from source, and counting its bytes and lines
+    """
+
+    def __init__(self, source):
+        self._source = source
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self.lines = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = self._source.readinto(buffer)
+        data = memoryview(buffer)[:size]
+        self._digest.update(data)
+        self.size += size
+        self.lines += data.tobytes().count(b"\n")
+        return size
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, mode="rb") as file:
+        for chunk in iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def member_destination(member_name: str, year: str, quarter: str, s3_prefix_dest: str, output_format: str = "txt"):
+    destination = MEMBER_DESTINATIONS.get(member_name)
+    if destination is None:
+        return None
+    if output_format != "txt":
+        destination = destination[:-len(".txt")]+"."+output_format
+    return s3_prefix_dest+destination.format(year=year, quarter=quarter)
+
+def upload_member(source, s3_client, s3_bucket: str, key: str, output_format: str = "txt", part_size: int = DEFAULT_PART_SIZE, unchanged_sha256: str = None, stage: Stage = None) -> str:
+    """
+    Upload the member read from source (a readable binary stream) to S3 in the given output format, and return its sha256.
+    When unchanged_sha256 is given, the member is first written to a temporary file while its sha256 is computed,
+    and nothing is sent to S3 if it equals unchanged_sha256, key being left as it was.
+    The uncompressed bytes and the rows of the member are recorded in stage if given.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("Unknown output format {}, expected one of {}".format(output_format, OUTPUT_FORMATS))
+    source = HashingStream(source)
+    with tempfile.TemporaryFile() if unchanged_sha256 is not None else contextlib.nullcontext() as spool:
+        if spool is not None:
+            shutil.copyfileobj(source, spool, DOWNLOAD_CHUNK_SIZE)
+            spool.seek(0)
+        if spool is None or source.hexdigest() != unchanged_sha256:
+            member = source if spool is None else spool
+            with S3MultipartUpload(s3_client, s3_bucket, key, part_size=part_size) as upload:
+                if output_format == "parquet":
+                    convert_tsv_to_parquet(member, upload)
+                else:
+                    for chunk in iter(lambda: member.read(DOWNLOAD_CHUNK_SIZE), b""):
+                        upload.write(chunk)
+    if stage is not None:
+        # Without the header line
+        stage.bytes, stage.rows = source.size, max(source.lines - 1, 0)
+    return source.hexdigest()
+
+def quarters_since(initial_year: int = INITIAL_YEAR, today: date = None) -> List[Tuple[str, str]]:
+    """
+    Return the (year, quarter) of every quarter from Q1 of initial_year up to the current one
+    """
+    today = today or date.today()
+    current_quarter = (today.month - 1)//3 + 1
+    return [
+        (str(year), str(quarter))
+        for year in range(initial_year, today.year + 1)
+        for quarter in range(1, 5)
+        if year < today.year or quarter <= current_quarter
+    ]
+
+def is_unpublished_quarter(error: Exception) -> bool:
+    """
+    Whether the error comes from a quarter whose dataset hasn't been published by the SEC yet
+    """
+    return isinstance(error, requests.HTTPError) and error.response is not None and error.response.status_code == 404
+
+def is_published_quarter(url: str, rate_limiter: RateLimiter = None) -> bool:
+    """
+    Whether the archive at url has been published by the SEC, from a HEAD request which downloads nothing
+    """
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    return requests.head(url, allow_redirects=True).status_code != 404
+
+def fetch_zip_file(url: str, destination: str, file_name: str, rate_limiter: RateLimiter = None, manifest: dict = None):
+    """
+    Download the archive unless the manifest shows it hasn't changed, and return its download info (None if unchanged)
+    """
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    response = requests.get(url, allow_redirects=True, headers=conditional_headers(manifest) if manifest else None)
+    if is_not_modified(response, manifest):
+        return None
+    response.raise_for_status()
+    sha256 = hashlib.sha256(response.content).hexdigest()
+    if manifest is not None and manifest.get("sha256") == sha256:
+        return None
     with open(destination+file_name, mode="wb") as file:
-        response = requests.get(url, allow_redirects=True)
         file.write(response.content)
+    return download_info(response, size=len(response.content), sha256=sha256)
 
 def decompress_zip_file(file_path: str, destination: str):
     with zipfile.ZipFile(file_path, mode="r") as archive:
         archive.extractall(destination)
 
-def handle_quarter(year: str, quarter: str, s3_bucket: str, s3_prefix_dest: str, source_url: str):
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        file_name = "{}q{}.zip".format(year, quarter)
-        file_destination = tmp_dir+"/"
-        fetch_zip_file(url=source_url+file_name, destination=file_destination, file_name=file_name)
-        uncompressed_dest = file_destination+"uncompressed_files/"
-        decompress_zip_file(file_path=file_destination+file_name, destination=uncompressed_dest)
-        s3_client = boto3.Session().client('s3')
-        s3_client.upload_file(uncompressed_dest+"num.txt", s3_bucket, s3_prefix_dest+"FS_NUM/{}q{}.txt".format(year, quarter))
-        s3_client.upload_file(uncompressed_dest+"pre.txt", s3_bucket, s3_prefix_dest+"FS_PRE/{}q{}.txt".format(year, quarter))
-        s3_client.upload_file(uncompressed_dest+"sub.txt", s3_bucket, s3_prefix_dest+"FS_SUB/{}q{}.txt".format(year, quarter))
-        s3_client.upload_file(uncompressed_dest+"tag.txt", s3_bucket, s3_prefix_dest+"FS_TAG/tag.txt") # This file is like a dimension table, it has to be overwritten
+def stream_zip_file_to_s3(url: str, year: str, quarter: str, s3_client, s3_bucket: str, s3_prefix_dest: str, members: Iterable[str] = MEMBER_DESTINATIONS, part_size: int = DEFAULT_PART_SIZE, rate_limiter: RateLimiter = None, manifest: dict = None, output_format: str = "txt", unchanged_members: Dict[str, str] = None, metrics: Metrics = None):
+    """
+    Download the archive by chunks and upload each of its members to S3 while it is being decompressed.
+    Nothing is written on the local disk, and the memory used is bounded by a few part sizes.
+    Members whose sha256 is the one given in unchanged_members (member name -> sha256) are left as they were on S3.
+    Return the download info of the archive, or None if the manifest shows it hasn't changed.
+    Each member is measured as a "member" stage, which includes its download and decompression.
+    """
+    metrics = metrics or Metrics()
+    unchanged_members = unchanged_members or {}
+    members = set(members)
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    with requests.get(url, allow_redirects=True, stream=True, headers=conditional_headers(manifest) if manifest else None) as response:
+        if is_not_modified(response, manifest):
+            return None
+        response.raise_for_status()
+        digest = hashlib.sha256()
+        size = 0
+        def hashed_chunks():
+            nonlocal size
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+                yield chunk
+        member_sha256 = {}
+        for member_name, data in iter_zip_members(hashed_chunks()):
+            if member_name in members:
+                key = member_destination(member_name, year, quarter, s3_prefix_dest, output_format)
+                with metrics.stage("member", member=member_name) as stage:
+                    member_sha256[member_name] = upload_member(IterableStream(data), s3_client, s3_bucket, key, output_format=output_format, part_size=part_size, unchanged_sha256=unchanged_members.get(member_name), stage=stage)
+        return download_info(response, size=size, sha256=digest.hexdigest(), member_sha256=member_sha256)
+
+def range_zip_file_to_s3(url: str, year: str, quarter: str, s3_client, s3_bucket: str, s3_prefix_dest: str, members: Iterable[str] = MEMBER_DESTINATIONS, part_size: int = DEFAULT_PART_SIZE, rate_limiter: RateLimiter = None, manifest: dict = None, output_format: str = "txt", unchanged_members: Dict[str, str] = None, metrics: Metrics = None):
+    """
+    Read the central directory of the archive with HTTP Range requests, then download and upload only the members,
+    like stream_zip_file_to_s3 does. The download info has no sha256 since the archive isn't downloaded as a whole.
+    The request of the last bytes of the archive is measured as a "tail" stage, and each member as a "member" stage.
+    Raise RangeRequestsNotSupported if the server doesn't answer with partial content.
+    """
+    metrics = metrics or Metrics()
+    members = set(members)
+    unchanged_members = unchanged_members or {}
+
+    with metrics.stage("tail") as tail_stage, fetch_range(url, -TAIL_SIZE, headers=conditional_headers(manifest) if manifest else None, rate_limiter=rate_limiter) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise RangeRequestsNotSupported("{} doesn't support range requests".format(url))
+        size = content_range_total(response)
+        # Like the If-Range header below, Last-Modified stands in for the ETag when the server has no strong one
+        if is_same_version(response.headers.get("ETag"), response.headers.get("Last-Modified"), size, manifest):
+            return None
+        tail = response.content
+        tail_response = response
+        tail_stage.bytes = len(tail)
+
+    # The following requests only succeed if the archive is still the one whose central directory was read
+    etag = tail_response.headers.get("ETag")
+    if_range = {"If-Range": etag if etag and not etag.startswith("W/") else tail_response.headers.get("Last-Modified")}
+    def fetch_bytes(start, end):
+        with fetch_range(url, start, end, headers=if_range, rate_limiter=rate_limiter) as response:
+            if response.status_code != 206:
+                raise BadZipStream("{} changed while it was being read".format(url))
+            return response.content
+
+    tail_offset = size - len(tail)
+    central_directory_offset, central_directory_size, zip64_end_offset = find_central_directory(tail, tail_offset)
+    if zip64_end_offset is not None:
+        if zip64_end_offset >= tail_offset:
+            record = tail[zip64_end_offset - tail_offset:zip64_end_offset - tail_offset + ZIP64_END_OF_CENTRAL_DIRECTORY_SIZE]
+        else:
+            record = fetch_bytes(zip64_end_offset, zip64_end_offset + ZIP64_END_OF_CENTRAL_DIRECTORY_SIZE - 1)
+        central_directory_offset, central_directory_size = parse_zip64_end_of_central_directory(record)
+    if central_directory_offset >= tail_offset:
+        central_directory = tail[central_directory_offset - tail_offset:central_directory_offset - tail_offset + central_directory_size]
+    else:
+        central_directory = fetch_bytes(central_directory_offset, central_directory_offset + central_directory_size - 1)
+    entries = parse_central_directory(central_directory)
+
+    member_sha256 = {}
+    for member_range in member_ranges(entries, members, central_directory_offset):
+        names = {entry.name for entry in member_range.entries}
+        with fetch_range(url, member_range.start, member_range.end, headers=if_range, rate_limiter=rate_limiter, stream=True) as response:
+            if response.status_code != 206:
+                raise BadZipStream("{} changed while it was being read".format(url))
+            for member_name, data in iter_zip_members(response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)):
+                if member_name not in names:
+                    # Skipped bytes between two members of the range
+                    continue
+                key = member_destination(member_name, year, quarter, s3_prefix_dest, output_format)
+                with metrics.stage("member", member=member_name) as stage:
+                    member_sha256[member_name] = upload_member(IterableStream(data), s3_client, s3_bucket, key, output_format=output_format, part_size=part_size, unchanged_sha256=unchanged_members.get(member_name), stage=stage)
+                names.remove(member_name)
+                if not names:
+                    # The range ends with the last member, there's no following record to read
+                    break
+    return download_info(tail_response, size=size, sha256=None, member_sha256=member_sha256)
+
+def handle_quarter(year: str, quarter: str, s3_bucket: str, s3_prefix_dest: str, source_url: str, streaming: bool = False, members: Iterable[str] = MEMBER_DESTINATIONS, part_size: int = DEFAULT_PART_SIZE, rate_limiter: RateLimiter = None, s3_prefix_manifest: str = None, force: bool = False, output_format: str = "txt", ranged: bool = False, metrics: Metrics = None) -> str:
+    """
+    Collect the members of a quarterly archive into s3_prefix_dest, and return COLLECTED or UNCHANGED.
+    When s3_prefix_manifest is given, the quarter is skipped if its archive hasn't changed since the members
+    were last collected, unless force is set.
+    When ranged is set, only the bytes of the members are downloaded, with HTTP Range requests. The whole
+    archive is streamed instead if the server doesn't support them.
+    The quarter is measured as a "quarter" stage in metrics, along with the stages of its download.
+    """
+    file_name = "{}q{}.zip".format(year, quarter)
+    metrics = (metrics or Metrics()).with_labels(quarter="{}q{}".format(year, quarter))
+    with metrics.stage("quarter") as quarter_stage:
+        members = list(members)
+        s3_client = metrics.instrument(boto3.Session().client('s3'))
+
+        manifest = None
+        if s3_prefix_manifest:
+            manifest = load_manifest(s3_client, s3_bucket, manifest_key(s3_prefix_manifest, year, quarter))
+        # The manifest can only be trusted for members it has already collected, in the same format
+        known_manifest = manifest
+        if manifest is None or force or manifest.get("output_format", "txt") != output_format or not set(members) <= set(manifest.get("members", [])):
+            known_manifest = None
+
+        # The members written to the same key by every quarter are compared with the content they had when they were last uploaded
+        unchanged_members = {}
+        if s3_prefix_manifest and not force:
+            for member_name in set(members) & set(DEDUPLICATED_MEMBERS):
+                member_manifest = load_manifest(s3_client, s3_bucket, member_manifest_key(s3_prefix_manifest, member_name))
+                if member_manifest is not None and member_manifest.get("output_format", "txt") == output_format:
+                    unchanged_members[member_name] = member_manifest["sha256"]
+
+        if ranged:
+            try:
+                download = range_zip_file_to_s3(url=source_url+file_name, year=year, quarter=quarter, s3_client=s3_client, s3_bucket=s3_bucket, s3_prefix_dest=s3_prefix_dest, members=members, part_size=part_size, rate_limiter=rate_limiter, manifest=known_manifest, output_format=output_format, unchanged_members=unchanged_members, metrics=metrics)
+            except RangeRequestsNotSupported as error:
+                print("{}, streaming the whole archive instead".format(error))
+                ranged, streaming = False, True
+        if not ranged and streaming:
+            download = stream_zip_file_to_s3(url=source_url+file_name, year=year, quarter=quarter, s3_client=s3_client, s3_bucket=s3_bucket, s3_prefix_dest=s3_prefix_dest, members=members, part_size=part_size, rate_limiter=rate_limiter, manifest=known_manifest, output_format=output_format, unchanged_members=unchanged_members, metrics=metrics)
+        elif not ranged:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                file_destination = tmp_dir+"/"
+                with metrics.stage("download") as stage:
+                    download = fetch_zip_file(url=source_url+file_name, destination=file_destination, file_name=file_name, rate_limiter=rate_limiter, manifest=known_manifest)
+                    stage.bytes = download["size"] if download is not None else 0
+                if download is not None:
+                    uncompressed_dest = file_destination+"uncompressed_files/"
+                    with metrics.stage("decompress") as stage:
+                        decompress_zip_file(file_path=file_destination+file_name, destination=uncompressed_dest)
+                        stage.bytes = download["size"]
+                    download["member_sha256"] = {}
+                    for member_name in members:
+                        key = member_destination(member_name, year, quarter, s3_prefix_dest, output_format)
+                        with metrics.stage("member", member=member_name) as stage:
+                            sha256 = file_sha256(uncompressed_dest+member_name)
+                            download["member_sha256"][member_name] = sha256
+                            stage.bytes = os.path.getsize(uncompressed_dest+member_name)
+                            if sha256 == unchanged_members.get(member_name):
+                                continue
+                            if output_format == "txt":
+                                s3_client.upload_file(uncompressed_dest+member_name, s3_bucket, key)
+                            else:
+                                with open(uncompressed_dest+member_name, mode="rb") as source:
+                                    upload_member(source, s3_client, s3_bucket, key, output_format=output_format, part_size=part_size, stage=stage)
+        if download is None:
+            return UNCHANGED
+        # The size of the whole archive, even when only the bytes of its members were downloaded
+        quarter_stage.bytes = download["size"]
+
+        if s3_prefix_manifest:
+            for member_name in set(download["member_sha256"]) & set(DEDUPLICATED_MEMBERS):
+                sha256 = download["member_sha256"][member_name]
+                if sha256 == unchanged_members.get(member_name):
+                    print("Skipped the upload of {} from {}, unchanged since it was last uploaded".format(member_name, file_name))
+                else:
+                    save_manifest(s3_client, s3_bucket, member_manifest_key(s3_prefix_manifest, member_name), build_member_manifest(member_name, file_name, member_destination(member_name, year, quarter, s3_prefix_dest, output_format), sha256, output_format))
+            save_manifest(s3_client, s3_bucket, manifest_key(s3_prefix_manifest, year, quarter), build_manifest(file_name, source_url+file_name, download, members, output_format, previous=manifest))
+        return COLLECTED
+
+def handle_quarters(quarters: Iterable[Tuple[str, str]], s3_bucket: str, s3_prefix_dest: str, source_url: str, streaming: bool = False, max_workers: int = 4, max_requests_per_second: float = SEC_MAX_REQUESTS_PER_SECOND, s3_prefix_manifest: str = None, force: bool = False, output_format: str = "txt", members: Iterable[str] = MEMBER_DESTINATIONS, ranged: bool = False, metrics: Metrics = None) -> Dict[str, Exception]:
+    """
+    Collect several quarters with up to max_workers of them in flight, so that downloads overlap with uploads.
+    Every request to the SEC goes through a single rate limiter. A failing quarter doesn't stop the others,
+    the errors are returned by quarter file name (e.g. 2009q1) once every quarter has been handled.
+    tag.txt is collected from the latest quarter published, along with its other members. If that quarter fails,
+    tag.txt is only fetched from the latest quarter collected when ranged is set, since only its bytes are downloaded again.
+    """
+    quarters = sorted(quarters, key=lambda x: (int(x[0]), int(x[1])))
+    rate_limiter = RateLimiter(max_requests_per_second)
+    # tag.txt is overwritten by each quarter, only the latest quarter published collects it so that it wins.
+    # The current quarter is usually not published yet.
+    collect_tag = "tag.txt" in members
+    members = [member_name for member_name in members if member_name != "tag.txt"]
+    tag_quarter = None
+    if collect_tag:
+        tag_quarter = next((
+            "{}q{}".format(year, quarter)
+            for year, quarter in reversed(quarters)
+            if is_published_quarter(source_url+"{}q{}.zip".format(year, quarter), rate_limiter)
+        ), None)
+    def quarter_members(year, quarter):
+        return members+["tag.txt"] if "{}q{}".format(year, quarter) == tag_quarter else members
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(handle_quarter, year=year, quarter=quarter, s3_bucket=s3_bucket, s3_prefix_dest=s3_prefix_dest, source_url=source_url, streaming=streaming, members=quarter_members(year, quarter), rate_limiter=rate_limiter, s3_prefix_manifest=s3_prefix_manifest, force=force, output_format=output_format, ranged=ranged, metrics=metrics): "{}q{}".format(year, quarter)
+            for year, quarter in quarters
+            if quarter_members(year, quarter)
+        }
+        for future in as_completed(futures):
+            error = future.exception()
+            if error is not None:
+                failures[futures[future]] = error
+                print("Failed to collect {}:\n{}".format(futures[future], "".join(traceback.format_exception(type(error), error, error.__traceback__))))
+            elif future.result() == UNCHANGED:
+                print("Skipped {}, unchanged since it was last collected".format(futures[future]))
+            else:
+                print("Collected {}".format(futures[future]))
 
+    collected = [(year, quarter) for year, quarter in quarters if "{}q{}".format(year, quarter) not in failures]
+    if tag_quarter in failures and collected:
+        year, quarter = collected[-1]
+        if ranged:
+            # Only the bytes of tag.txt are downloaded again
+            try:
+                handle_quarter(year=year, quarter=quarter, s3_bucket=s3_bucket, s3_prefix_dest=s3_prefix_dest, source_url=source_url, streaming=streaming, members=["tag.txt"], rate_limiter=rate_limiter, s3_prefix_manifest=s3_prefix_manifest, force=force, output_format=output_format, ranged=ranged, metrics=metrics)
+            except Exception as error:
+                failures["{}q{}".format(year, quarter)] = error
+        else:
+            print("Left tag.txt as it was since {} failed, fetching it alone would download the whole archive of {}q{} again".format(tag_quarter, year, quarter))
+    return failures
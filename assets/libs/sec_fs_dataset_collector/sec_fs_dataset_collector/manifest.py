@@ -0,0 +1,117 @@
+"""
+This module keeps a manifest per collected quarter, describing the archive downloaded from the SEC.
+
+The manifests are used to send conditional requests, so that a quarter whose archive hasn't changed
+since it was last collected is neither downloaded nor uploaded again. Members written to the same key by
+every quarter (tag.txt) have a manifest of their own, so that they are only uploaded when their content changed.
+"""
+
+import json
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+from botocore.exceptions import ClientError
+
+
+def manifest_key(s3_prefix_manifest: str, year: str, quarter: str) -> str:
+    return s3_prefix_manifest+"{}q{}.json".format(year, quarter)
+
+
+def member_manifest_key(s3_prefix_manifest: str, member_name: str) -> str:
+    return s3_prefix_manifest+"MEMBERS/{}.json".format(member_name)
+
+
+def load_manifest(s3_client, s3_bucket: str, key: str) -> Optional[dict]:
+    try:
+        response = s3_client.get_object(Bucket=s3_bucket, Key=key)
+    except ClientError as error:
+        if error.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise
+    return json.loads(response["Body"].read())
+
+
+def save_manifest(s3_client, s3_bucket: str, key: str, manifest: dict):
+    s3_client.put_object(Bucket=s3_bucket, Key=key, Body=json.dumps(manifest, indent=2).encode("utf-8"), ContentType="application/json")
+
+
+def conditional_headers(manifest: dict) -> dict:
+    headers = {}
+    if manifest.get("etag"):
+        headers["If-None-Match"] = manifest["etag"]
+    if manifest.get("last_modified"):
+        headers["If-Modified-Since"] = manifest["last_modified"]
+    return headers
+
+
+def is_same_version(etag: Optional[str], last_modified: Optional[str], size: Optional[int], manifest: Optional[dict]) -> bool:
+    """
+    Whether the archive with these headers is the one described by the manifest: same size, and same ETag, or same
+    Last-Modified date when the server doesn't send a strong ETag
+    """
+    if manifest is None or size is None or size != manifest.get("size"):
+        return False
+    if etag and not etag.startswith("W/") and manifest.get("etag"):
+        return etag == manifest["etag"]
+    return bool(last_modified) and last_modified == manifest.get("last_modified")
+
+
+def is_not_modified(response, manifest: Optional[dict]) -> bool:
+    """
+    Whether the response shows that the archive described by the manifest hasn't changed.
+    Servers are free to ignore conditional headers, so the ETag (or Last-Modified) and size are compared as well.
+    """
+    if response.status_code == 304:
+        return True
+    size = response.headers.get("Content-Length")
+    return is_same_version(response.headers.get("ETag"), response.headers.get("Last-Modified"), int(size) if size else None, manifest)
+
+
+def download_info(response, size: int, sha256: str, member_sha256: Optional[dict] = None) -> dict:
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "size": size,
+        "sha256": sha256,
+        "member_sha256": member_sha256 or {},
+    }
+
+
+def is_same_archive(manifest: dict, download: dict) -> bool:
+    """
+    Compare the archives by sha256, or by their headers and size when one of them was read with range requests
+    """
+    if manifest.get("sha256") and download.get("sha256"):
+        return manifest["sha256"] == download["sha256"]
+    return is_same_version(download.get("etag"), download.get("last_modified"), download.get("size"), manifest)
+
+
+def build_manifest(file_name: str, url: str, download: dict, members: Iterable[str], output_format: str = "txt", previous: Optional[dict] = None) -> dict:
+    members = set(members)
+    member_sha256 = download.get("member_sha256", {})
+    if previous is not None and is_same_archive(previous, download) and previous.get("output_format", "txt") == output_format:
+        # Same archive, the members collected before are still up to date
+        members |= set(previous.get("members", []))
+        member_sha256 = {**previous.get("member_sha256", {}), **member_sha256}
+    return {
+        "file_name": file_name,
+        "url": url,
+        **download,
+        "member_sha256": member_sha256,
+        "members": sorted(members),
+        "output_format": output_format,
+        "collected_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def build_member_manifest(member_name: str, file_name: str, key: str, sha256: str, output_format: str = "txt") -> dict:
+    """
+    Describe the last upload of a member written to the same key by every quarter, e.g. tag.txt
+    """
+    return {
+        "member_name": member_name,
+        "file_name": file_name,
+        "key": key,
+        "sha256": sha256,
+        "output_format": output_format,
+        "uploaded_at": datetime.now(timezone.utc).isoformat(),
+    }
@@ -0,0 +1,108 @@
+"""
+This module converts the tab-separated members of a quarterly archive to Parquet.
+
+The conversion reads fixed-size record batches with PyArrow's streaming CSV reader, so a member is never
+held in memory as a whole. PyArrow is only required when the parquet output format is used.
+"""
+
+import io
+from typing import Iterable, Iterator, List
+
+DEFAULT_COMPRESSION = "zstd"
+# Each batch is held decoded next to the row group being written, within the 1 GB of the Python shell job
+DEFAULT_BATCH_SIZE = 16 * 1024 * 1024
+# Characters of a skipped row printed in the logs
+INVALID_ROW_LOG_LENGTH = 200
+
+
+class IterableStream(io.RawIOBase):
+    """
+    Readable binary stream over an iterable of byte chunks
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = chunk
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def read_header(stream: io.BufferedIOBase) -> List[str]:
+    return stream.readline().decode("utf-8").rstrip("\r\n").split("\t")
+
+
+def string_schema(column_names: List[str]):
+    """
+    Every column is a nullable string, like the transform job reads them with Spark's CSV reader
+    """
+    import pyarrow as pa
+
+    return pa.schema([(column_name, pa.string()) for column_name in column_names])
+
+
+def skip_invalid_row(invalid_rows: List[str] = None):
+    """
+    Handler of the rows which don't have as many columns as the header: the row is printed, appended to invalid_rows
+    if given, and skipped instead of failing the conversion
+    """
+    def handler(row) -> str:
+        print("Skipped the row {} with {} columns instead of {}: {}".format(
+            "?" if row.number is None else row.number, row.actual_columns, row.expected_columns, row.text[:INVALID_ROW_LOG_LENGTH]
+        ))
+        if invalid_rows is not None:
+            invalid_rows.append(row.text)
+        return "skip"
+    return handler
+
+
+def iter_tsv_batches(stream: io.BufferedIOBase, schema, batch_size: int = DEFAULT_BATCH_SIZE, invalid_rows: List[str] = None) -> Iterator:
+    """
+    Yield record batches of about batch_size bytes from the tab-separated rows left in stream, once its header is read.
+    The invalid rows are skipped (see skip_invalid_row).
+    """
+    from pyarrow import csv
+
+    if not stream.peek(1):
+        # The file only has a header
+        return
+    yield from csv.open_csv(
+        stream,
+        read_options=csv.ReadOptions(column_names=schema.names, block_size=batch_size),
+        # The SEC files aren't quoted, quotes are part of the values
+        parse_options=csv.ParseOptions(delimiter="\t", quote_char=False, invalid_row_handler=skip_invalid_row(invalid_rows)),
+        convert_options=csv.ConvertOptions(
+            column_types={field.name: field.type for field in schema},
+            null_values=[""],
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def convert_tsv_to_parquet(source, sink, compression: str = DEFAULT_COMPRESSION, batch_size: int = DEFAULT_BATCH_SIZE, invalid_rows: List[str] = None) -> int:
+    """
+    Convert the tab-separated file read from source (a readable binary stream) to Parquet written to sink,
+    one row group per record batch of about batch_size bytes. Return the number of rows written.
+    The invalid rows are skipped, and appended to invalid_rows if given.
+    """
+    import pyarrow.parquet as pq
+
+    stream = source if isinstance(source, io.BufferedReader) else io.BufferedReader(source)
+    schema = string_schema(read_header(stream))
+    rows = 0
+    with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+        for batch in iter_tsv_batches(stream, schema, batch_size, invalid_rows):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
@@ -0,0 +1,30 @@
+"""
+This module throttles the requests sent to the SEC website, which are shared by every collecting thread.
+"""
+
+import threading
+import time
+
+# SEC's fair access policy: https://www.sec.gov/os/accessing-edgar-data
+SEC_MAX_REQUESTS_PER_SECOND = 10
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter spacing out calls to acquire() so that at most max_per_second of them return each second
+    """
+
+    def __init__(self, max_per_second: float = SEC_MAX_REQUESTS_PER_SECOND):
+        if max_per_second <= 0:
+            raise ValueError("max_per_second must be positive")
+        self.interval = 1.0 / max_per_second
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
@@ -0,0 +1,151 @@
+"""
+This module locates the members of a remote ZIP archive so that they can be fetched with HTTP Range requests.
+
+The central directory, at the end of the archive, gives the offset of every member. Reading it only
+requires the last bytes of the archive, after which the members can be downloaded without the rest.
+"""
+
+import re
+import struct
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import requests
+
+from sec_fs_dataset_collector.rate_limit import RateLimiter
+from sec_fs_dataset_collector.zip_stream import BadZipStream, CENTRAL_DIRECTORY_SIGNATURE, END_OF_CENTRAL_DIRECTORY_SIGNATURE, FLAG_UTF8_NAME, ZIP64_EXTRA_FIELD_ID, ZIP64_SIZE_MARKER
+
+ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"PK\x06\x06"
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE = b"PK\x06\x07"
+
+END_OF_CENTRAL_DIRECTORY_SIZE = 22
+ZIP64_END_OF_CENTRAL_DIRECTORY_SIZE = 56
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIZE = 20
+CENTRAL_DIRECTORY_ENTRY_SIZE = 46
+# The end of central directory record is followed by a comment of up to 65535 bytes
+TAIL_SIZE = END_OF_CENTRAL_DIRECTORY_SIZE + 0xFFFF + ZIP64_END_OF_CENTRAL_DIRECTORY_SIZE + ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIZE
+# Members separated by fewer bytes than this are fetched with a single request, the bytes in between are skipped
+RANGE_MERGE_GAP = 1024 * 1024
+
+
+class RangeRequestsNotSupported(Exception):
+    pass
+
+
+class ZipEntry(NamedTuple):
+    name: str
+    offset: int
+    compressed_size: int
+    size: int
+
+
+class MemberRange(NamedTuple):
+    """
+    Bytes start to end (inclusive) of the archive, holding the local headers and data of entries
+    """
+    start: int
+    end: int
+    entries: List[ZipEntry]
+
+
+def fetch_range(url: str, start: int, end: Optional[int] = None, headers: dict = None, rate_limiter: RateLimiter = None, stream: bool = False) -> requests.Response:
+    """
+    Request the bytes start to end (inclusive) of url, or its last -start bytes when start is negative
+    """
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    byte_range = "bytes={}".format(start) if start < 0 else "bytes={}-{}".format(start, end)
+    return requests.get(url, allow_redirects=True, stream=stream, headers={**(headers or {}), "Range": byte_range})
+
+
+def content_range_total(response: requests.Response) -> int:
+    """
+    Size of the whole resource, from the Content-Range header of a 206 response (e.g. bytes 0-99/1234)
+    """
+    match = re.match(r"bytes \d+-\d+/(\d+)", response.headers.get("Content-Range", ""))
+    if match is None:
+        raise RangeRequestsNotSupported("Invalid Content-Range {!r}".format(response.headers.get("Content-Range")))
+    return int(match.group(1))
+
+
+def find_central_directory(tail: bytes, tail_offset: int) -> Tuple[int, int, Optional[int]]:
+    """
+    Return (offset, size, zip64_end_offset) of the central directory from the last bytes of the archive,
+    which start at tail_offset. zip64_end_offset is the offset of the ZIP64 end of central directory
+    record when the archive has one, its values then replace the ones returned.
+    """
+    position = tail.rfind(END_OF_CENTRAL_DIRECTORY_SIGNATURE)
+    if position < 0 or position + END_OF_CENTRAL_DIRECTORY_SIZE > len(tail):
+        raise BadZipStream("End of central directory not found")
+    _disk, _cd_disk, _disk_entries, _entries, size, offset, _comment_length = \
+        struct.unpack("<HHHHIIH", tail[position + 4:position + END_OF_CENTRAL_DIRECTORY_SIZE])
+
+    zip64_end_offset = None
+    locator_position = position - ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIZE
+    if locator_position >= 0 and tail[locator_position:locator_position + 4] == ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE:
+        _disk, zip64_end_offset, _disks = struct.unpack("<IQI", tail[locator_position + 4:position])
+    elif offset + size > tail_offset + position:
+        raise BadZipStream("Invalid central directory offset {}".format(offset))
+    return offset, size, zip64_end_offset
+
+
+def parse_zip64_end_of_central_directory(record: bytes) -> Tuple[int, int]:
+    """
+    Return (offset, size) of the central directory from the ZIP64 end of central directory record
+    """
+    if record[:4] != ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE:
+        raise BadZipStream("ZIP64 end of central directory not found")
+    size, offset = struct.unpack("<QQ", record[40:56])
+    return offset, size
+
+
+def parse_central_directory(data: bytes) -> List[ZipEntry]:
+    entries = []
+    position = 0
+    while position + CENTRAL_DIRECTORY_ENTRY_SIZE <= len(data) and data[position:position + 4] == CENTRAL_DIRECTORY_SIGNATURE:
+        _made_by, _version, flags, _method, _time, _date, _crc, compressed_size, size, name_length, extra_length, comment_length, \
+            _disk, _internal_attributes, _external_attributes, offset = struct.unpack("<HHHHHHIIIHHHHHII", data[position + 4:position + CENTRAL_DIRECTORY_ENTRY_SIZE])
+        name_start = position + CENTRAL_DIRECTORY_ENTRY_SIZE
+        name = data[name_start:name_start + name_length].decode("utf-8" if flags & FLAG_UTF8_NAME else "cp437")
+        extra = data[name_start + name_length:name_start + name_length + extra_length]
+        size, compressed_size, offset = _parse_zip64_fields(extra, size, compressed_size, offset)
+        entries.append(ZipEntry(name, offset, compressed_size, size))
+        position = name_start + name_length + extra_length + comment_length
+    return entries
+
+
+def _parse_zip64_fields(extra: bytes, size: int, compressed_size: int, offset: int) -> Tuple[int, int, int]:
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, field_length = struct.unpack("<HH", extra[position:position + 4])
+        field = extra[position + 4:position + 4 + field_length]
+        if field_id == ZIP64_EXTRA_FIELD_ID:
+            # Only the values set to 0xFFFFFFFF in the entry are present, in this order
+            values = iter(struct.unpack("<{}Q".format(len(field) // 8), field[:len(field) // 8 * 8]))
+            if size == ZIP64_SIZE_MARKER:
+                size = next(values)
+            if compressed_size == ZIP64_SIZE_MARKER:
+                compressed_size = next(values)
+            if offset == ZIP64_SIZE_MARKER:
+                offset = next(values)
+            break
+        position += 4 + field_length
+    return size, compressed_size, offset
+
+
+def member_ranges(entries: List[ZipEntry], members: Iterable[str], central_directory_offset: int, merge_gap: int = RANGE_MERGE_GAP) -> List[MemberRange]:
+    """
+    Return the byte ranges holding the members, each spanning from the local header of a member to the next record.
+    Members close to each other share a range, so that they are fetched with a single request.
+    """
+    entries = sorted(entries, key=lambda entry: entry.offset)
+    ends = [entry.offset - 1 for entry in entries[1:]] + [central_directory_offset - 1]
+    members = set(members)
+    ranges = []
+    for entry, end in zip(entries, ends):
+        if entry.name not in members:
+            continue
+        if ranges and entry.offset - ranges[-1].end - 1 < merge_gap:
+            ranges[-1] = MemberRange(ranges[-1].start, end, ranges[-1].entries + [entry])
+        else:
+            ranges.append(MemberRange(entry.offset, end, [entry]))
+    return ranges
@@ -0,0 +1,180 @@
+"""
+This module reads ZIP archives sequentially from a stream of bytes.
+
+Members are parsed from their local file headers, in the order they are stored, so the archive
+never has to be held in memory nor written to disk before being decompressed.
+"""
+
+import struct
+import zlib
+from typing import Iterable, Iterator, Tuple
+
+LOCAL_FILE_HEADER_SIGNATURE = b"PK\x03\x04"
+CENTRAL_DIRECTORY_SIGNATURE = b"PK\x01\x02"
+END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"PK\x05\x06"
+DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+
+ZIP64_EXTRA_FIELD_ID = 0x0001
+ZIP64_SIZE_MARKER = 0xFFFFFFFF
+
+FLAG_ENCRYPTED = 0x0001
+FLAG_DATA_DESCRIPTOR = 0x0008
+FLAG_UTF8_NAME = 0x0800
+
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+READ_CHUNK_SIZE = 1024 * 1024
+DECOMPRESSED_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class BadZipStream(Exception):
+    pass
+
+
+class ChunkReader:
+    """
+    Buffer over an iterable of byte chunks, allowing exact reads and pushing back unused bytes
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self.bytes_read = 0
+
+    def read_chunk(self, max_size: int) -> bytes:
+        """
+        Return at most max_size bytes, or b"" once the stream is exhausted
+        """
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b""
+            self._buffer = chunk
+        data, self._buffer = self._buffer[:max_size], self._buffer[max_size:]
+        self.bytes_read += len(data)
+        return data
+
+    def read_exactly(self, size: int) -> bytes:
+        parts = []
+        remaining = size
+        while remaining:
+            data = self.read_chunk(remaining)
+            if not data:
+                raise BadZipStream("Unexpected end of stream, {} bytes missing".format(remaining))
+            parts.append(data)
+            remaining -= len(data)
+        return b"".join(parts)
+
+    def unread(self, data: bytes):
+        if data:
+            self._buffer = data + self._buffer
+            self.bytes_read -= len(data)
+
+
+def _parse_zip64_sizes(extra: bytes, size: int, compressed_size: int) -> Tuple[int, int, bool]:
+    offset = 0
+    while offset + 4 <= len(extra):
+        field_id, field_length = struct.unpack("<HH", extra[offset:offset + 4])
+        field = extra[offset + 4:offset + 4 + field_length]
+        if field_id == ZIP64_EXTRA_FIELD_ID:
+            # Only the sizes set to 0xFFFFFFFF in the header are present, in this order
+            position = 0
+            if size == ZIP64_SIZE_MARKER:
+                size = struct.unpack("<Q", field[position:position + 8])[0]
+                position += 8
+            if compressed_size == ZIP64_SIZE_MARKER:
+                compressed_size = struct.unpack("<Q", field[position:position + 8])[0]
+            return size, compressed_size, True
+        offset += 4 + field_length
+    return size, compressed_size, False
+
+
+def _iter_stored_data(reader: ChunkReader, compressed_size: int) -> Iterator[bytes]:
+    remaining = compressed_size
+    while remaining:
+        chunk = reader.read_chunk(min(remaining, READ_CHUNK_SIZE))
+        if not chunk:
+            raise BadZipStream("Unexpected end of stream inside a stored member")
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _iter_deflated_data(reader: ChunkReader) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    while not decompressor.eof:
+        chunk = reader.read_chunk(READ_CHUNK_SIZE)
+        if not chunk:
+            raise BadZipStream("Unexpected end of stream inside a deflated member")
+        # Bound the size of each decompressed chunk, whatever the compression ratio is
+        data = decompressor.decompress(chunk, DECOMPRESSED_CHUNK_SIZE)
+        if data:
+            yield data
+        while decompressor.unconsumed_tail and not decompressor.eof:
+            data = decompressor.decompress(decompressor.unconsumed_tail, DECOMPRESSED_CHUNK_SIZE)
+            if data:
+                yield data
+    # Whatever follows the end of the deflate stream belongs to the next record of the archive
+    reader.unread(decompressor.unused_data)
+
+
+def _iter_member_data(reader: ChunkReader, name: str, flags: int, method: int, crc: int, compressed_size: int, zip64: bool) -> Iterator[bytes]:
+    if method == METHOD_STORED:
+        if name.endswith("/"):
+            # Directory entries have no data, even when their size is only given by their data descriptor
+            compressed_size = 0
+        elif flags & FLAG_DATA_DESCRIPTOR:
+            raise BadZipStream("Stored member {} has no size in its local header, it can't be streamed".format(name))
+        chunks = _iter_stored_data(reader, compressed_size)
+    elif method == METHOD_DEFLATED:
+        chunks = _iter_deflated_data(reader)
+    else:
+        raise BadZipStream("Member {} uses the unsupported compression method {}".format(name, method))
+
+    actual_crc = 0
+    for chunk in chunks:
+        actual_crc = zlib.crc32(chunk, actual_crc)
+        yield chunk
+
+    if flags & FLAG_DATA_DESCRIPTOR:
+        signature = reader.read_exactly(4)
+        if signature != DATA_DESCRIPTOR_SIGNATURE:
+            # The signature of the data descriptor is optional
+            reader.unread(signature)
+        crc = struct.unpack("<I", reader.read_exactly(4))[0]
+        reader.read_exactly(16 if zip64 else 8)
+    if actual_crc != crc:
+        raise BadZipStream("Bad CRC-32 for member {}".format(name))
+
+
+def iter_zip_members(chunks: Iterable[bytes]) -> Iterator[Tuple[str, Iterator[bytes]]]:
+    """
+    Yield (member_name, decompressed_chunks) for each member of the ZIP archive streamed by chunks.
+    The chunks of a member have to be consumed before moving to the next one, whatever hasn't been
+    consumed is skipped.
+    """
+    reader = ChunkReader(chunks)
+    while True:
+        signature = reader.read_exactly(4)
+        if signature in (CENTRAL_DIRECTORY_SIGNATURE, END_OF_CENTRAL_DIRECTORY_SIGNATURE):
+            return
+        if signature != LOCAL_FILE_HEADER_SIGNATURE:
+            raise BadZipStream("Unexpected record signature {!r}".format(signature))
+
+        _version, flags, method, _time, _date, crc, compressed_size, size, name_length, extra_length = \
+            struct.unpack("<HHHHHIIIHH", reader.read_exactly(26))
+        name = reader.read_exactly(name_length).decode("utf-8" if flags & FLAG_UTF8_NAME else "cp437")
+        extra = reader.read_exactly(extra_length)
+        size, compressed_size, zip64 = _parse_zip64_sizes(extra, size, compressed_size)
+        if flags & FLAG_ENCRYPTED:
+            raise BadZipStream("Member {} is encrypted".format(name))
+
+        data = _iter_member_data(reader, name, flags, method, crc, compressed_size, zip64)
+        if name.endswith("/"):
+            # Directory entry
+            for _ in data:
+                pass
+            continue
+        yield name, data
+        for _ in data:
+            pass
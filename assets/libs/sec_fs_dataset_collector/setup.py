@@ -3,5 +3,8 @@ from setuptools import setup
 setup(
     name="sec_fs_dataset_collector",
     version="0.1",
-    packages=['sec_fs_dataset_collector']
+    packages=['sec_fs_dataset_collector'],
+    extras_require={
+        "parquet": ["pyarrow"]
+    }
 ) 
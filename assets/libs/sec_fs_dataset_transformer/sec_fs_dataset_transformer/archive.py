@@ -0,0 +1,85 @@
+"""
+This module moves the ingested raw files to the archive prefix.
+
+Files are copied concurrently, with a multipart copy above a size threshold since copy_object can't copy
+more than 5 GB, then deleted with batched delete_objects calls.
+"""
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+MULTIPART_COPY_THRESHOLD = 1024 * 1024 * 1024
+MULTIPART_COPY_PART_SIZE = 256 * 1024 * 1024
+# Maximum number of keys accepted by delete_objects
+DELETE_BATCH_SIZE = 1000
+DEFAULT_MAX_WORKERS = 16
+
+
+def multipart_copy(s3_client, s3_bucket: str, source_key: str, destination_key: str, size: int, part_size: int = MULTIPART_COPY_PART_SIZE):
+    upload_id = s3_client.create_multipart_upload(Bucket=s3_bucket, Key=destination_key)["UploadId"]
+    try:
+        parts = []
+        for part_number, start in enumerate(range(0, size, part_size), start=1):
+            end = min(start + part_size, size) - 1
+            response = s3_client.upload_part_copy(
+                Bucket=s3_bucket,
+                Key=destination_key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                CopySource={"Bucket": s3_bucket, "Key": source_key},
+                CopySourceRange="bytes={}-{}".format(start, end),
+            )
+            parts.append({"ETag": response["CopyPartResult"]["ETag"], "PartNumber": part_number})
+        s3_client.complete_multipart_upload(Bucket=s3_bucket, Key=destination_key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+    except Exception:
+        s3_client.abort_multipart_upload(Bucket=s3_bucket, Key=destination_key, UploadId=upload_id)
+        raise
+
+
+def copy_file(s3_client, s3_bucket: str, source_key: str, destination_key: str, size: int, multipart_threshold: int = MULTIPART_COPY_THRESHOLD):
+    if size > multipart_threshold:
+        multipart_copy(s3_client, s3_bucket, source_key, destination_key, size)
+    else:
+        s3_client.copy_object(Bucket=s3_bucket, Key=destination_key, CopySource={"Bucket": s3_bucket, "Key": source_key})
+
+
+def archive_files(s3_client, s3_bucket: str, files: Dict[str, dict], archive_s3_prefix: str, max_workers: int = DEFAULT_MAX_WORKERS, multipart_threshold: int = MULTIPART_COPY_THRESHOLD) -> List[dict]:
+    """
+    Move files (file name -> {"key": ..., "size": ...}) under archive_s3_prefix, and return one result per file
+    with its file_name, source_key, archive_key, whether it was copied and deleted, and the error if any.
+    A file is only deleted once it has been copied.
+    """
+    results = {
+        file_name: {"file_name": file_name, "source_key": file["key"], "archive_key": archive_s3_prefix+file_name, "copied": False, "deleted": False, "error": None}
+        for file_name, file in files.items()
+    }
+
+    def copy(file_name: str):
+        result = results[file_name]
+        try:
+            copy_file(s3_client, s3_bucket, result["source_key"], result["archive_key"], files[file_name]["size"], multipart_threshold)
+            result["copied"] = True
+        except Exception as error:
+            result["error"] = "Copy failed: {}".format(error)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Each copy runs in a copy of the caller's context, so that the metrics stage in progress counts its S3 calls
+        for future in [executor.submit(contextvars.copy_context().run, copy, file_name) for file_name in files]:
+            future.result()
+
+    copied = [result for result in results.values() if result["copied"]]
+    for start in range(0, len(copied), DELETE_BATCH_SIZE):
+        batch = copied[start:start + DELETE_BATCH_SIZE]
+        response = s3_client.delete_objects(
+            Bucket=s3_bucket,
+            Delete={"Objects": [{"Key": result["source_key"]} for result in batch], "Quiet": True}
+        )
+        # Quiet mode only reports the keys which couldn't be deleted
+        errors = {error["Key"]: error for error in response.get("Errors", [])}
+        for result in batch:
+            if result["source_key"] in errors:
+                result["error"] = "Delete failed: {}".format(errors[result["source_key"]].get("Message"))
+            else:
+                result["deleted"] = True
+    return list(results.values())
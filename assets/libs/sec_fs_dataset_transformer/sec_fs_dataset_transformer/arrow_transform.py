@@ -0,0 +1,602 @@
+"""
+This module transforms the raw files of a table with PyArrow in a single process, for the quarterly increments which
+are too small to be worth starting a Spark cluster.
+
+It writes the layout of the Spark transform so that both engines can write to the same tables: Snappy Parquet files
+with the types of the table, under original_file_year=.../original_file_quarter=... partitions, sorted on the sort
+columns, and for bucketed tables one file per bucket, named and hashed the way Spark does (see bucketing).
+The tables themselves are created by the Spark transform (e.g. by the catchup workflow). Their columns, buckets and
+location are read from the Glue Data Catalog, in which the partitions written here are registered.
+
+Like the compaction, a partition or a table replaced by the transform is written under a new location which the
+catalog is then pointed at, so that readers never see both versions of its rows. The previous files are deleted after that.
+"""
+
+import io
+import json
+import re
+import traceback
+import uuid
+from decimal import ROUND_DOWN, Decimal, localcontext
+from functools import reduce
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pyarrow import csv
+
+from sec_fs_dataset_transformer.archive import archive_files, copy_file
+from sec_fs_dataset_transformer.bucketing import bucket_ids
+from sec_fs_dataset_transformer.compaction import compaction_location
+from sec_fs_dataset_transformer.ledger import is_ingested, ledger_key, load_ledger, record_files, save_ledger
+from sec_fs_dataset_transformer.planning import plan_batches, plan_write
+from sec_fs_dataset_transformer.schemas import MALFORMED_ROWS_POLICIES, TABLE_SCHEMAS, stale_columns, stale_columns_message
+from sec_fs_dataset_transformer.stats import arrow_stats_records, save_stats
+from sec_fs_dataset_transformer.tables import delete_keys, list_data_files, list_raw_files, partition_values, split_s3_path, stale_partition_cols_message, table_partition_cols
+from sec_fs_metrics.metrics import Metrics
+
+# Write modes of the Spark transform which can be used on an existing table
+WRITE_MODES = ("append", "overwrite_partitions", "upsert")
+PARQUET_COMPRESSION = "snappy"
+# Bytes of a raw text file read for its header, before its rows are parsed
+HEADER_READ_SIZE = 64 * 1024
+SPARK_SCHEMA_PREFIX = "spark.sql.sources.schema"
+# Suffix of the location Spark records for the tables whose schema Hive can't read, their path is in the serde parameters
+PLACEHOLDER_SUFFIX = "-__PLACEHOLDER__"
+# Fields of a table returned by get_table which update_table accepts
+TABLE_INPUT_KEYS = ("Name", "Description", "Owner", "Retention", "StorageDescriptor", "PartitionKeys", "TableType", "Parameters")
+
+# Types of the catalog, as recorded by Spark or by Hive, and their Arrow equivalent
+ARROW_TYPES = {
+    "string": pa.string(),
+    "integer": pa.int32(),
+    "int": pa.int32(),
+    "long": pa.int64(),
+    "bigint": pa.int64(),
+    "double": pa.float64(),
+    "boolean": pa.bool_(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("us"),
+}
+DECIMAL_TYPE = re.compile(r"^decimal\((\d+),\s*(\d+)\)$")
+# Types which the schema recorded by Spark names otherwise than its data frames and the schemas module do
+SPARK_SIMPLE_TYPES = {"integer": "int", "long": "bigint", "short": "smallint", "byte": "tinyint"}
+
+# Values accepted by the casts of Spark, the others become null. Spark truncates the fractional part of integers.
+INT_PATTERN = r"^\s*[+-]?(\d+\.?\d*|\.\d*)\s*$"
+DECIMAL_PATTERN = r"^\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*$"
+TRUE_VALUES = ["t", "true", "y", "yes", "1"]
+FALSE_VALUES = ["f", "false", "n", "no", "0"]
+
+
+def arrow_type(column_type: str):
+    decimal = DECIMAL_TYPE.match(column_type)
+    if decimal:
+        return pa.decimal128(int(decimal.group(1)), int(decimal.group(2)))
+    return ARROW_TYPES[column_type]
+
+
+def catalog_table(glue_client, database: str, table_name: str) -> Optional[dict]:
+    """
+    Return the description of the table in the Glue Data Catalog, None if it doesn't exist: its data columns as an Arrow
+    schema and with their types, its partition columns, its location, and its buckets as recorded by Spark
+    """
+    try:
+        table = glue_client.get_table(DatabaseName=database, Name=table_name)["Table"]
+    except glue_client.exceptions.EntityNotFoundException:
+        return None
+    parameters = table.get("Parameters", {})
+    def spark_property_list(name):
+        count = int(parameters.get("{}.num{}s".format(SPARK_SCHEMA_PREFIX, name[0].upper()+name[1:]), 0))
+        return [parameters["{}.{}.{}".format(SPARK_SCHEMA_PREFIX, name, index)] for index in range(count)]
+
+    partition_cols = [key["Name"] for key in table.get("PartitionKeys", [])]
+    # Spark records the schema of its tables in their parameters, split in parts when it is long
+    if SPARK_SCHEMA_PREFIX in parameters or SPARK_SCHEMA_PREFIX+".numParts" in parameters:
+        schema = json.loads(parameters.get(SPARK_SCHEMA_PREFIX) or "".join(spark_property_list("part")))
+        columns = [(field["name"], field["type"]) for field in schema["fields"]]
+    else:
+        columns = [(column["Name"], column["Type"]) for column in table["StorageDescriptor"]["Columns"]]
+
+    storage = table["StorageDescriptor"]
+    num_buckets = parameters.get(SPARK_SCHEMA_PREFIX+".numBuckets")
+    return {
+        "schema": pa.schema([(name, arrow_type(column_type)) for name, column_type in columns if name not in partition_cols]),
+        "column_types": {name: SPARK_SIMPLE_TYPES.get(column_type, column_type) for name, column_type in columns},
+        "partition_cols": partition_cols,
+        "location": storage.get("SerdeInfo", {}).get("Parameters", {}).get("path") or storage["Location"],
+        "num_buckets": int(num_buckets) if num_buckets else None,
+        "bucket_cols": spark_property_list("bucketCol"),
+        "storage_descriptor": storage,
+    }
+
+
+class PrefixedStream(io.RawIOBase):
+    """
+    Read the bytes of head, then the rest of stream, e.g. the body of an S3 object whose first bytes were already read
+    """
+
+    def __init__(self, head: bytes, stream):
+        self.head = memoryview(head)
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.head:
+            size = min(len(buffer), len(self.head))
+            buffer[:size], self.head = self.head[:size], self.head[size:]
+            return size
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def read_raw_file(s3_client, s3_bucket: str, raw_file: dict, file_name: str, malformed_rows: str) -> pa.Table:
+    """
+    Read a raw file, as tab-separated text or as Parquet, with every column as a string like the Spark transform reads it
+    """
+    body = s3_client.get_object(Bucket=s3_bucket, Key=raw_file["key"])["Body"]
+    if file_name.endswith(".parquet"):
+        # Parquet is read from its footer, the file is wrapped without being copied
+        table = pq.read_table(pa.BufferReader(body.read()))
+    else:
+        # The text is parsed while it is downloaded, only its header is read beforehand for the names of the columns
+        head = body.read(HEADER_READ_SIZE)
+        while b"\n" not in head:
+            chunk = body.read(HEADER_READ_SIZE)
+            if not chunk:
+                break
+            head += chunk
+        column_names = head.split(b"\n", 1)[0].decode("utf-8").rstrip("\r").split("\t")
+        def invalid_row(row):
+            # Spark pads or truncates the rows with a wrong number of fields in permissive mode, they are skipped here
+            if malformed_rows == "fail":
+                return "error"
+            print("Skipping the malformed row {} of {}: {}".format(row.number, file_name, row.text[:200]))
+            return "skip"
+        table = csv.read_csv(
+            PrefixedStream(head, body),
+            # The SEC files aren't quoted, quotes are part of the values
+            parse_options=csv.ParseOptions(delimiter="\t", quote_char=False, invalid_row_handler=invalid_row),
+            convert_options=csv.ConvertOptions(
+                column_types={column_name: pa.string() for column_name in column_names},
+                null_values=[""],
+                strings_can_be_null=True,
+            ),
+        )
+    return table.append_column("original_file_name", pa.array([file_name] * table.num_rows, pa.string()))
+
+
+def cast_values(values, target_type):
+    """
+    Cast string values to target_type the way the Spark transform does, values which can't be cast become null
+    """
+    if pa.types.is_string(target_type):
+        return values
+    if not pa.types.is_string(values.type):
+        return pc.cast(values, target_type)
+    if pa.types.is_date(target_type):
+        parsed = pc.strptime(values, format="%Y%m%d", unit="s", error_is_null=True)
+        # strptime rolls the days out of the month over (20240231 is 2024-03-02), Spark casts them to null
+        return pc.cast(pc.if_else(pc.equal(pc.strftime(parsed, format="%Y%m%d"), values), parsed, None), target_type)
+    if pa.types.is_timestamp(target_type):
+        # yyyy-MM-dd HH:mm:ss.S, the SEC files only have tenths of seconds of 0
+        values = pc.replace_substring_regex(values, pattern=r"\.\d*$", replacement="")
+        return pc.strptime(values, format="%Y-%m-%d %H:%M:%S", unit=target_type.unit, error_is_null=True)
+    if pa.types.is_boolean(target_type):
+        values = pc.utf8_lower(pc.utf8_trim_whitespace(values))
+        return pc.if_else(pc.is_in(values, pa.array(TRUE_VALUES)), True, pc.if_else(pc.is_in(values, pa.array(FALSE_VALUES)), False, None))
+    if pa.types.is_integer(target_type):
+        return cast_integers(pc.if_else(pc.match_substring_regex(values, INT_PATTERN), pc.utf8_trim_whitespace(values), None), target_type)
+    if pa.types.is_decimal(target_type):
+        return cast_decimals(pc.if_else(pc.match_substring_regex(values, DECIMAL_PATTERN), pc.utf8_trim_whitespace(values), None), target_type)
+    return pc.cast(values, target_type)
+
+
+def integer_digits(values):
+    """
+    Digits of the integer part of numbers written as strings, without their sign and leading zeros
+    """
+    return pc.replace_substring_regex(values, pattern=r"^[+-]?0*(\d*)(\.\d*)?$", replacement=r"\1")
+
+
+def cast_integers(values, target_type):
+    """
+    Cast integers written as strings to target_type like Spark: the fractional part is truncated, and the values out of
+    the range of the type become null
+    """
+    # Without the sign + and the fractional part, which the cast of Arrow doesn't accept
+    integers = pc.replace_substring_regex(values, pattern=r"^(?:\+|(-))?(\d*)(\.\d*)?$", replacement=r"\10\2")
+    digits = integer_digits(values)
+    # Strings of digits of the same length compare like the numbers they hold
+    fits_int64 = pc.or_(
+        pc.less(pc.utf8_length(digits), 19),
+        pc.and_(pc.equal(pc.utf8_length(digits), 19), pc.less_equal(digits, "9223372036854775807"))
+    )
+    integers = pc.cast(pc.if_else(fits_int64, integers, None), pa.int64())
+    if pa.types.is_signed_integer(target_type):
+        low, high = -(1 << (target_type.bit_width - 1)), (1 << (target_type.bit_width - 1)) - 1
+    else:
+        low, high = 0, (1 << target_type.bit_width) - 1
+    return pc.cast(pc.if_else(pc.and_(pc.greater_equal(integers, low), pc.less_equal(integers, high)), integers, None), target_type)
+
+
+def without_exponent(values, scale: int):
+    """
+    Write the decimals with an exponent (e.g. 1.5E3) without it, with at most scale fractional digits. They are rare,
+    so they are converted one by one.
+    """
+    has_exponent = pc.fill_null(pc.match_substring_regex(values, "[eE]"), False)
+    if not pc.any(has_exponent).as_py():
+        return values
+    def plain(value):
+        number = Decimal(value)
+        # Too big for any decimal type, which Spark casts to null
+        if number.adjusted() >= 38:
+            return None
+        with localcontext() as context:
+            context.prec = 100
+            return format(number.quantize(Decimal(1).scaleb(-scale), rounding=ROUND_DOWN), "f")
+    return pc.replace_with_mask(values, has_exponent, pa.array([plain(value) for value in pc.filter(values, has_exponent).to_pylist()], pa.string()))
+
+
+def cast_decimals(values, target_type):
+    """
+    Cast decimals written as strings to target_type like Spark: they are rounded half up (away from zero) to the scale
+    of the type, and the values with more integer digits than the type holds become null
+    """
+    precision, scale = target_type.precision, target_type.scale
+    # Rounding only depends on the first dropped digit, the next ones are truncated so that the values fit in the cast
+    values = without_exponent(values, scale + 1)
+    values = pc.replace_substring_regex(values, pattern=r"^([+-]?\d*\.\d{{{}}})\d+$".format(scale + 1), replacement=r"\1")
+    values = pc.if_else(pc.less_equal(pc.utf8_length(integer_digits(values)), precision - scale), values, None)
+    wide_type = pa.decimal128(38, scale + 1) if precision < 38 else pa.decimal256(76, scale + 1)
+    rounded = pc.round(pc.cast(values, wide_type), scale, round_mode="half_towards_infinity")
+    # Rounding up can add an integer digit, e.g. 999.99995 in decimal(7,4)
+    bound = Decimal(10) ** (precision - scale)
+    in_range = pc.and_(pc.less(rounded, pa.scalar(bound, wide_type)), pc.greater(rounded, pa.scalar(-bound, wide_type)))
+    return pc.cast(pc.if_else(in_range, rounded, None), target_type)
+
+
+def conform(table: pa.Table, schema: pa.Schema, table_name: str, malformed_rows: str) -> pa.Table:
+    """
+    Cast the columns of table to the schema of the catalog, in its order. The policies for the values which can't be
+    cast are those of schemas.apply_schema.
+    """
+    columns = {}
+    malformed = None
+    for field in schema:
+        if field.name not in table.column_names:
+            columns[field.name] = pa.nulls(table.num_rows, field.type)
+            continue
+        values = table[field.name]
+        columns[field.name] = cast_values(values, field.type)
+        if field.name in TABLE_SCHEMAS.get(table_name, {}):
+            is_malformed = pc.and_(pc.is_valid(values), pc.is_null(columns[field.name]))
+            malformed = is_malformed if malformed is None else pc.or_(malformed, is_malformed)
+            if malformed_rows == "fail" and pc.any(is_malformed).as_py():
+                value = pc.filter(values, is_malformed)[0].as_py()
+                raise ValueError("Malformed {} value for {}.{}: {}".format(TABLE_SCHEMAS[table_name][field.name], table_name, field.name, value))
+    conformed = pa.table(columns, schema=schema)
+    if malformed_rows == "drop" and malformed is not None:
+        conformed = conformed.filter(pc.invert(malformed))
+    return conformed
+
+
+def sort_table(table: pa.Table, sort_cols: List[str], bucket_cols: List[str] = None, num_buckets: int = None):
+    """
+    Sort table the way the Spark transform lays out its files, by bucket then by sort_cols, and return it with the
+    bucket of each row (None if the table isn't bucketed)
+    """
+    buckets = None
+    sort_keys = [(col, "ascending") for col in sort_cols]
+    if num_buckets:
+        buckets = bucket_ids(table, bucket_cols, num_buckets)
+        table = table.append_column("__bucket", buckets)
+        sort_keys = [("__bucket", "ascending")] + sort_keys
+    if sort_keys:
+        indices = pc.sort_indices(table, sort_keys=sort_keys)
+        table = table.take(indices)
+    if num_buckets:
+        buckets = table["__bucket"]
+        table = table.drop_columns(["__bucket"])
+    return table, buckets
+
+
+def write_files(s3_client, table: pa.Table, s3_bucket: str, prefix: str, files_per_partition: int, buckets=None) -> List[str]:
+    """
+    Write table, already sorted, under prefix as files_per_partition files, or as one file per bucket when buckets is given.
+    Return the keys of the files.
+    """
+    if table.num_rows == 0:
+        return []
+    write_id = uuid.uuid4()
+    if buckets is not None:
+        # Spark reads the bucket of a file from the end of its name
+        boundaries = pc.value_counts(buckets).to_pylist()
+        files, offset = [], 0
+        for count in sorted(boundaries, key=lambda item: item["values"]):
+            files.append(("part-00000-{}_{:05d}.c000.snappy.parquet".format(write_id, count["values"]), table.slice(offset, count["counts"])))
+            offset += count["counts"]
+    else:
+        rows_per_file = -(-table.num_rows // max(files_per_partition, 1))
+        files = [
+            ("part-{:05d}-{}.c000.snappy.parquet".format(index, write_id), table.slice(offset, rows_per_file))
+            for index, offset in enumerate(range(0, table.num_rows, rows_per_file))
+        ]
+    keys = []
+    for file_name, rows in files:
+        sink = pa.BufferOutputStream()
+        # Spark writes timestamps as INT96 by default, the same type is kept for the readers of the table
+        pq.write_table(rows, sink, compression=PARQUET_COMPRESSION, use_deprecated_int96_timestamps=True)
+        # The buffer is uploaded without being copied to bytes
+        s3_client.put_object(Bucket=s3_bucket, Key=prefix+file_name, Body=pa.BufferReader(sink.getvalue()))
+        keys.append(prefix+file_name)
+    return keys
+
+
+def numbered(table: pa.Table, columns: List[str]) -> pa.Table:
+    """
+    Return the columns of table as strings, with nulls equal to each other unlike in joins, and the number of each row as __row
+    """
+    return pa.table({
+        **{col: pc.fill_null(pc.cast(table[col], pa.string()), "\0") for col in columns},
+        "__row": pa.array(range(table.num_rows), pa.int64()),
+    })
+
+
+def take_rows(table: pa.Table, row_numbers) -> pa.Table:
+    """
+    Take the rows of table whose numbers are in row_numbers, in the order of table
+    """
+    return table.take(pc.take(row_numbers, pc.sort_indices(row_numbers)))
+
+
+def read_files(s3_client, s3_bucket: str, keys: List[str], schema: pa.Schema) -> pa.Table:
+    # Like raw Parquet files, the files are wrapped without being copied
+    tables = [pq.read_table(pa.BufferReader(s3_client.get_object(Bucket=s3_bucket, Key=key)["Body"].read())) for key in keys]
+    return pa.concat_tables([table.select(schema.names).cast(schema) for table in tables]) if tables else schema.empty_table()
+
+
+def read_matching_rows(s3_client, s3_bucket: str, keys: List[str], schema: pa.Schema, data: pa.Table, merge_keys: List[str]) -> pa.Table:
+    """
+    Read the rows of the files whose merge keys have values found in data, with the key of their file as __file.
+    The files are read one at a time and only their matching rows are kept, so that the table isn't held in memory.
+    """
+    matching = reduce(lambda left, right: left & right, [pc.field(col).isin(pc.unique(data[col])) for col in merge_keys])
+    tables = []
+    for key in keys:
+        table = pq.read_table(pa.BufferReader(s3_client.get_object(Bucket=s3_bucket, Key=key)["Body"].read()), filters=matching)
+        tables.append(table.select(schema.names).cast(schema).append_column("__file", pa.array([key] * table.num_rows, pa.string())))
+    return pa.concat_tables(tables) if tables else schema.append(pa.field("__file", pa.string())).empty_table()
+
+
+def partition_location(glue_client, database: str, table_name: str, values: tuple) -> Optional[str]:
+    """
+    Return the location of the partition with values, None if it isn't registered yet
+    """
+    try:
+        partition = glue_client.get_partition(DatabaseName=database, TableName=table_name, PartitionValues=list(values))["Partition"]
+    except glue_client.exceptions.EntityNotFoundException:
+        return None
+    return partition["StorageDescriptor"]["Location"]
+
+
+def partition_input(catalog: dict, values: tuple, location: str) -> dict:
+    storage = {key: value for key, value in catalog["storage_descriptor"].items() if key != "Location"}
+    # The path of the table isn't the one of its partitions
+    serde = dict(storage.get("SerdeInfo", {}))
+    serde["Parameters"] = {key: value for key, value in serde.get("Parameters", {}).items() if key != "path"}
+    return {"Values": list(values), "StorageDescriptor": {**storage, "SerdeInfo": serde, "Location": location}}
+
+
+def create_partition(glue_client, database: str, table_name: str, catalog: dict, values: tuple, location: str):
+    glue_client.create_partition(DatabaseName=database, TableName=table_name, PartitionInput=partition_input(catalog, values, location))
+
+
+def update_partition(glue_client, database: str, table_name: str, catalog: dict, values: tuple, location: str):
+    glue_client.update_partition(
+        DatabaseName=database,
+        TableName=table_name,
+        PartitionValueList=list(values),
+        PartitionInput=partition_input(catalog, values, location),
+    )
+
+
+def update_table_location(glue_client, database: str, table_name: str, location: str):
+    """
+    Point the table at location, like ALTER TABLE ... SET LOCATION does in Spark: the path of its serde parameters is
+    updated along with its location, which keeps its placeholder suffix if it had one
+    """
+    table = glue_client.get_table(DatabaseName=database, Name=table_name)["Table"]
+    storage = dict(table["StorageDescriptor"])
+    serde = dict(storage.get("SerdeInfo", {}))
+    if "path" in serde.get("Parameters", {}):
+        serde["Parameters"] = {**serde["Parameters"], "path": location}
+        storage["SerdeInfo"] = serde
+    storage["Location"] = location.rstrip("/")+PLACEHOLDER_SUFFIX if storage.get("Location", "").endswith(PLACEHOLDER_SUFFIX) else location
+    glue_client.update_table(
+        DatabaseName=database,
+        TableInput={**{key: table[key] for key in TABLE_INPUT_KEYS if key in table}, "StorageDescriptor": storage},
+    )
+
+
+def transform_table(s3_client, glue_client, options: dict, raw_files: Dict[str, dict] = None, metrics: Metrics = None):
+    """
+    Ingest the raw files of a table into it with PyArrow, then archive them, like transform.transform_table does with
+    Spark. options holds the COMMON_OPTIONS and TABLE_OPTIONS, raw_files the listing of the raw files when it was already done.
+    """
+    table = options["database"]+"."+options["table_name"]
+    def log(message):
+        print("[{}] {}".format(options["table_name"], message))
+
+    if options["write_mode"] not in WRITE_MODES:
+        raise ValueError("The write mode {} of {} isn't supported by the PyArrow transform, expected one of {}".format(options["write_mode"], table, WRITE_MODES))
+    if options["malformed_rows"] not in MALFORMED_ROWS_POLICIES:
+        raise ValueError("Unknown malformed rows policy {}, expected one of {}".format(options["malformed_rows"], MALFORMED_ROWS_POLICIES))
+
+    metrics = (metrics or Metrics()).with_labels(table=options["table_name"])
+    metrics.instrument(s3_client)
+    with metrics.stage("table") as table_stage:
+        catalog = catalog_table(glue_client, options["database"], options["table_name"])
+        if catalog is None:
+            raise RuntimeError("{} doesn't exist, it has to be created by the Spark transform, e.g. by the catchup workflow".format(table))
+        partition_cols = table_partition_cols(options)
+        if partition_cols != catalog["partition_cols"]:
+            raise RuntimeError(stale_partition_cols_message(table, catalog["partition_cols"], partition_cols))
+        stale = stale_columns(options["table_name"], catalog["column_types"])
+        if stale:
+            raise RuntimeError(stale_columns_message(table, stale))
+        sort_cols = [col for col in options["sort_cols"].split(",") if col]
+        num_buckets = catalog["num_buckets"]
+        target_file_bytes = int(options["target_file_bytes"])
+
+        if raw_files is None:
+            with metrics.stage("list") as stage:
+                raw_files = list_raw_files(s3_client, options["s3_bucket"], options["raw_s3_prefix"])
+                stage.bytes = sum(raw_file["size"] for raw_file in raw_files.values())
+        file_names = list(raw_files)
+
+        if options["write_mode"] in ("append", "overwrite_partitions"):
+            ledger_s3_key = ledger_key(options["ledger_s3_prefix"], options["table_name"])
+            ledger = load_ledger(s3_client, options["s3_bucket"], ledger_s3_key)
+            if ledger is None:
+                raise RuntimeError("{} has no ledger, the Spark transform builds it from the table".format(table))
+            if options["write_mode"] == "overwrite_partitions":
+                new_file_names = [file_name for file_name in file_names if not is_ingested(ledger, file_name, raw_files[file_name]["etag"])]
+            else:
+                new_file_names = [file_name for file_name in file_names if not is_ingested(ledger, file_name)]
+            batches = plan_batches({file_name: raw_files[file_name] for file_name in new_file_names}, int(options["max_batch_bytes"]))
+        else:
+            batches = [sorted(file_names)] if file_names else []
+
+        def read_raw_files(file_names):
+            return pa.concat_tables([
+                conform(read_raw_file(s3_client, options["s3_bucket"], raw_files[file_name], file_name, options["malformed_rows"]), catalog["schema"], options["table_name"], options["malformed_rows"])
+                for file_name in file_names
+            ])
+
+        def write_data(data, file_names, location):
+            plan = plan_write({file_name: raw_files[file_name] for file_name in file_names}, 1, num_buckets, target_file_bytes)
+            data, buckets = sort_table(data, sort_cols, catalog["bucket_cols"], num_buckets)
+            s3_bucket, prefix = split_s3_path(location)
+            return write_files(s3_client, data, s3_bucket, prefix, plan["files_per_partition"], buckets)
+
+        def write_partition(data, values, file_names):
+            if not partition_cols:
+                return write_data(data, file_names, catalog["location"])
+
+            location = partition_location(glue_client, options["database"], options["table_name"], values)
+            if location is None:
+                location = catalog["location"].rstrip("/")+"".join("/{}={}".format(col, value) for col, value in zip(partition_cols, values))
+                keys = write_data(data, file_names, location)
+                create_partition(glue_client, options["database"], options["table_name"], catalog, values, location)
+                return keys
+            if options["write_mode"] != "overwrite_partitions":
+                return write_data(data, file_names, location)
+            # The partition is written under a new location, which it is then pointed at
+            new_location = compaction_location(catalog["location"], uuid.uuid4().hex)+"".join("{}={}/".format(col, value) for col, value in zip(partition_cols, values))
+            s3_bucket, prefix = split_s3_path(location)
+            previous_keys = list(list_data_files(s3_client, s3_bucket, prefix))
+            keys = write_data(data, file_names, new_location)
+            update_partition(glue_client, options["database"], options["table_name"], catalog, values, new_location)
+            delete_keys(s3_client, s3_bucket, previous_keys)
+            return keys
+
+        def upsert_table(data, file_names):
+            """
+            Merge data into the table on the merge keys. Rows with new keys are written to a new file. When the rows of
+            existing keys changed, only the files holding them are rewritten, under a new location of the table along
+            with copies of its other files, and the table is then pointed at it.
+            """
+            keys = options["merge_keys"].split(",")
+            s3_bucket, prefix = split_s3_path(catalog["location"])
+            existing_files = list_data_files(s3_client, s3_bucket, prefix)
+            compared_cols = [col for col in catalog["schema"].names if not col.startswith("original_file_")]
+
+            with metrics.stage("dedup"):
+                # The first row of each key is kept
+                data = take_rows(data, numbered(data, keys).group_by(keys).aggregate([("__row", "min")])["__row_min"])
+                # Only the rows of the table with the keys of data are compared
+                existing = read_matching_rows(s3_client, s3_bucket, list(existing_files), catalog["schema"], data, keys)
+                # Rows which aren't in the table as they are, either because their key is new or because they changed
+                incoming = take_rows(data, numbered(data, compared_cols).join(numbered(existing, compared_cols).drop_columns(["__row"]), compared_cols, join_type="left anti")["__row"])
+                replaced = take_rows(existing, numbered(existing, keys).join(numbered(incoming, keys).drop_columns(["__row"]), keys, join_type="left semi")["__row"])
+            if incoming.num_rows == 0:
+                log("{} is already up to date".format(table))
+                return
+            if replaced.num_rows == 0:
+                log("Appending the new keys of {}".format(table))
+                write_data(incoming, file_names, catalog["location"])
+                return
+            changed_files = sorted(set(replaced["__file"].to_pylist()))
+            log("Rewriting {} of the {} files of {} to replace the changed keys".format(len(changed_files), len(existing_files), table))
+            rewritten = read_files(s3_client, s3_bucket, changed_files, catalog["schema"])
+            changed_keys = numbered(replaced, keys).drop_columns(["__row"])
+            kept = take_rows(rewritten, numbered(rewritten, keys).join(changed_keys, keys, join_type="left anti")["__row"])
+            new_location = compaction_location(catalog["location"], uuid.uuid4().hex)
+            _, new_prefix = split_s3_path(new_location)
+            for key, existing_file in existing_files.items():
+                if key not in changed_files:
+                    copy_file(s3_client, s3_bucket, key, new_prefix+key.split("/")[-1], existing_file["size"])
+            write_data(pa.concat_tables([kept, incoming]), file_names, new_location)
+            update_table_location(glue_client, options["database"], options["table_name"], new_location)
+            catalog["location"] = new_location
+            delete_keys(s3_client, s3_bucket, list(existing_files))
+
+        for batch_number, batch in enumerate(batches, start=1):
+            batch_bytes = sum(raw_files[file_name]["size"] for file_name in batch)
+            log("Ingesting batch {}/{}: {} ({} bytes)".format(batch_number, len(batches), ", ".join(batch), batch_bytes))
+            # The files of a partition are read and written together, so that an overwritten partition gets all of them
+            partitions = {}
+            for file_name in batch:
+                partitions.setdefault(partition_values(file_name, partition_cols), []).append(file_name)
+            for values, partition_file_names in sorted(partitions.items()):
+                with metrics.stage("read", batch=batch_number) as stage:
+                    data = read_raw_files(partition_file_names)
+                    stage.bytes = sum(raw_files[file_name]["size"] for file_name in partition_file_names)
+                    stage.rows = data.num_rows
+                with metrics.stage("write", batch=batch_number) as stage:
+                    stage.rows = data.num_rows
+                    if options["write_mode"] == "upsert":
+                        upsert_table(data, partition_file_names)
+                    else:
+                        keys = write_partition(data, values, partition_file_names)
+                        log("Wrote {} files to {}".format(len(keys), "/".join("{}={}".format(col, value) for col, value in zip(partition_cols, values)) or table))
+                with metrics.stage("stats", batch=batch_number) as stage:
+                    save_stats(s3_client, options["s3_bucket"], options["stats_s3_prefix"], arrow_stats_records(data, options["table_name"], raw_files, partition_cols))
+                    stage.rows = data.num_rows
+            table_stage.bytes = (table_stage.bytes or 0) + batch_bytes
+
+            if options["write_mode"] in ("append", "overwrite_partitions"):
+                # Only once the write has succeeded, so that a failing run resumes from the batch which failed
+                record_files(ledger, {file_name: {"size": raw_files[file_name]["size"], "etag": raw_files[file_name]["etag"]} for file_name in batch})
+                save_ledger(s3_client, options["s3_bucket"], ledger_s3_key, ledger)
+
+        # Archive the source data files
+        with metrics.stage("archive") as stage:
+            archive_results = archive_files(s3_client, options["s3_bucket"], {file_name: raw_files[file_name] for file_name in file_names}, options["archive_s3_prefix"])
+            stage.bytes = sum(raw_files[file_name]["size"] for file_name in file_names)
+        for result in archive_results:
+            log("Archived {} to {}".format(result["source_key"], result["archive_key"]) if result["error"] is None else "Failed to archive {}: {}".format(result["source_key"], result["error"]))
+        failed_archives = [result["file_name"] for result in archive_results if result["error"] is not None]
+        if failed_archives:
+            raise RuntimeError("Failed to archive the files {}".format(", ".join(failed_archives)))
+
+
+def transform_tables(s3_client, glue_client, common_options: dict, tables: List[dict], metrics: Metrics = None) -> Dict[str, Exception]:
+    """
+    Transform the tables one after the other. A failing table doesn't stop the others, the errors are returned by table name.
+    """
+    failures = {}
+    for table in tables:
+        try:
+            transform_table(s3_client, glue_client, {**common_options, **table}, metrics=metrics)
+            print("Transform {} succeeded".format(table["table_name"]))
+        except Exception as error:
+            failures[table["table_name"]] = error
+            print("Failed to transform {}:\n{}".format(table["table_name"], traceback.format_exc()))
+    return failures
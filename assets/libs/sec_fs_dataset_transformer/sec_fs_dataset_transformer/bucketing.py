@@ -0,0 +1,98 @@
+"""
+This module computes the bucket of a row the way Spark does when it writes a bucketed table, so that files written
+without Spark can be read as buckets of the Spark tables.
+
+Spark's bucket id is pmod(hash(bucket columns), number of buckets), where hash is its variant of Murmur3 x86_32
+with the seed 42. The hash is only computed once per distinct value, e.g. once per submission for adsh.
+"""
+
+import struct
+from typing import List
+
+SEED = 42
+MASK = 0xFFFFFFFF
+C1 = 0xCC9E2D51
+C2 = 0x1B873593
+
+
+def _rotate_left(value: int, bits: int) -> int:
+    return ((value << bits) | (value >> (32 - bits))) & MASK
+
+
+def _mix_k1(k1: int) -> int:
+    k1 = (k1 * C1) & MASK
+    k1 = _rotate_left(k1, 15)
+    return (k1 * C2) & MASK
+
+
+def _mix_h1(h1: int, k1: int) -> int:
+    h1 ^= k1
+    h1 = _rotate_left(h1, 13)
+    return (h1 * 5 + 0xE6546B64) & MASK
+
+
+def _fmix(h1: int, length: int) -> int:
+    h1 ^= length
+    h1 ^= h1 >> 16
+    h1 = (h1 * 0x85EBCA6B) & MASK
+    h1 ^= h1 >> 13
+    h1 = (h1 * 0xC2B2AE35) & MASK
+    h1 ^= h1 >> 16
+    return h1
+
+
+def _signed(value: int) -> int:
+    return value - (1 << 32) if value & 0x80000000 else value
+
+
+def hash_int(value: int, seed: int = SEED) -> int:
+    return _signed(_fmix(_mix_h1(seed & MASK, _mix_k1(value & MASK)), 4))
+
+
+def hash_bytes(data: bytes, seed: int = SEED) -> int:
+    """
+    Spark's Murmur3_x86_32.hashUnsafeBytes: the trailing bytes are mixed one by one as signed ints,
+    unlike the reference Murmur3
+    """
+    h1 = seed & MASK
+    aligned = len(data) - len(data) % 4
+    for (word,) in struct.iter_unpack("<I", data[:aligned]):
+        h1 = _mix_h1(h1, _mix_k1(word))
+    for byte in struct.unpack("{}b".format(len(data) - aligned), data[aligned:]):
+        h1 = _mix_h1(h1, _mix_k1(byte & MASK))
+    return _signed(_fmix(h1, len(data)))
+
+
+def spark_hash(values: tuple, seed: int = SEED) -> int:
+    """
+    Spark's hash(values...): each value is hashed with the hash of the previous ones as seed, nulls are skipped
+    """
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, str):
+            seed = hash_bytes(value.encode("utf-8"), seed)
+        elif isinstance(value, bool):
+            seed = hash_int(int(value), seed)
+        elif isinstance(value, int) and -2**31 <= value < 2**31:
+            seed = hash_int(value, seed)
+        else:
+            raise TypeError("Can't bucket on {!r}, only strings, booleans and ints are supported".format(value))
+    return seed
+
+
+def bucket_ids(table, bucket_cols: List[str], num_buckets: int):
+    """
+    Return the bucket id of each row of table (a pyarrow Table), in the order of its rows
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if len(bucket_cols) == 1:
+        column = table[bucket_cols[0]]
+        values = pc.unique(column)
+        buckets = pa.array([spark_hash((value,)) % num_buckets for value in values.to_pylist()], pa.int32())
+        return pc.take(buckets, pc.index_in(column, value_set=values, skip_nulls=False))
+    rows = list(zip(*(table[col].to_pylist() for col in bucket_cols)))
+    buckets = {row: spark_hash(row) % num_buckets for row in set(rows)}
+    return pa.array([buckets[row] for row in rows], pa.int32())
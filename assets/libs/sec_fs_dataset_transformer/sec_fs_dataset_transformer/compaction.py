@@ -0,0 +1,152 @@
+"""
+This module compacts the partitions of a table into sorted files of about the target size.
+
+The compacted partitions are written under a new location, then the catalog is pointed at them with
+ALTER TABLE ... SET LOCATION, which readers see at once. The previous files are only deleted after that,
+so a compaction failing midway leaves the table as it was.
+"""
+
+import re
+from functools import reduce
+from typing import Dict, List, Optional
+
+from sec_fs_dataset_transformer.planning import plan_write
+from sec_fs_dataset_transformer.tables import delete_keys, list_data_files, split_s3_path, table_partition_cols
+
+# Job arguments shared by every table
+COMMON_OPTIONS = ["database", "s3_bucket", "target_file_bytes", "force_compaction"]
+
+
+def partition_spec(partition: str) -> str:
+    """
+    Turn a partition as listed by SHOW PARTITIONS (e.g. original_file_year=2009/original_file_quarter=1) into a partition spec
+    """
+    return ", ".join("{}='{}'".format(*value.split("=", 1)) for value in partition.split("/"))
+
+
+def compaction_location(table_location: str, run_id: str) -> str:
+    """
+    Location of the files compacted by the run, next to the location of the table: s3://bucket/fs_num becomes
+    s3://bucket/fs_num_COMPACTED/<run_id>/, and so does the location of a table already compacted by another run.
+    The PyArrow transform writes the partitions and the tables it replaces under the same locations.
+    """
+    base_location = re.sub(r"_COMPACTED/[^/]+$", "", table_location.rstrip("/"))
+    return "{}_COMPACTED/{}/".format(base_location, run_id)
+
+
+def plan_swaps(table: str, compacted: Dict[Optional[str], dict], new_location: str) -> List[dict]:
+    """
+    Plan the switch of each compacted partition (None for an unpartitioned table) to its files under new_location:
+    the statement pointing the catalog at them, and the keys of its previous files to delete afterwards.
+    The keys under new_location are never deleted, even if they were listed with the previous files.
+    """
+    new_bucket, new_prefix = split_s3_path(new_location)
+    swaps = []
+    for partition, description in compacted.items():
+        if partition is None:
+            statement = "ALTER TABLE {} SET LOCATION '{}'".format(table, new_location)
+        else:
+            statement = "ALTER TABLE {} PARTITION ({}) SET LOCATION '{}'".format(table, partition_spec(partition), new_location+partition+"/")
+        swaps.append({
+            "partition": partition,
+            "statement": statement,
+            "s3_bucket": description["s3_bucket"],
+            "delete_keys": sorted(
+                key for key in description["files"]
+                if not (description["s3_bucket"] == new_bucket and key.startswith(new_prefix))
+            ),
+        })
+    return swaps
+
+
+def location(spark, table: str, partition: Optional[str] = None) -> str:
+    statement = "DESCRIBE TABLE EXTENDED {}".format(table) if partition is None else "DESCRIBE TABLE EXTENDED {} PARTITION ({})".format(table, partition_spec(partition))
+    for row in spark.sql(statement).collect():
+        if row.col_name == "Location":
+            return row.data_type
+    raise RuntimeError("No location found for {} {}".format(table, partition or ""))
+
+
+def compact_table(spark, s3_client, options: dict, run_id: str) -> List[str]:
+    """
+    Rewrite the partitions of the table which have more files than planned for their size (every partition if
+    force_compaction is "true") into sorted files of about target_file_bytes, and return the compacted partitions.
+    options holds the COMMON_OPTIONS and the table options of the transform.
+    """
+    # Imported here so that the compaction can be planned without PySpark
+    import pyspark.sql.functions as F
+    from sec_fs_dataset_transformer.transform import layout, table_num_buckets
+
+    table = options["database"]+"."+options["table_name"]
+    def log(message):
+        print("[{}] {}".format(options["table_name"], message))
+
+    if not spark.catalog._jcatalog.tableExists(options["database"], options["table_name"]):
+        log("{} doesn't exist yet, nothing to compact".format(table))
+        return []
+
+    partition_cols = table_partition_cols(options)
+    sort_cols = [col for col in options["sort_cols"].split(",") if col]
+    bucket_cols = options["cluster_cols"].split(",") if options["cluster_table"] == "true" else []
+    num_buckets = table_num_buckets(spark, table) if bucket_cols else None
+    target_file_bytes = int(options["target_file_bytes"])
+
+    partitions = [row[0] for row in spark.sql("SHOW PARTITIONS {}".format(table)).collect()] if partition_cols else [None]
+    compacted = {}
+    for partition in partitions:
+        s3_bucket, prefix = split_s3_path(location(spark, table, partition))
+        files = list_data_files(s3_client, s3_bucket, prefix)
+        plan = plan_write(files, 1, num_buckets, target_file_bytes)
+        if files and (len(files) > plan["files_per_partition"] or options["force_compaction"] == "true"):
+            compacted[partition] = {"s3_bucket": s3_bucket, "files": files, "plan": plan}
+    if not compacted:
+        log("No partition of {} needs to be compacted".format(table))
+        return []
+    log("Compacting {} partitions of {}".format(len(compacted), table))
+
+    # The partitions are rewritten together, under a location of their own
+    data_frame = spark.table(table)
+    if partition_cols:
+        data_frame = data_frame.where(reduce(lambda left, right: left | right, [
+            reduce(lambda left, right: left & right, [F.col(col) == value for col, value in (item.split("=", 1) for item in partition.split("/"))])
+            for partition in compacted
+        ]))
+    plan = plan_write({key: file for partition in compacted.values() for key, file in partition["files"].items()}, len(compacted), num_buckets, target_file_bytes)
+    data_frame = layout(data_frame, plan, partition_cols, sort_cols, bucket_cols, num_buckets)
+    new_location = compaction_location(location(spark, table), run_id)
+    if num_buckets:
+        # Bucketed files can only be written through a table, the staging table is external so dropping it keeps its files
+        staging_table = "{}__compaction_{}".format(table, run_id)
+        writer = data_frame.write.option("path", new_location).format("parquet").mode("overwrite")
+        if partition_cols:
+            writer = writer.partitionBy(*partition_cols)
+        writer = writer.bucketBy(num_buckets, bucket_cols)
+        if sort_cols:
+            writer = writer.sortBy(*sort_cols)
+        writer.saveAsTable(staging_table)
+        spark.sql("DROP TABLE {}".format(staging_table))
+    else:
+        writer = data_frame.write.mode("overwrite")
+        if partition_cols:
+            writer = writer.partitionBy(*partition_cols)
+        writer.parquet(new_location)
+
+    # Switch the partitions to their compacted files, then delete the previous ones
+    for swap in plan_swaps(table, compacted, new_location):
+        spark.sql(swap["statement"])
+        delete_keys(s3_client, swap["s3_bucket"], swap["delete_keys"])
+        log("Compacted {} {} from {} files".format(table, swap["partition"] or "", len(compacted[swap["partition"]]["files"])))
+    spark.sql("REFRESH TABLE {}".format(table))
+    return [partition or table for partition in compacted]
+
+
+def compact_tables(spark, s3_client, common_options: dict, tables: List[dict], run_id: str, max_workers: int = 4) -> Dict[str, Exception]:
+    from sec_fs_dataset_transformer.transform import for_each_table
+
+    return for_each_table(
+        spark,
+        tables,
+        lambda table: compact_table(spark, s3_client, {**common_options, **table}, run_id),
+        "Compact",
+        max_workers
+    )
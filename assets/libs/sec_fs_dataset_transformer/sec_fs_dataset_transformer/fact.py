@@ -0,0 +1,126 @@
+"""
+This module builds fs_fact, the numbers of fs_num with the attributes of their submission (fs_sub) and of their tag (fs_tag),
+so that queries don't have to join the three tables again.
+
+fs_fact is partitioned by quarter like fs_num. Its ledger records, for each quarter, when the fs_num and fs_sub files
+of the quarter were ingested, and only the quarters whose files were ingested since are rebuilt. Tags are versioned
+and their attributes don't change once published, so a quarter isn't rebuilt when fs_tag alone changes.
+Deleting the ledger rebuilds every quarter.
+"""
+
+from functools import reduce
+from typing import Dict, List
+
+from sec_fs_dataset_transformer.ledger import ledger_key, load_ledger, new_ledger, record_files, save_ledger
+from sec_fs_dataset_transformer.planning import plan_write
+from sec_fs_dataset_transformer.tables import partition_values
+
+# Job arguments of the fact table
+FACT_OPTIONS = ["database", "s3_bucket", "ledger_s3_prefix", "target_file_bytes", "table_name", "table_s3a_location", "sort_cols"]
+
+PARTITION_COLS = ["original_file_year", "original_file_quarter"]
+NUM_COLUMNS = ["adsh", "tag", "version", "coreg", "ddate", "qtrs", "uom", "value", "footnote"]
+# Attributes inlined into each number
+SUB_COLUMNS = ["cik", "name", "sic", "countryba", "stprba", "countryinc", "afs", "form", "period", "fy", "fp", "filed", "accepted", "prevrpt"]
+TAG_COLUMNS = ["custom", "abstract", "datatype", "iord", "crdr", "tlabel"]
+SOURCE_TABLES = ("fs_num", "fs_sub")
+
+
+def quarter_name(partition: tuple) -> str:
+    return "{}q{}".format(*partition)
+
+
+def source_file_key(table_name: str, file_name: str) -> str:
+    """
+    Key of a source file in source_quarters, e.g. fs_num/2009q1.txt, as the tables name their files the same way
+    """
+    return "{}/{}".format(table_name, file_name)
+
+
+def source_quarters(source_ledgers: Dict[str, dict]) -> Dict[str, dict]:
+    """
+    Group the files of the source ledgers (table name -> ledger) by quarter:
+    quarter (e.g. 2009q1) -> {"sources": source file key -> ingested at, "files": source file key -> size}
+    """
+    quarters = {}
+    for table_name, ledger in source_ledgers.items():
+        for file_name, description in ledger["files"].items():
+            quarter = quarters.setdefault(quarter_name(partition_values(file_name, PARTITION_COLS)), {"sources": {}, "files": {}})
+            key = source_file_key(table_name, file_name)
+            quarter["sources"][key] = description.get("ingested_at")
+            # Files recorded without their size count as empty in the plan
+            quarter["files"][key] = {"size": description.get("size", 0)}
+    return quarters
+
+
+def changed_quarters(quarters: Dict[str, dict], ledger: dict) -> List[str]:
+    """
+    Quarters of source_quarters whose source files were ingested since the ledger recorded them, in order
+    """
+    return sorted(quarter for quarter, description in quarters.items() if ledger["files"].get(quarter, {}).get("sources") != description["sources"])
+
+
+def build_fact_table(spark, s3_client, options: dict) -> List[str]:
+    """
+    Rebuild the partitions of the fact table whose fs_num or fs_sub files changed, and return their quarters.
+    options holds the FACT_OPTIONS.
+    """
+    # Imported here so that the quarters can be planned without PySpark
+    import pyspark.sql.functions as F
+    from sec_fs_dataset_transformer.transform import layout
+
+    database = options["database"]
+    table = database+"."+options["table_name"]
+    def log(message):
+        print("[{}] {}".format(options["table_name"], message))
+
+    source_ledgers = {}
+    for source_table in SOURCE_TABLES:
+        source_ledger = load_ledger(s3_client, options["s3_bucket"], ledger_key(options["ledger_s3_prefix"], source_table))
+        if source_ledger is None:
+            log("{} hasn't been transformed yet, nothing to build".format(source_table))
+            return []
+        source_ledgers[source_table] = source_ledger
+
+    table_exists = spark.catalog._jcatalog.tableExists(database, options["table_name"])
+    ledger_s3_key = ledger_key(options["ledger_s3_prefix"], options["table_name"])
+    ledger = load_ledger(s3_client, options["s3_bucket"], ledger_s3_key) if table_exists else None
+    if ledger is None:
+        ledger = new_ledger(options["table_name"])
+
+    quarters = source_quarters(source_ledgers)
+    changed = changed_quarters(quarters, ledger)
+    if not changed:
+        log("{} is already up to date".format(table))
+        return []
+    log("Building the quarters {} of {}".format(", ".join(changed), table))
+
+    def in_quarters(data_frame):
+        return data_frame.where(reduce(lambda left, right: left | right, [
+            (F.col("original_file_year") == quarter[:4]) & (F.col("original_file_quarter") == quarter[5:])
+            for quarter in changed
+        ]))
+
+    num = in_quarters(spark.table(database+".fs_num")).select(*NUM_COLUMNS, *PARTITION_COLS)
+    sub = in_quarters(spark.table(database+".fs_sub")).select("adsh", *SUB_COLUMNS, *PARTITION_COLS)
+    tag = spark.table(database+".fs_tag").select("tag", "version", *TAG_COLUMNS)
+    # A submission and its numbers come from the files of the same quarter, joining on it as well prunes both sides
+    fact = num.join(sub, ["adsh", *PARTITION_COLS], "left").join(tag, ["tag", "version"], "left")\
+        .select(*NUM_COLUMNS, *SUB_COLUMNS, *TAG_COLUMNS, *PARTITION_COLS)
+
+    # The output is sized from the num and sub files of the quarters
+    files = {key: description for quarter in changed for key, description in quarters[quarter]["files"].items()}
+    plan = plan_write(files, len(changed), target_file_bytes=int(options["target_file_bytes"]))
+    sort_cols = [col for col in options["sort_cols"].split(",") if col]
+    fact = layout(fact, plan, PARTITION_COLS, sort_cols)
+
+    # Only the partitions of the changed quarters are replaced
+    spark.conf.set("spark.sql.sources.partitionOverwriteMode", "dynamic")
+    if table_exists:
+        fact.write.insertInto(table, overwrite=True)
+    else:
+        fact.write.option("path", options["table_s3a_location"]).format("parquet").mode("append").partitionBy(*PARTITION_COLS).saveAsTable(table)
+
+    record_files(ledger, {quarter: {"sources": quarters[quarter]["sources"]} for quarter in changed})
+    save_ledger(s3_client, options["s3_bucket"], ledger_s3_key, ledger)
+    return changed
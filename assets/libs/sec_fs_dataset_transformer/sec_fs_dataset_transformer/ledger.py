@@ -0,0 +1,60 @@
+"""
+This module keeps, for each table, a ledger of the raw files which have already been ingested into it.
+
+The ledger is a JSON document on S3, replaced with a single put_object once a write has succeeded, so it
+is either in its previous or in its new state. Checking whether a file was ingested doesn't touch the table.
+"""
+
+import json
+from datetime import datetime, timezone
+from typing import Dict, Iterable
+from botocore.exceptions import ClientError
+
+
+def ledger_key(ledger_s3_prefix: str, table_name: str) -> str:
+    return ledger_s3_prefix+"{}.json".format(table_name)
+
+
+def new_ledger(table_name: str) -> dict:
+    return {"table_name": table_name, "files": {}}
+
+
+def load_ledger(s3_client, s3_bucket: str, key: str):
+    """
+    Return the ledger stored under key, or None if there's none yet
+    """
+    try:
+        response = s3_client.get_object(Bucket=s3_bucket, Key=key)
+    except ClientError as error:
+        if error.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise
+    return json.loads(response["Body"].read())
+
+
+def save_ledger(s3_client, s3_bucket: str, key: str, ledger: dict):
+    s3_client.put_object(Bucket=s3_bucket, Key=key, Body=json.dumps(ledger, indent=2, sort_keys=True).encode("utf-8"), ContentType="application/json")
+
+
+def is_ingested(ledger: dict, file_name: str, etag: str = None) -> bool:
+    """
+    Whether file_name was ingested, and when etag is given, whether it had the same content then.
+    Files recorded without an ETag are considered unchanged.
+    """
+    entry = ledger["files"].get(file_name)
+    if entry is None:
+        return False
+    return etag is None or entry.get("etag") in (None, etag)
+
+
+def record_files(ledger: dict, files: Dict[str, dict]):
+    """
+    Record files (file name -> description, e.g. its size and ETag) as ingested
+    """
+    ingested_at = datetime.now(timezone.utc).isoformat()
+    for file_name, description in files.items():
+        ledger["files"][file_name] = {**description, "ingested_at": ingested_at}
+
+
+def record_file_names(ledger: dict, file_names: Iterable[str]):
+    record_files(ledger, {file_name: {} for file_name in file_names})
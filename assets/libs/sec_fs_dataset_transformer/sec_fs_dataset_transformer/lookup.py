@@ -0,0 +1,127 @@
+"""
+This module builds fs_sub_index, which maps each submission (adsh) and company (cik) to the quarter partition its
+rows are in, so that point lookups into fs_num and fs_pre only scan that partition instead of every quarter.
+
+The index holds a few columns of fs_sub and is rebuilt for the quarters whose fs_sub file was ingested since its
+last run, like the fact table. A lookup first queries the index, which is small, then the table in the partitions
+it returned (see index_query and lookup_query). Athena can also join both in a single query on the partition
+columns, which it turns into a dynamic filter on the partitions of the table (see join_lookup_query).
+"""
+
+from typing import Iterable, List, Tuple
+
+from sec_fs_dataset_transformer.fact import PARTITION_COLS, changed_quarters, source_quarters
+from sec_fs_dataset_transformer.ledger import ledger_key, load_ledger, new_ledger, record_files, save_ledger
+from sec_fs_dataset_transformer.planning import plan_write
+
+# Job arguments of the index, alongside the FACT_OPTIONS of the job building both
+INDEX_OPTIONS = ["index_table_name", "index_table_s3a_location"]
+
+INDEX_TABLE_NAME = "fs_sub_index"
+INDEX_COLUMNS = ["adsh", "cik", "name", "form", "period"]
+INDEX_SORT_COLS = ["adsh"]
+
+
+def build_index_table(spark, s3_client, options: dict) -> List[str]:
+    """
+    Rebuild the partitions of the index whose fs_sub file changed, and return their quarters.
+    options holds the FACT_OPTIONS and the INDEX_OPTIONS.
+    """
+    # Imported here so that the queries can be built without PySpark
+    from sec_fs_dataset_transformer.transform import layout
+
+    database = options["database"]
+    table_name = options["index_table_name"]
+    table = database+"."+table_name
+    def log(message):
+        print("[{}] {}".format(table_name, message))
+
+    sub_ledger = load_ledger(s3_client, options["s3_bucket"], ledger_key(options["ledger_s3_prefix"], "fs_sub"))
+    if sub_ledger is None:
+        log("fs_sub hasn't been transformed yet, nothing to build")
+        return []
+
+    table_exists = spark.catalog._jcatalog.tableExists(database, table_name)
+    ledger_s3_key = ledger_key(options["ledger_s3_prefix"], table_name)
+    ledger = load_ledger(s3_client, options["s3_bucket"], ledger_s3_key) if table_exists else None
+    if ledger is None:
+        ledger = new_ledger(table_name)
+
+    quarters = source_quarters({"fs_sub": sub_ledger})
+    changed = changed_quarters(quarters, ledger)
+    if not changed:
+        log("{} is already up to date".format(table))
+        return []
+    log("Building the quarters {} of {}".format(", ".join(changed), table))
+
+    index = spark.table(database+".fs_sub").where(quarters_predicate(changed)).select(*INDEX_COLUMNS, *PARTITION_COLS)
+    files = {key: description for quarter in changed for key, description in quarters[quarter]["files"].items()}
+    # The index only keeps a few columns of fs_sub, each quarter is written to a single file
+    plan = plan_write(files, len(changed), files_per_partition=1)
+    index = layout(index, plan, PARTITION_COLS, INDEX_SORT_COLS)
+
+    spark.conf.set("spark.sql.sources.partitionOverwriteMode", "dynamic")
+    if table_exists:
+        index.write.insertInto(table, overwrite=True)
+    else:
+        index.write.option("path", options["index_table_s3a_location"]).format("parquet").mode("append").partitionBy(*PARTITION_COLS).saveAsTable(table)
+
+    record_files(ledger, {quarter: {"sources": quarters[quarter]["sources"]} for quarter in changed})
+    save_ledger(s3_client, options["s3_bucket"], ledger_s3_key, ledger)
+    return changed
+
+
+def sql_literal(value) -> str:
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+def quarters_predicate(quarters: Iterable[str]) -> str:
+    """
+    SQL predicate selecting the partitions of quarters (e.g. 2009q1), which Spark and Athena both prune on
+    """
+    return "({})".format(" OR ".join(
+        "(original_file_year = '{}' AND original_file_quarter = '{}')".format(quarter[:4], quarter[5:])
+        for quarter in sorted(set(quarters))
+    ) or "FALSE")
+
+
+def index_query(database: str, adsh: Iterable[str] = (), cik: Iterable[int] = (), index_table_name: str = INDEX_TABLE_NAME) -> str:
+    """
+    SQL query returning the submissions adsh and those of the companies cik, with the quarter partition of each
+    """
+    conditions = []
+    if adsh:
+        conditions.append("adsh IN ({})".format(", ".join(sql_literal(value) for value in adsh)))
+    if cik:
+        conditions.append("cik IN ({})".format(", ".join(sql_literal(value) for value in cik)))
+    if not conditions:
+        raise ValueError("A lookup needs at least one adsh or cik")
+    return "SELECT DISTINCT adsh, original_file_year, original_file_quarter FROM {}.{} WHERE {}".format(database, index_table_name, " OR ".join(conditions))
+
+
+def lookup_query(database: str, table_name: str, submissions: Iterable[Tuple[str, str, str]], columns: str = "*") -> str:
+    """
+    SQL query reading the rows of submissions, the (adsh, year, quarter) rows returned by index_query, from table_name
+    (e.g. fs_num), only in their partitions
+    """
+    submissions = list(submissions)
+    return "SELECT {} FROM {}.{} WHERE {} AND adsh IN ({})".format(
+        columns,
+        database,
+        table_name,
+        quarters_predicate("{}q{}".format(year, quarter) for _, year, quarter in submissions),
+        ", ".join(sql_literal(adsh) for adsh, _, _ in submissions) or "NULL"
+    )
+
+
+def join_lookup_query(database: str, table_name: str, adsh: Iterable[str] = (), cik: Iterable[int] = (), index_table_name: str = INDEX_TABLE_NAME) -> str:
+    """
+    Single SQL query reading the rows of the submissions adsh and of the companies cik from table_name, for engines
+    which prune partitions from a join such as Athena
+    """
+    return (
+        "SELECT t.* FROM {}.{} t JOIN ({}) i "
+        "ON t.original_file_year = i.original_file_year AND t.original_file_quarter = i.original_file_quarter AND t.adsh = i.adsh"
+    ).format(database, table_name, index_query(database, adsh, cik, index_table_name))
@@ -0,0 +1,76 @@
+"""
+This module plans how the raw files are processed, from their S3 listing, before any of them is read:
+how they are batched, and how each batch is spread over files so that they land near a target size.
+"""
+
+from typing import Dict, List
+
+DEFAULT_MAX_BATCH_BYTES = 8 * 1024 * 1024 * 1024
+
+
+def plan_batches(files: Dict[str, dict], max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES) -> List[List[str]]:
+    """
+    Group files (file name -> {"size": ...}) into batches of at most max_batch_bytes, in the order of their names
+    so that quarters are ingested chronologically. A file bigger than max_batch_bytes gets a batch of its own.
+    """
+    batches = []
+    batch, batch_bytes = [], 0
+    for file_name in sorted(files):
+        size = files[file_name]["size"]
+        if batch and batch_bytes + size > max_batch_bytes:
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(file_name)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+DEFAULT_TARGET_FILE_BYTES = 256 * 1024 * 1024
+# Rough size of the Parquet output relative to tab-separated raw files. Raw Parquet files are already compressed.
+TEXT_TO_PARQUET_RATIO = 0.25
+MAX_BUCKETS = 64
+MAX_SHUFFLE_PARTITIONS = 2000
+
+
+def estimate_output_bytes(files: Dict[str, dict]) -> int:
+    return int(sum(
+        description["size"] * (1.0 if file_name.endswith(".parquet") else TEXT_TO_PARQUET_RATIO)
+        for file_name, description in files.items()
+    ))
+
+
+def _ceil_div(numerator: int, denominator: int) -> int:
+    return -(-numerator // denominator)
+
+
+def plan_buckets(files: Dict[str, dict], partitions: int, target_file_bytes: int = DEFAULT_TARGET_FILE_BYTES) -> int:
+    """
+    Number of buckets of a table created from files, written into partitions table partitions, so that each bucket
+    file of a partition is about target_file_bytes. It can't change once the table exists.
+    """
+    bytes_per_partition = estimate_output_bytes(files) / max(partitions, 1)
+    return min(MAX_BUCKETS, max(1, _ceil_div(int(bytes_per_partition), target_file_bytes)))
+
+
+def plan_write(files: Dict[str, dict], partitions: int, num_buckets: int = None, target_file_bytes: int = DEFAULT_TARGET_FILE_BYTES,
+               files_per_partition: int = None) -> dict:
+    """
+    Plan the write of files into partitions table partitions: the number of files per partition, which is the number of
+    buckets of a bucketed table, files_per_partition if given, or else sized after target_file_bytes, and the number of
+    shuffle partitions the data is repartitioned into before the write.
+    Each shuffle partition holds whole files, so that each file is written by a single task.
+    """
+    estimated_bytes = estimate_output_bytes(files)
+    partitions = max(partitions, 1)
+    if num_buckets:
+        files_per_partition = num_buckets
+    elif not files_per_partition:
+        files_per_partition = max(1, _ceil_div(int(estimated_bytes / partitions), target_file_bytes))
+    return {
+        "estimated_bytes": estimated_bytes,
+        "partitions": partitions,
+        "files_per_partition": files_per_partition,
+        "shuffle_partitions": min(MAX_SHUFFLE_PARTITIONS, partitions * files_per_partition),
+    }
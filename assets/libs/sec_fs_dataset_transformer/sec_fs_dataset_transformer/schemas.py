@@ -0,0 +1,119 @@
+"""
+This module holds the types of the columns of each SEC Financial Statement table.
+
+The types come from the SEC's description of the datasets (https://www.sec.gov/files/aqfs.pdf).
+Only the columns which aren't strings are listed, the others are kept as they are read.
+PySpark is only required to cast Spark DataFrames, the PyArrow transform shares the types.
+"""
+
+from typing import Dict, Tuple
+
+DATE_FORMAT = "yyyyMMdd"
+TIMESTAMP_FORMAT = "yyyy-MM-dd HH:mm:ss.S"
+
+TABLE_SCHEMAS = {
+    "fs_sub": {
+        "cik": "int",
+        "sic": "int",
+        "ein": "int",
+        "changed": "date",
+        "wksi": "boolean",
+        "period": "date",
+        "fy": "int",
+        "filed": "date",
+        "accepted": "timestamp",
+        "prevrpt": "boolean",
+        "detail": "boolean",
+        "nciks": "int",
+    },
+    "fs_num": {
+        "ddate": "date",
+        "qtrs": "int",
+        "value": "decimal(28,4)",
+    },
+    "fs_pre": {
+        "report": "int",
+        "line": "int",
+        "inpth": "boolean",
+        "negating": "boolean",
+    },
+    "fs_tag": {
+        "custom": "boolean",
+        "abstract": "boolean",
+    },
+}
+
+# Policies for the rows which can't be parsed, either because they don't have the expected number of fields
+# or because one of their values doesn't match the type of its column
+MALFORMED_ROWS_POLICIES = ("permissive", "drop", "fail")
+
+# Mode of Spark's CSV reader corresponding to each policy
+CSV_READ_MODES = {
+    "permissive": "PERMISSIVE",
+    "drop": "DROPMALFORMED",
+    "fail": "FAILFAST",
+}
+
+
+def stale_columns(table_name: str, column_types: Dict[str, str]) -> Dict[str, Tuple[str, str]]:
+    """
+    Columns of an existing table (column name -> type, as Spark names them) whose type isn't the one registered for
+    table_name, e.g. the strings of the tables created before their columns were cast: column name -> (type, registered type)
+    """
+    return {
+        column_name: (column_types[column_name], column_type)
+        for column_name, column_type in TABLE_SCHEMAS.get(table_name, {}).items()
+        if column_name in column_types and column_types[column_name] != column_type
+    }
+
+
+def stale_columns_message(table: str, stale: Dict[str, Tuple[str, str]]) -> str:
+    return "{} has the columns {} instead of {}, it was created by a previous version and has to be recreated, see Upgrading the tables in the README".format(
+        table,
+        ", ".join("{} {}".format(column_name, column_type) for column_name, (column_type, _) in stale.items()),
+        ", ".join("{} {}".format(column_name, registered_type) for column_name, (_, registered_type) in stale.items()),
+    )
+
+
+def cast_column(column_name: str, column_type: str):
+    import pyspark.sql.functions as F
+
+    if column_type == "date":
+        return F.to_date(F.col(column_name), DATE_FORMAT)
+    if column_type == "timestamp":
+        return F.to_timestamp(F.col(column_name), TIMESTAMP_FORMAT)
+    return F.col(column_name).cast(column_type)
+
+
+def apply_schema(data_frame, table_name: str, malformed_rows: str = "permissive"):
+    """
+    Cast the string columns of data_frame to the types registered for table_name.
+    Values which can't be cast become null with the permissive policy, drop their row with the drop policy,
+    and make the job fail with the fail policy.
+    """
+    if malformed_rows not in MALFORMED_ROWS_POLICIES:
+        raise ValueError("Unknown malformed rows policy {}, expected one of {}".format(malformed_rows, MALFORMED_ROWS_POLICIES))
+    import pyspark.sql.functions as F
+
+    schema = {column_name: column_type for column_name, column_type in TABLE_SCHEMAS.get(table_name, {}).items() if column_name in data_frame.columns}
+    if not schema:
+        return data_frame
+
+    casted = {column_name: cast_column(column_name, column_type) for column_name, column_type in schema.items()}
+    # A value is malformed when it isn't null before being cast but is afterwards
+    malformed = {column_name: F.col(column_name).isNotNull() & cast.isNull() for column_name, cast in casted.items()}
+
+    if malformed_rows == "drop":
+        is_malformed = None
+        for condition in malformed.values():
+            is_malformed = condition if is_malformed is None else is_malformed | condition
+        data_frame = data_frame.filter(~is_malformed)
+    elif malformed_rows == "fail":
+        casted = {
+            column_name: F.when(
+                malformed[column_name],
+                F.raise_error(F.concat(F.lit("Malformed {} value for {}.{}: ".format(schema[column_name], table_name, column_name)), F.col(column_name)))
+            ).otherwise(cast)
+            for column_name, cast in casted.items()
+        }
+    return data_frame.select([casted[column_name].alias(column_name) if column_name in casted else F.col(column_name) for column_name in data_frame.columns])
@@ -0,0 +1,162 @@
+"""
+This module computes the statistics of the rows ingested from each raw file, and stores them in fs_stats, a small
+JSON table next to the fs_* tables, so that loads can be validated (e.g. a truncated SEC file has fewer rows than
+the quarters around it) and queries planned without scanning the tables.
+
+fs_stats has a row per table, raw file and column: the rows of the file, the nulls of the column, its min and max
+for numbers and dates, its approximate number of distinct values for the identifiers, and the size of the raw file.
+Each file's statistics are stored in an object of their own, replaced when the file is ingested again.
+
+The statistics are computed from the rows being written: with Spark they are aggregated by file once the rows are
+written, with PyArrow they are computed from the table in memory.
+"""
+
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from sec_fs_dataset_transformer.schemas import TABLE_SCHEMAS
+from sec_fs_dataset_transformer.tables import partition_values
+
+STATS_TABLE_NAME = "fs_stats"
+# Identifiers whose approximate number of distinct values is computed
+DISTINCT_COLUMNS = ("adsh", "tag", "cik")
+# Columns of the Glue table, also created from them by the stack. The min and max are kept as strings so that every
+# type fits in the same columns.
+STATS_COLUMNS = [
+    ("table_name", "string"),
+    ("file_name", "string"),
+    ("original_file_year", "string"),
+    ("original_file_quarter", "string"),
+    ("column_name", "string"),
+    ("row_count", "bigint"),
+    ("null_count", "bigint"),
+    ("min_value", "string"),
+    ("max_value", "string"),
+    ("approx_distinct", "bigint"),
+    ("raw_bytes", "bigint"),
+    ("computed_at", "string"),
+]
+
+
+def range_columns(table_name: str) -> List[str]:
+    """
+    Columns of table_name with a min and a max: its numbers, dates and timestamps
+    """
+    return [column_name for column_name, column_type in TABLE_SCHEMAS.get(table_name, {}).items() if column_type != "boolean"]
+
+
+def stats_key(stats_s3_prefix: str, table_name: str, file_name: str) -> str:
+    return stats_s3_prefix+"{}_{}.json".format(table_name, file_name.rsplit(".", 1)[0])
+
+
+def stats_records(table_name: str, file_name: str, raw_bytes: int, row_count: int, columns: Dict[str, dict], partition_cols: List[str]) -> List[dict]:
+    """
+    Rows of fs_stats for the statistics of a file, columns holding the null_count, min, max and approx_distinct of each column.
+    The year and quarter are those of the partition of the file, null for the tables which aren't partitioned (e.g. tag.txt of fs_tag).
+    """
+    partition = dict(zip(partition_cols, partition_values(file_name, partition_cols)))
+    year, quarter = partition.get("original_file_year"), partition.get("original_file_quarter")
+    computed_at = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            "table_name": table_name,
+            "file_name": file_name,
+            "original_file_year": year,
+            "original_file_quarter": quarter,
+            "column_name": column_name,
+            "row_count": row_count,
+            "null_count": column["null_count"],
+            "min_value": None if column.get("min") is None else str(column["min"]),
+            "max_value": None if column.get("max") is None else str(column["max"]),
+            "approx_distinct": column.get("approx_distinct"),
+            "raw_bytes": raw_bytes,
+            "computed_at": computed_at,
+        }
+        for column_name, column in columns.items()
+    ]
+
+
+def save_stats(s3_client, s3_bucket: str, stats_s3_prefix: str, records: List[dict]):
+    """
+    Store the rows of fs_stats as JSON lines, one object per table and file
+    """
+    by_file = {}
+    for record in records:
+        by_file.setdefault((record["table_name"], record["file_name"]), []).append(record)
+    for (table_name, file_name), file_records in by_file.items():
+        s3_client.put_object(
+            Bucket=s3_bucket,
+            Key=stats_key(stats_s3_prefix, table_name, file_name),
+            Body="".join(json.dumps(record, default=str)+"\n" for record in file_records).encode("utf-8"),
+            ContentType="application/json"
+        )
+
+
+def stats_columns(column_names: List[str]) -> List[str]:
+    return [column_name for column_name in column_names if not column_name.startswith("original_file_")]
+
+
+def spark_stats_exprs(data_frame, table_name: str) -> Tuple[list, dict]:
+    """
+    Aggregate expressions computing the statistics of the rows of a file, grouped by original_file_name, and what each
+    of them computes by name: (column name or None for the rows, statistic)
+    """
+    import pyspark.sql.functions as F
+
+    exprs, names = [], {}
+    def add(expr, column_name, statistic):
+        name = "stats_{}".format(len(exprs))
+        exprs.append(expr.alias(name))
+        names[name] = (column_name, statistic)
+
+    ranged = range_columns(table_name)
+    add(F.count(F.lit(1)), None, "row_count")
+    for column_name in stats_columns(data_frame.columns):
+        add(F.count(F.when(F.col(column_name).isNull(), 1)), column_name, "null_count")
+        if column_name in ranged:
+            add(F.min(column_name), column_name, "min")
+            add(F.max(column_name), column_name, "max")
+        if column_name in DISTINCT_COLUMNS:
+            add(F.approx_count_distinct(column_name), column_name, "approx_distinct")
+    return exprs, names
+
+
+def spark_stats_records(rows: List[dict], names: dict, table_name: str, raw_files: Dict[str, dict], partition_cols: List[str]) -> List[dict]:
+    """
+    Rows of fs_stats from the rows of the aggregation of spark_stats_exprs, one per original_file_name
+    """
+    records = []
+    for row in rows:
+        row_count, columns = None, {}
+        for name, (column_name, statistic) in names.items():
+            if column_name is None:
+                row_count = row[name]
+            else:
+                columns.setdefault(column_name, {})[statistic] = row[name]
+        file_name = row["original_file_name"]
+        records.extend(stats_records(table_name, file_name, raw_files[file_name]["size"], row_count, columns, partition_cols))
+    return records
+
+
+def arrow_stats_records(table, table_name: str, raw_files: Dict[str, dict], partition_cols: List[str]) -> List[dict]:
+    """
+    Rows of fs_stats for the rows of each file of table, a pyarrow Table. The distinct values are counted exactly.
+    """
+    import pyarrow.compute as pc
+
+    ranged = range_columns(table_name)
+    records = []
+    for file_name in pc.unique(table["original_file_name"]).to_pylist():
+        rows = table.filter(pc.equal(table["original_file_name"], file_name))
+        columns = {}
+        for column_name in stats_columns(rows.column_names):
+            values = rows[column_name]
+            column = columns[column_name] = {"null_count": values.null_count}
+            if column_name in ranged:
+                min_max = pc.min_max(values).as_py()
+                column["min"], column["max"] = min_max["min"], min_max["max"]
+            if column_name in DISTINCT_COLUMNS:
+                column["approx_distinct"] = pc.count_distinct(values).as_py()
+        records.extend(stats_records(table_name, file_name, raw_files[file_name]["size"], rows.num_rows, columns, partition_cols))
+    return records
@@ -0,0 +1,79 @@
+"""
+This module describes the tables given to the transform jobs: their job arguments, their partitions and their raw files.
+It doesn't depend on Spark, so that the Spark and the PyArrow transforms share it.
+"""
+
+from typing import Dict, List, Tuple
+
+from sec_fs_dataset_transformer.archive import DELETE_BATCH_SIZE
+
+# Job arguments shared by every table
+COMMON_OPTIONS = ["database", "s3_bucket", "ledger_s3_prefix", "max_batch_bytes", "target_file_bytes", "metrics_sink", "stats_s3_prefix"]
+# Job arguments describing a table
+TABLE_OPTIONS = ["table_name", "table_s3a_location", "raw_s3_prefix", "archive_s3_prefix", "write_mode", "cluster_table", "num_clusters",
+    "cluster_cols", "partition_by_file_year", "partition_by_file_quarter", "malformed_rows", "merge_keys", "sort_cols"]
+
+
+def list_raw_files(s3_client, s3_bucket: str, raw_s3_prefix: str) -> Dict[str, dict]:
+    """
+    Return the raw files under raw_s3_prefix by file name, with their key, size and ETag
+    """
+    return {
+        obj["Key"].split("/")[-1]: {"key": obj["Key"], "size": obj["Size"], "etag": obj["ETag"]}
+        for page in s3_client.get_paginator("list_objects_v2").paginate(Bucket=s3_bucket, Prefix=raw_s3_prefix)
+        for obj in page.get("Contents", [])
+        if not obj["Key"].endswith("/")
+    }
+
+
+def partition_values(file_name: str, partition_cols: List[str]) -> tuple:
+    """
+    Values of the partition columns of the rows read from file_name, e.g. ("2009", "1") for 2009q1.txt
+    """
+    year, _, rest = file_name.partition("q")
+    return tuple(year if col == "original_file_year" else rest[:1] for col in partition_cols)
+
+
+def table_partition_cols(options: dict) -> List[str]:
+    partition_cols = []
+    if options["partition_by_file_year"] == "true":
+        partition_cols.append("original_file_year")
+        if options["partition_by_file_quarter"] == "true":
+            partition_cols.append("original_file_quarter")
+    return partition_cols
+
+
+def stale_partition_cols_message(table: str, catalog_partition_cols: List[str], partition_cols: List[str]) -> str:
+    """
+    Error of a table partitioned by other columns in the catalog, e.g. by year alone before original_file_quarter was added
+    """
+    return "{} is partitioned by {} in the catalog, not by {}, it was created by a previous version and has to be recreated, see Upgrading the tables in the README".format(
+        table, catalog_partition_cols, partition_cols
+    )
+
+
+def split_s3_path(path: str) -> Tuple[str, str]:
+    """
+    Return the bucket and the prefix of an s3:// or s3a:// path, the prefix ending with /
+    """
+    bucket, _, prefix = path.split("://", 1)[1].partition("/")
+    return bucket, prefix.rstrip("/")+"/"
+
+
+def list_data_files(s3_client, s3_bucket: str, prefix: str) -> Dict[str, dict]:
+    """
+    Return the data files directly under prefix by key, with their size. Markers such as _SUCCESS are left out.
+    """
+    return {
+        obj["Key"]: {"key": obj["Key"], "size": obj["Size"]}
+        for page in s3_client.get_paginator("list_objects_v2").paginate(Bucket=s3_bucket, Prefix=prefix, Delimiter="/")
+        for obj in page.get("Contents", [])
+        if not obj["Key"].split("/")[-1].startswith(("_", "."))
+    }
+
+
+def delete_keys(s3_client, s3_bucket: str, keys: List[str]):
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        response = s3_client.delete_objects(Bucket=s3_bucket, Delete={"Objects": [{"Key": key} for key in keys[start:start + DELETE_BATCH_SIZE]], "Quiet": True})
+        if response.get("Errors"):
+            raise RuntimeError("Failed to delete {}".format(", ".join(error["Key"] for error in response["Errors"])))
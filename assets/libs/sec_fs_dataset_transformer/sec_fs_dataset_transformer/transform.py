@@ -0,0 +1,286 @@
+"""
+This module transforms the raw files of a table into the table, and can process several tables within the same
+Spark application so that they share one cluster instead of starting one each.
+"""
+
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import reduce
+from typing import Dict, List
+
+import pyspark.sql.functions as F
+
+from sec_fs_dataset_transformer.archive import archive_files
+from sec_fs_dataset_transformer.ledger import is_ingested, ledger_key, load_ledger, new_ledger, record_file_names, record_files, save_ledger
+from sec_fs_dataset_transformer.planning import plan_batches, plan_buckets, plan_write
+from sec_fs_dataset_transformer.schemas import CSV_READ_MODES, apply_schema, stale_columns, stale_columns_message
+from sec_fs_dataset_transformer.stats import save_stats, spark_stats_exprs, spark_stats_records
+from sec_fs_dataset_transformer.tables import COMMON_OPTIONS, TABLE_OPTIONS, list_raw_files, partition_values, stale_partition_cols_message, table_partition_cols
+from sec_fs_metrics.metrics import Metrics
+
+
+def table_num_buckets(spark, table: str):
+    """
+    Return the number of buckets of an existing table, None if it isn't bucketed
+    """
+    for row in spark.sql("DESCRIBE TABLE EXTENDED {}".format(table)).collect():
+        if row.col_name == "Num Buckets":
+            return int(row.data_type)
+    return None
+
+
+def set_checkpoint_dir(spark, temp_dir: str):
+    """
+    Store the checkpoints of the upserted tables under temp_dir, the temporary directory of the job
+    """
+    spark.sparkContext.setCheckpointDir(temp_dir.rstrip("/")+"/checkpoints/")
+
+
+def layout(data_frame, plan: dict, partition_cols: List[str], sort_cols: List[str], bucket_cols: List[str] = None, num_buckets: int = None):
+    """
+    Gather the rows of each output file in a single shuffle partition, so that each file is written by a single task,
+    and sort them so that the min/max statistics of the row groups can prune on sort_cols
+    """
+    if num_buckets:
+        # Same bucket id as the one Spark computes when writing a bucketed table
+        file_id = F.expr("pmod(hash({}), {})".format(", ".join(bucket_cols), num_buckets))
+    elif plan["files_per_partition"] > 1:
+        file_id = F.pmod(F.hash(*data_frame.columns), F.lit(plan["files_per_partition"]))
+    else:
+        file_id = F.lit(0)
+    # The writer expects the rows ordered by partition (and bucket), the sort columns come after
+    return data_frame.repartition(plan["shuffle_partitions"], *partition_cols, file_id)\
+        .sortWithinPartitions(*partition_cols, *([file_id] if num_buckets else []), *sort_cols)
+
+
+def transform_table(spark, s3_client, options: dict, raw_files: Dict[str, dict] = None, metrics: Metrics = None):
+    """
+    Ingest the raw files of a table into it, then archive them. options holds the COMMON_OPTIONS and TABLE_OPTIONS,
+    raw_files the listing of the raw files when it was already done.
+    The table is measured as a "table" stage in metrics, along with the stages of each batch.
+    """
+    table = options["database"]+"."+options["table_name"]
+    def log(message):
+        print("[{}] {}".format(options["table_name"], message))
+
+    metrics = (metrics or Metrics()).with_labels(table=options["table_name"])
+    metrics.instrument(s3_client)
+    with metrics.stage("table") as table_stage:
+        # With the overwrite_partitions write mode, the partitions of the ingested files are replaced, the others are left untouched.
+        # The setting only matters for partitioned tables, so it can be shared by the tables processed in the same session.
+        if options["write_mode"] == "overwrite_partitions":
+            spark.conf.set("spark.sql.sources.partitionOverwriteMode", "dynamic")
+
+        partition_cols = table_partition_cols(options)
+        sort_cols = [col for col in options["sort_cols"].split(",") if col]
+
+        # The collector writes the raw files either as tab-separated text or as Parquet, depending on its output format
+        if raw_files is None:
+            with metrics.stage("list") as stage:
+                raw_files = list_raw_files(s3_client, options["s3_bucket"], options["raw_s3_prefix"])
+                stage.bytes = sum(raw_file["size"] for raw_file in raw_files.values())
+        file_names = list(raw_files)
+
+        table_exists = spark.catalog._jcatalog.tableExists(options["database"], options["table_name"])
+        if table_exists:
+            # insertInto matches the columns by position, the partition columns of the table have to be the expected ones
+            catalog_partition_cols = [column.name for column in spark.catalog.listColumns(options["table_name"], options["database"]) if column.isPartition]
+            if catalog_partition_cols != partition_cols:
+                raise RuntimeError(stale_partition_cols_message(table, catalog_partition_cols, partition_cols))
+            # insertInto would cast the typed columns back to the types of the table
+            stale = stale_columns(options["table_name"], dict(spark.table(table).dtypes))
+            if stale:
+                raise RuntimeError(stale_columns_message(table, stale))
+
+        # Files are only ingested once. The ledger tells which ones already were without querying the table.
+        # When partitions are overwritten, a file whose content changed since (e.g. re-collected) is ingested again to replace its partition
+        if options["write_mode"] in ("append", "overwrite_partitions"):
+            ledger_s3_key = ledger_key(options["ledger_s3_prefix"], options["table_name"])
+            ledger = load_ledger(s3_client, options["s3_bucket"], ledger_s3_key)
+            if ledger is None:
+                ledger = new_ledger(options["table_name"])
+                if table_exists:
+                    # Tables written before the ledger existed are scanned once to build it
+                    record_file_names(ledger, [row.original_file_name for row in spark.table(table).select("original_file_name").distinct().collect()])
+            if options["write_mode"] == "overwrite_partitions":
+                new_file_names = [file_name for file_name in file_names if not is_ingested(ledger, file_name, raw_files[file_name]["etag"])]
+            else:
+                new_file_names = [file_name for file_name in file_names if not is_ingested(ledger, file_name)]
+        else:
+            new_file_names = file_names
+
+        # Bucket files should land near target_file_bytes. The number of buckets is fixed when the table is created,
+        # from the size of the files which create it (e.g. a whole catchup), unless num_clusters sets it.
+        target_file_bytes = int(options["target_file_bytes"])
+        bucket_cols = options["cluster_cols"].split(",") if options["cluster_table"] == "true" else []
+        num_buckets = None
+        if bucket_cols:
+            if table_exists:
+                num_buckets = table_num_buckets(spark, table)
+            elif options["num_clusters"] == "auto":
+                new_files = {file_name: raw_files[file_name] for file_name in new_file_names}
+                num_buckets = plan_buckets(new_files, len({partition_values(file_name, partition_cols) for file_name in new_file_names}), target_file_bytes)
+            else:
+                num_buckets = int(options["num_clusters"])
+
+        def plan_files(file_names):
+            plan = plan_write({file_name: raw_files[file_name] for file_name in file_names}, len({partition_values(file_name, partition_cols) for file_name in file_names}), num_buckets, target_file_bytes)
+            log("Planned {} files per partition over {} shuffle partitions for about {} bytes of Parquet".format(plan["files_per_partition"], plan["shuffle_partitions"], plan["estimated_bytes"]))
+            return plan
+
+        def read_raw_files(file_names):
+            parquet_paths = ["s3://{}/{}".format(options["s3_bucket"], raw_files[file_name]["key"]) for file_name in file_names if file_name.endswith(".parquet")]
+            text_paths = ["s3://{}/{}".format(options["s3_bucket"], raw_files[file_name]["key"]) for file_name in file_names if not file_name.endswith(".parquet")]
+
+            data_frames = []
+            if text_paths:
+                data_frames.append(spark.read.format("csv").option("header", "true").option("sep", "\t").option("mode", CSV_READ_MODES[options["malformed_rows"]]).load(text_paths))
+            if parquet_paths:
+                data_frames.append(spark.read.parquet(*parquet_paths))
+            data_frame = reduce(lambda left, right: left.unionByName(right, allowMissingColumns=True), data_frames)
+
+            data_frame = data_frame.withColumn("original_file_name", F.element_at(F.split(F.input_file_name(),"/"), -1))
+            # The raw files are read as strings, the columns are given their actual types so that Athena can prune on their statistics
+            data_frame = apply_schema(data_frame, options["table_name"], options["malformed_rows"])
+            if "original_file_year" in partition_cols:
+                data_frame = data_frame.withColumn("original_file_year", F.element_at(F.split(F.col("original_file_name"), "q"), 1))
+            if "original_file_quarter" in partition_cols:
+                data_frame = data_frame.withColumn("original_file_quarter", F.regexp_extract(F.col("original_file_name"), r"^\d{4}q([1-4])", 1))
+            return data_frame
+
+        def upsert_table(data_frame, file_names):
+            """
+            Merge data_frame into the existing table on the merge keys. Rows with new keys are appended, and the table
+            is only rewritten when the rows of existing keys changed, which is rare for a dimension like fs_tag.
+            """
+            keys = options["merge_keys"].split(",")
+            existing = spark.table(table)
+            compared_cols = [col for col in existing.columns if not col.startswith("original_file_")]
+
+            data_frame = data_frame.dropDuplicates(keys)
+            # Rows which aren't in the table as they are, either because their key is new or because they changed
+            incoming = data_frame.join(data_frame.select(compared_cols).subtract(existing.select(compared_cols)).select(keys), keys, "left_semi")
+            changed_keys = incoming.select(keys).join(existing.select(keys), keys, "left_semi")
+            with metrics.stage("dedup"):
+                up_to_date = incoming.isEmpty()
+                only_new_keys = up_to_date or changed_keys.isEmpty()
+            if up_to_date:
+                log("{} is already up to date".format(table))
+                return
+            if only_new_keys:
+                log("Appending the new keys of {}".format(table))
+                incoming.select(existing.columns).write.insertInto(table, overwrite=False)
+            else:
+                log("Rewriting {} to replace the changed keys".format(table))
+                # The merged rows are materialized so that the table can be overwritten while it is read. They are checkpointed
+                # to the checkpoint directory on S3, as local checkpoints are lost with the executors removed by auto scaling.
+                merged = existing.join(changed_keys, keys, "left_anti").unionByName(incoming.select(existing.columns))
+                merged = layout(merged, plan_files(file_names), partition_cols, sort_cols, bucket_cols, num_buckets).checkpoint(eager=True)
+                merged.write.insertInto(table, overwrite=True)
+
+        def write_table(data_frame, table_exists):
+            # The parameter --enable-glue-datacatalog should be set to "true". It allows us to write into the Glue Datacolog using the Spark Session
+            if table_exists:
+                data_frame.write.insertInto(table, overwrite=options["write_mode"] in ("overwrite", "overwrite_partitions"))
+            else:
+                writer = data_frame.write.option("path", options["table_s3a_location"])\
+                    .format("parquet").mode("overwrite" if options["write_mode"] == "overwrite" else "append")
+                if partition_cols:
+                    writer = writer.partitionBy(*partition_cols)
+                if num_buckets:
+                    writer = writer.bucketBy(num_buckets, bucket_cols)
+                    if sort_cols:
+                        # Recorded in the table, so that every later write sorts its bucket files as well
+                        writer = writer.sortBy(*sort_cols)
+                writer.saveAsTable(table)
+
+        # The batches are planned from the S3 listing so that no batch reads more than max_batch_bytes, the input is never cached.
+        # An overwritten or upserted table has to be written at once.
+        if options["write_mode"] in ("overwrite", "upsert"):
+            batches = [sorted(new_file_names)] if new_file_names else []
+        else:
+            batches = plan_batches({file_name: raw_files[file_name] for file_name in new_file_names}, int(options["max_batch_bytes"]))
+
+        for batch_number, batch in enumerate(batches, start=1):
+            batch_bytes = sum(raw_files[file_name]["size"] for file_name in batch)
+            log("Ingesting batch {}/{}: {} ({} bytes)".format(batch_number, len(batches), ", ".join(batch), batch_bytes))
+            # Spark reads the files lazily: the read stage only covers their listing and headers, the write stage reads their rows
+            with metrics.stage("read", batch=batch_number) as stage:
+                data_frame = read_raw_files(batch)
+                stage.bytes = batch_bytes
+            with metrics.stage("write", batch=batch_number) as stage:
+                stage.bytes = batch_bytes
+                if options["write_mode"] == "upsert" and table_exists:
+                    upsert_table(data_frame, batch)
+                else:
+                    write_table(layout(data_frame, plan_files(batch), partition_cols, sort_cols, bucket_cols, num_buckets), table_exists)
+            with metrics.stage("stats", batch=batch_number) as stage:
+                # The raw rows of the batch are read again by a single aggregation grouped by file, whose expressions grow with
+                # the columns and not with the files of the batch
+                stats_exprs, stats_names = spark_stats_exprs(data_frame, options["table_name"])
+                stats_rows = [row.asDict() for row in data_frame.groupBy("original_file_name").agg(*stats_exprs).collect()]
+                stats_records = spark_stats_records(stats_rows, stats_names, options["table_name"], raw_files, partition_cols)
+                save_stats(s3_client, options["s3_bucket"], options["stats_s3_prefix"], stats_records)
+                stage.rows = sum({record["file_name"]: record["row_count"] for record in stats_records}.values())
+            table_stage.bytes = (table_stage.bytes or 0) + batch_bytes
+            table_exists = True
+
+            if options["write_mode"] in ("append", "overwrite_partitions"):
+                # Only once the write has succeeded, so that a failing run resumes from the batch which failed
+                record_files(ledger, {file_name: {"size": raw_files[file_name]["size"], "etag": raw_files[file_name]["etag"]} for file_name in batch})
+                save_ledger(s3_client, options["s3_bucket"], ledger_s3_key, ledger)
+
+        # Archive the source data files
+        with metrics.stage("archive") as stage:
+            archive_results = archive_files(s3_client, options["s3_bucket"], {file_name: raw_files[file_name] for file_name in file_names}, options["archive_s3_prefix"])
+            stage.bytes = sum(raw_files[file_name]["size"] for file_name in file_names)
+        for result in archive_results:
+            log("Archived {} to {}".format(result["source_key"], result["archive_key"]) if result["error"] is None else "Failed to archive {}: {}".format(result["source_key"], result["error"]))
+        failed_archives = [result["file_name"] for result in archive_results if result["error"] is not None]
+        if failed_archives:
+            raise RuntimeError("Failed to archive the files {}".format(", ".join(failed_archives)))
+
+
+def for_each_table(spark, tables: List[dict], function, description: str, max_workers: int = 4) -> Dict[str, Exception]:
+    """
+    Call function(table) for each table, with up to max_workers of them submitting Spark jobs concurrently, in the order of tables.
+    A failing table doesn't stop the others, the errors are returned by table name once every table has been handled.
+    """
+    def run(table):
+        # Labels the Spark jobs of the table in the Spark UI
+        spark.sparkContext.setJobGroup(table["table_name"], "{} {}".format(description, table["table_name"]))
+        function(table)
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run, table): table["table_name"] for table in tables}
+        for future in as_completed(futures):
+            error = future.exception()
+            if error is not None:
+                failures[futures[future]] = error
+                print("Failed to {} {}:\n{}".format(description.lower(), futures[future], "".join(traceback.format_exception(type(error), error, error.__traceback__))))
+            else:
+                print("{} {} succeeded".format(description, futures[future]))
+    return failures
+
+
+def transform_tables(spark, s3_client, common_options: dict, tables: List[dict], max_workers: int = 4, metrics: Metrics = None) -> Dict[str, Exception]:
+    """
+    Transform several tables in the same Spark session, with up to max_workers of them submitting jobs concurrently.
+    The tables with the most raw bytes start first, so that the small ones fill the cluster around them.
+    """
+    metrics = metrics or Metrics()
+    metrics.instrument(s3_client)
+    raw_files = {}
+    for table in tables:
+        with metrics.stage("list", table=table["table_name"]) as stage:
+            raw_files[table["table_name"]] = list_raw_files(s3_client, common_options["s3_bucket"], table["raw_s3_prefix"])
+            stage.bytes = sum(raw_file["size"] for raw_file in raw_files[table["table_name"]].values())
+    tables = sorted(tables, key=lambda table: sum(raw_file["size"] for raw_file in raw_files[table["table_name"]].values()), reverse=True)
+    return for_each_table(
+        spark,
+        tables,
+        lambda table: transform_table(spark, s3_client, {**common_options, **table}, raw_files=raw_files[table["table_name"]], metrics=metrics),
+        "Transform",
+        max_workers
+    )
@@ -0,0 +1,7 @@
+from setuptools import setup
+
+setup(
+    name="sec_fs_dataset_transformer",
+    version="0.1",
+    packages=['sec_fs_dataset_transformer']
+)
@@ -0,0 +1,210 @@
+"""
+This module measures the stages of the collector and of the transform: their duration, the bytes and rows they
+processed and the S3 calls they made, and hands each measure to a sink.
+
+The CloudWatch sink publishes the measures with PutMetricData. The EMF sink prints them in the Embedded Metric Format,
+which CloudWatch Logs only turns into metrics for log groups ingesting it, which the Glue job log groups don't.
+The JSON-lines sink appends them to a local file, for local runs.
+"""
+
+import atexit
+import contextlib
+import contextvars
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Iterator
+
+DEFAULT_NAMESPACE = "SecFsDatasets"
+# Labels used as CloudWatch dimensions when a measure has them. The others, like the quarter, are kept as properties
+# of the log event so that they can be queried with CloudWatch Logs Insights without creating a metric each.
+EMF_DIMENSIONS = ("job", "stage", "table", "member")
+EMF_METRICS = {
+    "duration_ms": "Milliseconds",
+    "bytes": "Bytes",
+    "rows": "Count",
+    "s3_calls": "Count",
+}
+
+# Most metric values PutMetricData accepts per request
+MAX_METRIC_DATA = 1000
+
+# Stages in progress, innermost last, to which the S3 calls are counted. Threads started by a stage count their calls
+# to it when they run in a copy of its context (e.g. executor.submit(contextvars.copy_context().run, function)).
+_active_stages = contextvars.ContextVar("sec_fs_metrics_active_stages", default=())
+
+
+class NullSink:
+    def emit(self, measure: dict):
+        pass
+
+
+class JsonLinesSink:
+    """
+    Append each measure as a JSON line to path
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, measure: dict):
+        with self._lock, open(self.path, mode="a") as file:
+            file.write(json.dumps(measure, default=str) + "\n")
+
+
+class EmfSink:
+    """
+    Print each measure to stdout in the CloudWatch Embedded Metric Format
+    """
+
+    def __init__(self, namespace: str = DEFAULT_NAMESPACE, stream=None):
+        self.namespace = namespace
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def emit(self, measure: dict):
+        metrics = [{"Name": name, "Unit": unit} for name, unit in EMF_METRICS.items() if measure.get(name) is not None]
+        event = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [[dimension for dimension in EMF_DIMENSIONS if dimension in measure]],
+                    "Metrics": metrics,
+                }],
+            },
+            **{name: value for name, value in measure.items() if value is not None},
+        }
+        with self._lock:
+            self.stream.write(json.dumps(event, default=str) + "\n")
+            self.stream.flush()
+
+
+class CloudWatchSink:
+    """
+    Publish each measure as CloudWatch metrics, with the EMF_DIMENSIONS of the measure as dimensions.
+    The metrics are sent in batches, the last one when the process exits.
+    """
+
+    def __init__(self, namespace: str = DEFAULT_NAMESPACE, cloudwatch_client=None, batch_size: int = MAX_METRIC_DATA):
+        if cloudwatch_client is None:
+            import boto3
+            cloudwatch_client = boto3.Session().client("cloudwatch")
+        self.namespace = namespace
+        self.cloudwatch_client = cloudwatch_client
+        self.batch_size = batch_size
+        self._metric_data = []
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def emit(self, measure: dict):
+        timestamp = datetime.now(timezone.utc)
+        dimensions = [{"Name": dimension, "Value": str(measure[dimension])} for dimension in EMF_DIMENSIONS if measure.get(dimension) is not None]
+        with self._lock:
+            self._metric_data.extend(
+                {"MetricName": name, "Dimensions": dimensions, "Timestamp": timestamp, "Value": measure[name], "Unit": unit}
+                for name, unit in EMF_METRICS.items() if measure.get(name) is not None
+            )
+            self._send(full_batches_only=True)
+
+    def flush(self):
+        with self._lock:
+            self._send()
+
+    def _send(self, full_batches_only: bool = False):
+        while len(self._metric_data) >= (self.batch_size if full_batches_only else 1):
+            batch, self._metric_data = self._metric_data[:self.batch_size], self._metric_data[self.batch_size:]
+            self.cloudwatch_client.put_metric_data(Namespace=self.namespace, MetricData=batch)
+
+
+def sink_from_uri(uri: str):
+    """
+    Return the sink described by uri: "cloudwatch" or "cloudwatch:<namespace>" for CloudWatch metrics, "emf" or
+    "emf:<namespace>" for log events in the Embedded Metric Format, "jsonl:<path>" for a local file, "none" to drop the measures
+    """
+    kind, _, argument = (uri or "none").partition(":")
+    if kind == "cloudwatch":
+        return CloudWatchSink(argument or DEFAULT_NAMESPACE)
+    if kind == "emf":
+        return EmfSink(argument or DEFAULT_NAMESPACE)
+    if kind == "jsonl" and argument:
+        return JsonLinesSink(argument)
+    if kind == "none":
+        return NullSink()
+    raise ValueError("Unknown metrics sink {}, expected cloudwatch, cloudwatch:<namespace>, emf, emf:<namespace>, jsonl:<path> or none".format(uri))
+
+
+class Stage:
+    """
+    Measure of a stage in progress. bytes and rows are set by the code being measured, S3 calls are counted
+    from the instrumented clients.
+    """
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        self.bytes = None
+        self.rows = None
+        self.s3_calls = 0
+        self._lock = threading.Lock()
+
+    def count_s3_call(self):
+        with self._lock:
+            self.s3_calls += 1
+
+    def measure(self, duration: float, status: str) -> dict:
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            **self.labels,
+            "stage": self.name,
+            "status": status,
+            "duration_ms": round(duration * 1000, 1),
+            "bytes": self.bytes,
+            "rows": self.rows,
+            "s3_calls": self.s3_calls,
+        }
+
+
+class Metrics:
+    """
+    Measure stages and emit them to sink, with labels added to every measure (e.g. the job name)
+    """
+
+    def __init__(self, sink=None, **labels):
+        self.sink = sink or NullSink()
+        self.labels = labels
+
+    def with_labels(self, **labels) -> "Metrics":
+        return Metrics(self.sink, **{**self.labels, **labels})
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **labels) -> Iterator[Stage]:
+        """
+        Measure the block as the stage name. The measure is emitted whether the block succeeds or fails.
+        """
+        stage = Stage(name, {**self.labels, **labels})
+        token = _active_stages.set(_active_stages.get() + (stage,))
+        start = time.perf_counter()
+        status = "failed"
+        try:
+            yield stage
+            status = "succeeded"
+        finally:
+            _active_stages.reset(token)
+            self.sink.emit(stage.measure(time.perf_counter() - start, status))
+
+    def instrument(self, s3_client):
+        """
+        Count the calls made by s3_client to the stages in progress where they are made
+        """
+        s3_client.meta.events.register("before-call.s3", _count_s3_call, unique_id="sec_fs_metrics.count_s3_call")
+        return s3_client
+
+
+def _count_s3_call(**kwargs):
+    # Stages enclosing others count their calls as well
+    for stage in _active_stages.get():
+        stage.count_s3_call()
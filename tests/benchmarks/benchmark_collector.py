@@ -0,0 +1,60 @@
+"""
+Benchmark of handle_quarter against synthetic archives served locally and a moto S3 server.
+
+    python -m tests.benchmarks.benchmark_collector --quarters 2 --scale 0.05 --output bench_collector.jsonl
+"""
+
+import argparse
+import os
+import tempfile
+
+from tests.benchmarks.harness import BENCHMARK_BUCKET, Report, add_libraries_to_path, moto_s3_server, prefix_size
+from tests.benchmarks.synthetic_sec_dataset import consecutive_quarters, generate_dataset
+from tests.utils import serve_directory
+
+MODES = {
+    "buffered_txt": {"streaming": False, "output_format": "txt"},
+    "streaming_txt": {"streaming": True, "output_format": "txt"},
+    "buffered_parquet": {"streaming": False, "output_format": "parquet"},
+    "streaming_parquet": {"streaming": True, "output_format": "parquet"},
+    "ranged_txt": {"ranged": True, "output_format": "txt"},
+    "ranged_sub_num_txt": {"ranged": True, "output_format": "txt", "members": ["sub.txt", "num.txt"]},
+}
+
+
+def run(quarters: int, scale: float, modes, output: str = None, stage_metrics: str = None) -> Report:
+    add_libraries_to_path()
+    import boto3
+    from sec_fs_dataset_collector.collect_sec_fs_datasets import handle_quarter
+    from sec_fs_metrics.metrics import Metrics, sink_from_uri
+
+    metrics = Metrics(sink_from_uri("jsonl:"+stage_metrics if stage_metrics else "none"), job="benchmark_collector")
+
+    report = Report(output)
+    with tempfile.TemporaryDirectory() as path:
+        with report.stage("generate", quarters=quarters, scale=scale) as stage:
+            archives = generate_dataset(path, consecutive_quarters(quarters), scale=scale)
+            stage.bytes = sum(os.path.getsize(archive) for archive in archives)
+
+        with serve_directory(path) as source_url, moto_s3_server():
+            s3_client = boto3.Session().client("s3")
+            for mode in modes:
+                for archive in archives:
+                    year, quarter = os.path.basename(archive)[:-len(".zip")].split("q")
+                    s3_prefix_dest = "BENCHMARK/{}/".format(mode)
+                    with report.stage("collect", mode=mode, quarter="{}q{}".format(year, quarter), scale=scale) as stage:
+                        handle_quarter(year=year, quarter=quarter, s3_bucket=BENCHMARK_BUCKET, s3_prefix_dest=s3_prefix_dest, source_url=source_url, metrics=metrics.with_labels(mode=mode), **MODES[mode])
+                        stage.bytes = os.path.getsize(archive)
+                report.add({"stage": "collect_output", "mode": mode, "bytes": prefix_size(s3_client, BENCHMARK_BUCKET, "BENCHMARK/{}/".format(mode))})
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quarters", type=int, default=2)
+    parser.add_argument("--scale", type=float, default=0.01)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--output", help="JSON-lines file to which the results are appended")
+    parser.add_argument("--stage-metrics", help="JSON-lines file to which the collector appends the measures of its stages")
+    arguments = parser.parse_args()
+    run(arguments.quarters, arguments.scale, arguments.modes, arguments.output, arguments.stage_metrics)
@@ -0,0 +1,275 @@
+"""
+Benchmark of transform_sec_fs_dataset.py, or of transform_sec_fs_datasets.py with --multi-table, in local-mode PySpark, reading from and writing to a moto S3 server
+through s3a. The raw files are collected beforehand from synthetic archives served locally.
+The awsglue modules available in Glue jobs are replaced by a minimal local equivalent.
+
+With --engine arrow, arrow_transform_sec_fs_datasets.py transforms the tables instead, without PySpark. The tables it
+writes into are registered in the Glue Data Catalog of the moto server beforehand, the way the Spark transform creates them.
+
+    python -m tests.benchmarks.benchmark_transform --quarters 4 --scale 0.05 --output bench_transform.jsonl
+    python -m tests.benchmarks.benchmark_transform --engine arrow --quarters 4 --scale 0.05
+"""
+
+import argparse
+import glob
+import json
+import os
+import runpy
+import sys
+import tempfile
+import types
+
+from tests.benchmarks.harness import BENCHMARK_BUCKET, JOB_SCRIPTS_PATH, Report, add_libraries_to_path, moto_s3_server, prefix_size
+from tests.benchmarks.synthetic_sec_dataset import NUM_COLUMNS, PRE_COLUMNS, SUB_COLUMNS, TAG_COLUMNS, consecutive_quarters, generate_dataset
+from tests.utils import serve_directory
+
+DATABASE = "sec_fs_benchmark"
+
+# Arguments of the transform jobs, as defined in AnalyzeSecAwsStack
+TABLES = {
+    "fs_sub": {"sub_folder": "FS_SUB", "sort_cols": "adsh", "write_mode": "overwrite_partitions", "cluster_table": "true", "partition": "true", "partition_quarter": "true"},
+    "fs_num": {"sub_folder": "FS_NUM", "sort_cols": "adsh,tag,ddate", "write_mode": "overwrite_partitions", "cluster_table": "true", "partition": "true", "partition_quarter": "true"},
+    "fs_pre": {"sub_folder": "FS_PRE", "sort_cols": "adsh,report,line", "write_mode": "overwrite_partitions", "cluster_table": "true", "partition": "true", "partition_quarter": "true"},
+    "fs_tag": {"sub_folder": "FS_TAG", "sort_cols": "tag,version", "write_mode": "upsert", "merge_keys": "tag,version", "cluster_table": "false", "partition": "false", "partition_quarter": "false"},
+}
+
+# Columns of the raw files of each table
+RAW_COLUMNS = {"fs_sub": SUB_COLUMNS, "fs_num": NUM_COLUMNS, "fs_pre": PRE_COLUMNS, "fs_tag": TAG_COLUMNS}
+# Names given by Spark to the types of the schemas, in the schema it records in the catalog
+SPARK_TYPE_NAMES = {"int": "integer"}
+
+
+def common_arguments(metrics_sink: str = "none") -> dict:
+    return {
+        "s3_bucket": BENCHMARK_BUCKET,
+        "database": DATABASE,
+        "ledger_s3_prefix": "DATA/LEDGER/",
+        "max_batch_bytes": str(8 * 1024 * 1024 * 1024),
+        "target_file_bytes": str(256 * 1024 * 1024),
+        "metrics_sink": metrics_sink,
+        "stats_s3_prefix": "DATA/STATS/",
+        "TempDir": "s3a://{}/temporary/".format(BENCHMARK_BUCKET),
+    }
+
+
+def table_arguments(table_name: str) -> dict:
+    table = TABLES[table_name]
+    return {
+        "archive_s3_prefix": "DATA/ARCHIVE/{}/".format(table["sub_folder"]),
+        "cluster_cols": "adsh",
+        "cluster_table": table["cluster_table"],
+        "num_clusters": "auto",
+        "partition_by_file_year": table["partition"],
+        "partition_by_file_quarter": table["partition_quarter"],
+        "raw_s3_prefix": "DATA/RAW/{}/".format(table["sub_folder"]),
+        "table_name": table_name,
+        "table_s3a_location": "s3a://{}/DATA/TRANSFORM/{}/".format(BENCHMARK_BUCKET, table["sub_folder"]),
+        "write_mode": table["write_mode"],
+        "malformed_rows": "permissive",
+        "merge_keys": table.get("merge_keys", ""),
+        "sort_cols": table["sort_cols"],
+    }
+
+
+def install_local_glue():
+    """
+    Register the awsglue modules used by the job scripts, backed by the local SparkSession
+    """
+    def getResolvedOptions(argv, options):
+        values = {}
+        for index, argument in enumerate(argv):
+            if argument.startswith("--") and argument[2:] in options:
+                values[argument[2:]] = argv[index + 1]
+        missing = [option for option in options if option not in values]
+        if missing:
+            raise ValueError("Missing job arguments {}".format(missing))
+        return values
+
+    class GlueContext:
+        def __init__(self, spark_context):
+            from pyspark.sql import SparkSession
+
+            self.spark_session = SparkSession.builder.getOrCreate()
+
+    class Job:
+        def __init__(self, glue_context):
+            pass
+
+        def init(self, job_name, args=None):
+            pass
+
+        def commit(self):
+            pass
+
+    modules = {
+        "awsglue": types.ModuleType("awsglue"),
+        "awsglue.utils": types.ModuleType("awsglue.utils"),
+        "awsglue.context": types.ModuleType("awsglue.context"),
+        "awsglue.job": types.ModuleType("awsglue.job"),
+    }
+    modules["awsglue.utils"].getResolvedOptions = getResolvedOptions
+    modules["awsglue.context"].GlueContext = GlueContext
+    modules["awsglue.job"].Job = Job
+    sys.modules.update(modules)
+
+
+def hadoop_version() -> str:
+    import pyspark
+
+    jars = glob.glob(os.path.join(os.path.dirname(pyspark.__file__), "jars", "hadoop-client-api-*.jar"))
+    return os.path.basename(jars[0])[len("hadoop-client-api-"):-len(".jar")]
+
+
+def local_spark_session(endpoint: str, warehouse: str):
+    from pyspark.sql import SparkSession
+
+    return SparkSession.builder.master("local[*]").appName("sec_fs_benchmark")\
+        .config("spark.jars.packages", "org.apache.hadoop:hadoop-aws:{}".format(hadoop_version()))\
+        .config("spark.sql.warehouse.dir", warehouse)\
+        .config("spark.hadoop.fs.s3.impl", "org.apache.hadoop.fs.s3a.S3AFileSystem")\
+        .config("spark.hadoop.fs.s3a.endpoint", endpoint)\
+        .config("spark.hadoop.fs.s3a.path.style.access", "true")\
+        .config("spark.hadoop.fs.s3a.connection.ssl.enabled", "false")\
+        .config("spark.hadoop.fs.s3a.access.key", os.environ["AWS_ACCESS_KEY_ID"])\
+        .config("spark.hadoop.fs.s3a.secret.key", os.environ["AWS_SECRET_ACCESS_KEY"])\
+        .getOrCreate()
+
+
+def run_job_script(script_name: str, arguments: dict):
+    sys.argv = [script_name] + [item for name, value in arguments.items() for item in ("--"+name, value)]
+    runpy.run_path(os.path.join(JOB_SCRIPTS_PATH, script_name), run_name="__main__")
+
+
+def create_catalog_table(glue_client, s3_client, table_name: str, partitions: int):
+    """
+    Register table_name in the Glue Data Catalog like the Spark transform creates it: its schema and buckets are
+    recorded in the parameters of the table, and its ledger is empty
+    """
+    from sec_fs_dataset_transformer.ledger import ledger_key, new_ledger, save_ledger
+    from sec_fs_dataset_transformer.planning import plan_buckets
+    from sec_fs_dataset_transformer.schemas import TABLE_SCHEMAS
+    from sec_fs_dataset_transformer.tables import list_raw_files, table_partition_cols
+
+    arguments = {**common_arguments(), **table_arguments(table_name)}
+    partition_cols = table_partition_cols(arguments)
+    types = TABLE_SCHEMAS[table_name]
+    fields = [(column, SPARK_TYPE_NAMES.get(types.get(column, "string"), types.get(column, "string"))) for column in RAW_COLUMNS[table_name]]
+    fields += [("original_file_name", "string")] + [(column, "string") for column in partition_cols]
+    schema = {"type": "struct", "fields": [{"name": name, "type": field_type, "nullable": True, "metadata": {}} for name, field_type in fields]}
+    parameters = {"spark.sql.sources.provider": "parquet", "spark.sql.sources.schema.numParts": "1", "spark.sql.sources.schema.part.0": json.dumps(schema)}
+    if arguments["cluster_table"] == "true":
+        raw_files = list_raw_files(s3_client, BENCHMARK_BUCKET, arguments["raw_s3_prefix"])
+        parameters.update({
+            "spark.sql.sources.schema.numBuckets": str(plan_buckets(raw_files, partitions, int(arguments["target_file_bytes"]))),
+            "spark.sql.sources.schema.numBucketCols": "1",
+            "spark.sql.sources.schema.bucketCol.0": arguments["cluster_cols"],
+        })
+    location = arguments["table_s3a_location"]
+    glue_client.create_table(DatabaseName=DATABASE, TableInput={
+        "Name": table_name,
+        "Parameters": parameters,
+        "PartitionKeys": [{"Name": column, "Type": "string"} for column in partition_cols],
+        "StorageDescriptor": {
+            "Columns": [{"Name": "col", "Type": "array<string>"}],
+            "Location": location+"-__PLACEHOLDER__",
+            "InputFormat": "org.apache.hadoop.mapred.SequenceFileInputFormat",
+            "OutputFormat": "org.apache.hadoop.hive.ql.io.HiveSequenceFileOutputFormat",
+            "SerdeInfo": {"SerializationLibrary": "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe", "Parameters": {"path": location}},
+        },
+    })
+    save_ledger(s3_client, BENCHMARK_BUCKET, ledger_key(arguments["ledger_s3_prefix"], table_name), new_ledger(table_name))
+
+
+def parquet_rows(s3_client, bucket: str, prefix: str) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    return sum(
+        pq.read_metadata(pa.BufferReader(s3_client.get_object(Bucket=bucket, Key=obj["Key"])["Body"].read())).num_rows
+        for page in s3_client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix)
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith(".parquet")
+    )
+
+
+def run_arrow(quarters: int, scale: float, tables, report: Report, metrics_sink: str):
+    """
+    Transform the collected raw files with the PyArrow transform, into tables registered beforehand
+    """
+    import boto3
+
+    s3_client = boto3.Session().client("s3")
+    glue_client = boto3.Session().client("glue")
+    glue_client.create_database(DatabaseInput={"Name": DATABASE})
+    for table_name in tables:
+        create_catalog_table(glue_client, s3_client, table_name, quarters)
+    install_local_glue()
+    with report.stage("transform", engine="arrow", table=",".join(tables), quarters=quarters, scale=scale) as stage:
+        stage.bytes = prefix_size(s3_client, BENCHMARK_BUCKET, "DATA/RAW/")
+        run_job_script("arrow_transform_sec_fs_datasets.py", {**common_arguments(metrics_sink), "tables": json.dumps([table_arguments(table_name) for table_name in tables])})
+    for table_name in tables:
+        prefix = "DATA/TRANSFORM/{}/".format(TABLES[table_name]["sub_folder"])
+        report.add({
+            "stage": "transform_output",
+            "engine": "arrow",
+            "table": table_name,
+            "rows": parquet_rows(s3_client, BENCHMARK_BUCKET, prefix),
+            "bytes": prefix_size(s3_client, BENCHMARK_BUCKET, prefix),
+        })
+
+
+def run(quarters: int, scale: float, tables, multi_table: bool = False, output: str = None, stage_metrics: str = None, engine: str = "spark") -> Report:
+    add_libraries_to_path()
+    import boto3
+    from sec_fs_dataset_collector.collect_sec_fs_datasets import handle_quarters
+
+    report = Report(output)
+    metrics_sink = "jsonl:"+stage_metrics if stage_metrics else "none"
+    with tempfile.TemporaryDirectory() as path:
+        with report.stage("generate", quarters=quarters, scale=scale) as stage:
+            archives = generate_dataset(os.path.join(path, "archives"), consecutive_quarters(quarters), scale=scale)
+            stage.bytes = sum(os.path.getsize(archive) for archive in archives)
+
+        with serve_directory(os.path.join(path, "archives")) as source_url, moto_s3_server() as endpoint:
+            s3_client = boto3.Session().client("s3")
+            with report.stage("collect", quarters=quarters, scale=scale) as stage:
+                handle_quarters([(str(year), str(quarter)) for year, quarter in consecutive_quarters(quarters)], BENCHMARK_BUCKET, "DATA/RAW/", source_url, streaming=True)
+                stage.bytes = prefix_size(s3_client, BENCHMARK_BUCKET, "DATA/RAW/")
+
+            if engine == "arrow":
+                run_arrow(quarters, scale, tables, report, metrics_sink)
+                return report
+            spark = local_spark_session(endpoint, os.path.join(path, "warehouse"))
+            spark.sql("CREATE DATABASE IF NOT EXISTS {}".format(DATABASE))
+            install_local_glue()
+            if multi_table:
+                with report.stage("transform", table=",".join(tables), quarters=quarters, scale=scale) as stage:
+                    stage.bytes = prefix_size(s3_client, BENCHMARK_BUCKET, "DATA/RAW/")
+                    run_job_script("transform_sec_fs_datasets.py", {**common_arguments(metrics_sink), "tables": json.dumps([table_arguments(table_name) for table_name in tables]), "max_concurrent_tables": "4"})
+            else:
+                for table_name in tables:
+                    with report.stage("transform", table=table_name, quarters=quarters, scale=scale) as stage:
+                        stage.bytes = prefix_size(s3_client, BENCHMARK_BUCKET, "DATA/RAW/{}/".format(TABLES[table_name]["sub_folder"]))
+                        run_job_script("transform_sec_fs_dataset.py", {**common_arguments(metrics_sink), **table_arguments(table_name)})
+            for table_name in tables:
+                report.add({
+                    "stage": "transform_output",
+                    "table": table_name,
+                    "rows": spark.table("{}.{}".format(DATABASE, table_name)).count(),
+                    "bytes": prefix_size(s3_client, BENCHMARK_BUCKET, "DATA/TRANSFORM/{}/".format(TABLES[table_name]["sub_folder"])),
+                })
+            spark.stop()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quarters", type=int, default=2)
+    parser.add_argument("--scale", type=float, default=0.01)
+    parser.add_argument("--tables", nargs="+", choices=list(TABLES), default=list(TABLES))
+    parser.add_argument("--multi-table", action="store_true", help="Transform every table with transform_sec_fs_datasets.py at once")
+    parser.add_argument("--engine", choices=["spark", "arrow"], default="spark", help="Transform with PySpark, or with PyArrow into tables registered beforehand")
+    parser.add_argument("--output", help="JSON-lines file to which the results are appended")
+    parser.add_argument("--stage-metrics", help="JSON-lines file to which the transform appends the measures of its stages")
+    arguments = parser.parse_args()
+    run(arguments.quarters, arguments.scale, arguments.tables, arguments.multi_table, arguments.output, arguments.stage_metrics, arguments.engine)
@@ -0,0 +1,151 @@
+"""
+Helpers shared by the benchmarks: per-stage measurements, a local HTTP server standing in for the SEC website
+(see tests.utils), and a moto server standing in for S3.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Iterator, List
+
+import psutil
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+COLLECTOR_PATH = os.path.join(REPOSITORY_ROOT, "assets", "libs", "sec_fs_dataset_collector")
+TRANSFORMER_PATH = os.path.join(REPOSITORY_ROOT, "assets", "libs", "sec_fs_dataset_transformer")
+METRICS_PATH = os.path.join(REPOSITORY_ROOT, "assets", "libs", "sec_fs_metrics")
+JOB_SCRIPTS_PATH = os.path.join(REPOSITORY_ROOT, "assets", "job_scripts")
+
+BENCHMARK_BUCKET = "sec-fs-benchmark"
+
+
+def add_libraries_to_path():
+    for path in (COLLECTOR_PATH, TRANSFORMER_PATH, METRICS_PATH):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def _tree_rss(process: psutil.Process) -> int:
+    """
+    Resident memory of the process and of its children, e.g. the JVM started by PySpark
+    """
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        with contextlib.suppress(psutil.Error):
+            rss += child.memory_info().rss
+    return rss
+
+
+class Stage:
+    """
+    Measure of a stage: wall time, peak RSS sampled every interval seconds, and the bytes/rows it processed
+    """
+
+    def __init__(self, name: str, interval: float = 0.05, **labels):
+        self.name = name
+        self.labels = labels
+        self.interval = interval
+        self.bytes = 0
+        self.rows = 0
+        self.wall_time = None
+        self.peak_rss = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            with contextlib.suppress(psutil.Error):
+                self.peak_rss = max(self.peak_rss, _tree_rss(self._process))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_rss = _tree_rss(self._process)
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall_time = time.perf_counter() - self._start
+        self._stop.set()
+        self._sampler.join()
+
+    def result(self) -> dict:
+        return {
+            "stage": self.name,
+            **self.labels,
+            "wall_time_s": round(self.wall_time, 3),
+            "bytes": self.bytes,
+            "rows": self.rows,
+            "throughput_mb_s": round(self.bytes / self.wall_time / 1024 / 1024, 3) if self.wall_time and self.bytes else None,
+            "peak_rss_mb": round(self.peak_rss / 1024 / 1024, 1),
+        }
+
+
+class Report:
+    """
+    Collects the results of the stages, printed and appended as JSON lines to output if given
+    """
+
+    def __init__(self, output: str = None):
+        self.output = output
+        self.results: List[dict] = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **labels) -> Iterator[Stage]:
+        stage = Stage(name, **labels)
+        with stage:
+            yield stage
+        self.add(stage.result())
+
+    def add(self, result: dict):
+        self.results.append(result)
+        print(json.dumps(result))
+        if self.output:
+            with open(self.output, mode="a") as file:
+                file.write(json.dumps(result) + "\n")
+
+
+@contextlib.contextmanager
+def moto_s3_server(bucket: str = BENCHMARK_BUCKET) -> Iterator[str]:
+    """
+    Start a moto server, point boto3 at it through the environment, create bucket and yield the endpoint URL
+    """
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint = "http://{}:{}".format(host, port)
+    environment = {
+        "AWS_ENDPOINT_URL": endpoint,
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }
+    previous = {name: os.environ.get(name) for name in environment}
+    os.environ.update(environment)
+    try:
+        boto3.Session().client("s3").create_bucket(Bucket=bucket)
+        yield endpoint
+    finally:
+        server.stop()
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def prefix_size(s3_client, bucket: str, prefix: str) -> int:
+    return sum(
+        obj["Size"]
+        for page in s3_client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix)
+        for obj in page.get("Contents", [])
+    )
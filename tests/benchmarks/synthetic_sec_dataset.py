@@ -0,0 +1,152 @@
+"""
+Generator of synthetic SEC Financial Statement datasets.
+
+The archives mimic the quarterly {year}q{quarter}.zip published by the SEC: the four tab-separated members
+num.txt, pre.txt, sub.txt and tag.txt, with the columns described in https://www.sec.gov/files/aqfs.pdf.
+A scale of 1.0 is roughly the size of a recent quarter (about 6 500 submissions and 3 million num rows).
+"""
+
+import argparse
+import os
+import random
+import zipfile
+from datetime import date, timedelta
+from typing import Iterable, List, Tuple
+
+SUBMISSIONS_PER_QUARTER = 6500
+NUM_ROWS_PER_SUBMISSION = 450
+PRE_ROWS_PER_SUBMISSION = 220
+STANDARD_TAGS = 12000
+CUSTOM_TAGS_PER_SUBMISSION = 4
+
+SUB_COLUMNS = ["adsh", "cik", "name", "sic", "countryba", "stprba", "cityba", "zipba", "bas1", "bas2", "baph",
+    "countryma", "stprma", "cityma", "zipma", "mas1", "mas2", "countryinc", "stprinc", "ein", "former", "changed",
+    "afs", "wksi", "fye", "form", "period", "fy", "fp", "filed", "accepted", "prevrpt", "detail", "instance", "nciks", "aciks"]
+NUM_COLUMNS = ["adsh", "tag", "version", "coreg", "ddate", "qtrs", "uom", "value", "footnote"]
+PRE_COLUMNS = ["adsh", "report", "line", "stmt", "inpth", "rfile", "tag", "version", "plabel", "negating"]
+TAG_COLUMNS = ["tag", "version", "custom", "abstract", "datatype", "iord", "crdr", "tlabel", "doc"]
+
+FORMS = ["10-Q", "10-K", "8-K", "20-F", "40-F", "10-K/A", "10-Q/A"]
+STATES = ["NY", "CA", "TX", "DE", "IL", "MA", "WA", "FL", "NJ", "PA"]
+CITIES = ["NEW YORK", "SAN FRANCISCO", "HOUSTON", "WILMINGTON", "CHICAGO", "BOSTON", "SEATTLE", "MIAMI"]
+STATEMENTS = ["BS", "IS", "CF", "EQ", "CI", "UN"]
+UNITS = ["USD", "shares", "pure", "EUR", "USD/shares"]
+WORDS = ["Assets", "Liabilities", "Revenue", "Cost", "Income", "Tax", "Equity", "Cash", "Operating", "Net",
+    "Current", "Noncurrent", "Deferred", "Accrued", "Expense", "Stock", "Dividends", "Interest", "Lease", "Goodwill"]
+
+
+def quarter_dates(year: int, quarter: int) -> Tuple[date, date]:
+    start = date(year, 3 * (quarter - 1) + 1, 1)
+    end = date(year + (quarter == 4), (3 * quarter) % 12 + 1, 1) - timedelta(days=1)
+    return start, end
+
+
+def standard_tag(index: int) -> str:
+    rng = random.Random(index)
+    return "".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))) + str(index)
+
+
+def _write_rows(archive: zipfile.ZipFile, member_name: str, columns: List[str], rows: Iterable[list]) -> int:
+    written = 0
+    with archive.open(member_name, mode="w", force_zip64=True) as member:
+        member.write(("\t".join(columns) + "\n").encode("utf-8"))
+        lines = []
+        for row in rows:
+            lines.append("\t".join("" if value is None else str(value) for value in row))
+            written += 1
+            if len(lines) == 10000:
+                member.write(("\n".join(lines) + "\n").encode("utf-8"))
+                lines = []
+        if lines:
+            member.write(("\n".join(lines) + "\n").encode("utf-8"))
+    return written
+
+
+def generate_quarter(path: str, year: int, quarter: int, scale: float = 0.01, seed: int = 0) -> str:
+    """
+    Write the synthetic archive {year}q{quarter}.zip into the directory path and return its file path
+    """
+    rng = random.Random("{}-{}-{}".format(seed, year, quarter))
+    start, end = quarter_dates(year, quarter)
+    submissions = max(1, int(SUBMISSIONS_PER_QUARTER * scale))
+    version = "us-gaap/{}".format(year)
+
+    subs = []
+    for index in range(submissions):
+        cik = rng.randint(1000, 1999999)
+        filed = start + timedelta(days=rng.randint(0, (end - start).days))
+        period = filed - timedelta(days=rng.choice([30, 45, 60, 90]))
+        subs.append({
+            "adsh": "{:010d}-{:02d}-{:06d}".format(cik, year % 100, index),
+            "cik": cik,
+            "filed": filed,
+            "period": period,
+            "custom_tags": ["Custom{}{}".format(rng.choice(WORDS), tag_index) for tag_index in range(CUSTOM_TAGS_PER_SUBMISSION)],
+        })
+
+    def sub_rows():
+        for sub in subs:
+            state, city = rng.choice(STATES), rng.choice(CITIES)
+            yield [sub["adsh"], sub["cik"], "COMPANY {} INC".format(sub["cik"]), rng.randint(1000, 9999), "US", state, city,
+                "{:05d}".format(rng.randint(0, 99999)), "{} MAIN STREET".format(rng.randint(1, 999)), None, "212-555-0100",
+                "US", state, city, "{:05d}".format(rng.randint(0, 99999)), "PO BOX {}".format(rng.randint(1, 999)), None,
+                "US", rng.choice(STATES), rng.randint(10000000, 999999999), None, None,
+                rng.choice(["1-LAF", "2-ACC", "3-SRA", "4-NON", "5-SML"]), rng.randint(0, 1), "1231", rng.choice(FORMS),
+                sub["period"].strftime("%Y%m%d"), sub["period"].year, rng.choice(["Q1", "Q2", "Q3", "FY"]),
+                sub["filed"].strftime("%Y%m%d"), sub["filed"].strftime("%Y-%m-%d") + " 16:{:02d}:00.0".format(rng.randint(0, 59)),
+                rng.randint(0, 1), rng.randint(0, 1), "inst{}_htm.xml".format(sub["cik"]), 1, None]
+
+    def num_rows():
+        for sub in subs:
+            for _ in range(int(NUM_ROWS_PER_SUBMISSION * rng.uniform(0.5, 1.5))):
+                custom = rng.random() < 0.1
+                tag = rng.choice(sub["custom_tags"]) if custom else standard_tag(rng.randrange(STANDARD_TAGS))
+                ddate = sub["period"] - timedelta(days=rng.choice([0, 0, 0, 365, 730]))
+                yield [sub["adsh"], tag, sub["adsh"] if custom else version, None, ddate.strftime("%Y%m%d"),
+                    rng.choice([0, 1, 2, 4]), rng.choice(UNITS), "{:.4f}".format(rng.uniform(-1e9, 1e10)),
+                    None if rng.random() < 0.98 else "Footnote {}".format(rng.randint(1, 9))]
+
+    def pre_rows():
+        for sub in subs:
+            for line in range(1, int(PRE_ROWS_PER_SUBMISSION * rng.uniform(0.5, 1.5)) + 1):
+                tag = standard_tag(rng.randrange(STANDARD_TAGS))
+                yield [sub["adsh"], line // 40 + 1, line, rng.choice(STATEMENTS), rng.randint(0, 1), rng.choice(["H", "X"]),
+                    tag, version, "Label of {}".format(tag), rng.randint(0, 1)]
+
+    def tag_rows():
+        for index in range(int(STANDARD_TAGS * min(1.0, scale * 10)) or 1):
+            tag = standard_tag(index)
+            yield [tag, version, 0, rng.randint(0, 1), rng.choice(["monetary", "shares", "pure", None]),
+                rng.choice(["I", "D"]), rng.choice(["C", "D", None]), "Label of {}".format(tag), "Documentation of {}".format(tag)]
+        for sub in subs:
+            for tag in sub["custom_tags"]:
+                yield [tag, sub["adsh"], 1, 0, "monetary", "D", "C", "Label of {}".format(tag), None]
+
+    file_path = os.path.join(path, "{}q{}.zip".format(year, quarter))
+    with zipfile.ZipFile(file_path, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        _write_rows(archive, "sub.txt", SUB_COLUMNS, sub_rows())
+        _write_rows(archive, "num.txt", NUM_COLUMNS, num_rows())
+        _write_rows(archive, "pre.txt", PRE_COLUMNS, pre_rows())
+        _write_rows(archive, "tag.txt", TAG_COLUMNS, tag_rows())
+        archive.writestr("readme.htm", "<html><body>Synthetic SEC Financial Statement dataset</body></html>")
+    return file_path
+
+
+def generate_dataset(path: str, quarters: Iterable[Tuple[int, int]], scale: float = 0.01, seed: int = 0) -> List[str]:
+    os.makedirs(path, exist_ok=True)
+    return [generate_quarter(path, year, quarter, scale=scale, seed=seed) for year, quarter in quarters]
+
+
+def consecutive_quarters(count: int, initial_year: int = 2009) -> List[Tuple[int, int]]:
+    return [(initial_year + index // 4, index % 4 + 1) for index in range(count)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic SEC Financial Statement datasets")
+    parser.add_argument("path", help="Directory in which the archives are written")
+    parser.add_argument("--quarters", type=int, default=4, help="Number of consecutive quarters since 2009q1")
+    parser.add_argument("--scale", type=float, default=0.01, help="Size of a quarter relative to a recent SEC quarter")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    for file_path in generate_dataset(arguments.path, consecutive_quarters(arguments.quarters), scale=arguments.scale, seed=arguments.seed):
+        print("{} ({} bytes)".format(file_path, os.path.getsize(file_path)))
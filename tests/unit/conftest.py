@@ -0,0 +1,45 @@
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.utils import BUCKET, DATABASE
+
+# The libraries of the Glue jobs aren't installed, they are imported from their folders like in the jobs
+LIBS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "assets", "libs")
+for library in ("sec_fs_dataset_collector", "sec_fs_dataset_transformer", "sec_fs_metrics"):
+    if os.path.join(LIBS_PATH, library) not in sys.path:
+        sys.path.insert(0, os.path.join(LIBS_PATH, library))
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """
+    Mocked AWS services, with credentials so that nothing reaches AWS
+    """
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        yield
+
+
+@pytest.fixture
+def s3_client(aws):
+    s3_client = boto3.Session().client("s3")
+    s3_client.create_bucket(Bucket=BUCKET)
+    yield s3_client
+
+
+@pytest.fixture
+def glue_client(aws):
+    glue_client = boto3.Session().client("glue")
+    glue_client.create_database(DatabaseInput={"Name": DATABASE})
+    yield glue_client
+
+
+@pytest.fixture
+def cloudwatch_client(aws):
+    yield boto3.Session().client("cloudwatch")
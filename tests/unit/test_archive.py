@@ -0,0 +1,90 @@
+import pytest
+
+from sec_fs_dataset_transformer.archive import DELETE_BATCH_SIZE, archive_files, multipart_copy
+from tests.utils import BUCKET
+
+# S3 rejects parts smaller than 5 MiB, except for the last one
+PART_SIZE = 5 * 1024 * 1024
+
+
+class RecordingClient:
+    """
+    S3 client recording the calls to delete_objects, and failing to delete the keys of failing_keys like S3 reports it
+    """
+
+    def __init__(self, s3_client, failing_keys=()):
+        self._s3_client = s3_client
+        self.failing_keys = set(failing_keys)
+        self.deleted_batches = []
+
+    def __getattr__(self, name):
+        return getattr(self._s3_client, name)
+
+    def delete_objects(self, Bucket, Delete):
+        keys = [obj["Key"] for obj in Delete["Objects"]]
+        self.deleted_batches.append(keys)
+        response = self._s3_client.delete_objects(Bucket=Bucket, Delete={**Delete, "Objects": [{"Key": key} for key in keys if key not in self.failing_keys]})
+        response["Errors"] = [{"Key": key, "Code": "AccessDenied", "Message": "Access Denied"} for key in keys if key in self.failing_keys]
+        return response
+
+
+def raw_files(s3_client, sizes: dict) -> dict:
+    files = {}
+    for file_name, size in sizes.items():
+        key = "DATA/RAW/FS_NUM/"+file_name
+        s3_client.put_object(Bucket=BUCKET, Key=key, Body=b"x" * size)
+        files[file_name] = {"key": key, "size": size}
+    return files
+
+
+def keys(s3_client, prefix: str) -> list:
+    return [obj["Key"] for page in s3_client.get_paginator("list_objects_v2").paginate(Bucket=BUCKET, Prefix=prefix) for obj in page.get("Contents", [])]
+
+
+def test_multipart_copy(s3_client):
+    data = bytes(range(256)) * (2 * PART_SIZE // 256) + b"end"
+    s3_client.put_object(Bucket=BUCKET, Key="source", Body=data)
+    multipart_copy(s3_client, BUCKET, "source", "destination", len(data), part_size=PART_SIZE)
+    assert s3_client.get_object(Bucket=BUCKET, Key="destination")["Body"].read() == data
+    assert s3_client.head_object(Bucket=BUCKET, Key="destination", PartNumber=1)["PartsCount"] == 3
+
+
+def test_multipart_copy_is_aborted_on_error(s3_client):
+    with pytest.raises(s3_client.exceptions.ClientError):
+        multipart_copy(s3_client, BUCKET, "missing", "destination", 2 * PART_SIZE, part_size=PART_SIZE)
+    assert s3_client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+
+
+def test_files_above_threshold_are_copied_by_parts(s3_client):
+    files = raw_files(s3_client, {"2009q1.txt": 10, "2009q2.txt": 100})
+    results = archive_files(s3_client, BUCKET, files, "DATA/ARCHIVE/FS_NUM/", multipart_threshold=50)
+    assert [(result["copied"], result["deleted"], result["error"]) for result in results] == [(True, True, None)] * 2
+    assert keys(s3_client, "DATA/RAW/") == []
+    assert s3_client.get_object(Bucket=BUCKET, Key="DATA/ARCHIVE/FS_NUM/2009q2.txt")["Body"].read() == b"x" * 100
+    assert "PartsCount" in s3_client.head_object(Bucket=BUCKET, Key="DATA/ARCHIVE/FS_NUM/2009q2.txt", PartNumber=1)
+
+
+def test_deletes_are_batched(s3_client):
+    files = raw_files(s3_client, {"{:04d}.txt".format(index): 1 for index in range(DELETE_BATCH_SIZE + 1)})
+    client = RecordingClient(s3_client)
+    results = archive_files(client, BUCKET, files, "DATA/ARCHIVE/FS_NUM/")
+    assert [len(batch) for batch in client.deleted_batches] == [DELETE_BATCH_SIZE, 1]
+    assert all(result["deleted"] for result in results)
+    assert keys(s3_client, "DATA/RAW/") == []
+    assert len(keys(s3_client, "DATA/ARCHIVE/")) == DELETE_BATCH_SIZE + 1
+
+
+def test_errors_are_reported_per_file(s3_client):
+    files = raw_files(s3_client, {"2009q1.txt": 1, "2009q2.txt": 1, "2009q3.txt": 1})
+    # A file listed but gone before its copy, and a file which can't be deleted
+    s3_client.delete_object(Bucket=BUCKET, Key="DATA/RAW/FS_NUM/2009q1.txt")
+    client = RecordingClient(s3_client, failing_keys=["DATA/RAW/FS_NUM/2009q2.txt"])
+    results = {result["file_name"]: result for result in archive_files(client, BUCKET, files, "DATA/ARCHIVE/FS_NUM/")}
+
+    assert (results["2009q1.txt"]["copied"], results["2009q1.txt"]["deleted"]) == (False, False)
+    assert results["2009q1.txt"]["error"].startswith("Copy failed: ")
+    assert (results["2009q2.txt"]["copied"], results["2009q2.txt"]["deleted"], results["2009q2.txt"]["error"]) == (True, False, "Delete failed: Access Denied")
+    assert (results["2009q3.txt"]["copied"], results["2009q3.txt"]["deleted"], results["2009q3.txt"]["error"]) == (True, True, None)
+    # Only the copied files are deleted
+    assert client.deleted_batches == [["DATA/RAW/FS_NUM/2009q2.txt", "DATA/RAW/FS_NUM/2009q3.txt"]]
+    assert keys(s3_client, "DATA/RAW/") == ["DATA/RAW/FS_NUM/2009q2.txt"]
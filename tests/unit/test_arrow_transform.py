@@ -0,0 +1,274 @@
+import json
+from decimal import Decimal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from sec_fs_dataset_transformer import arrow_transform
+from sec_fs_dataset_transformer.arrow_transform import arrow_type, cast_values, catalog_table, read_raw_file
+from sec_fs_dataset_transformer.ledger import new_ledger, save_ledger
+from sec_fs_dataset_transformer.schemas import stale_columns
+from tests.utils import BUCKET, DATABASE
+
+RAW_NUM = b"adsh\ttag\tversion\tddate\tqtrs\tvalue\n0001-1\tAssets\tus-gaap/2008\t20081231\t0\t12.34567\nshort\trow\n0001-3\tCash\tus-gaap/2008\t20081231\t4\t\n"
+
+
+def spark_table_input(name: str, fields, partition_cols, location: str, schema_parts: int = 1, num_buckets: int = None, bucket_cols=()) -> dict:
+    """
+    Table input as recorded by Spark's saveAsTable: the schema is in the parameters, split in parts when it is long,
+    and the columns of the storage descriptor are a placeholder
+    """
+    schema = json.dumps({
+        "type": "struct",
+        "fields": [{"name": name, "type": field_type, "nullable": True, "metadata": {}} for name, field_type in fields + [(col, "string") for col in partition_cols]],
+    })
+    part_size = -(-len(schema) // schema_parts)
+    parameters = {"spark.sql.sources.provider": "parquet", "spark.sql.sources.schema.numParts": str(schema_parts)}
+    parameters.update({"spark.sql.sources.schema.part.{}".format(index): schema[index * part_size:(index + 1) * part_size] for index in range(schema_parts)})
+    if num_buckets:
+        parameters["spark.sql.sources.schema.numBuckets"] = str(num_buckets)
+        parameters["spark.sql.sources.schema.numBucketCols"] = str(len(bucket_cols))
+        parameters.update({"spark.sql.sources.schema.bucketCol.{}".format(index): col for index, col in enumerate(bucket_cols)})
+    return {
+        "Name": name,
+        "Parameters": parameters,
+        "PartitionKeys": [{"Name": col, "Type": "string"} for col in partition_cols],
+        "StorageDescriptor": {
+            "Columns": [{"Name": "col", "Type": "array<string>"}],
+            "Location": location+"-__PLACEHOLDER__",
+            "SerdeInfo": {"Parameters": {"path": location}},
+        },
+    }
+
+# Results of CAST(value AS INT) and CAST(value AS DECIMAL(28,4)) in Spark 3.3, with spark.sql.ansi.enabled=false
+SPARK_INT_CASTS = [
+    ("1", 1),
+    (" 42 ", 42),
+    ("-7", -7),
+    ("+3", 3),
+    ("007", 7),
+    ("1.9", 1),
+    ("-1.9", -1),
+    (".5", 0),
+    ("1.", 1),
+    ("2147483647", 2147483647),
+    ("-2147483648", -2147483648),
+    ("2147483648", None),
+    ("-2147483649", None),
+    ("99999999999", None),
+    ("99999999999999999999999", None),
+    ("1e3", None),
+    ("1.2.3", None),
+    ("abc", None),
+    ("", None),
+    (None, None),
+]
+SPARK_DECIMAL_CASTS = [
+    ("1", Decimal("1.0000")),
+    (" 3.14159 ", Decimal("3.1416")),
+    ("1.00005", Decimal("1.0001")),
+    ("-1.00005", Decimal("-1.0001")),
+    ("1.00004999", Decimal("1.0000")),
+    ("1.123456789012", Decimal("1.1235")),
+    ("-0.000000000000000000000000000000000000000001", Decimal("0.0000")),
+    (".5", Decimal("0.5000")),
+    ("5.", Decimal("5.0000")),
+    ("1e3", Decimal("1000.0000")),
+    ("1.5E-3", Decimal("0.0015")),
+    ("1e-50", Decimal("0.0000")),
+    ("123456789012345678901234", Decimal("123456789012345678901234.0000")),
+    ("1234567890123456789012345", None),
+    ("999999999999999999999999.99995", None),
+    ("1e40", None),
+    ("NaN", None),
+    ("abc", None),
+    (None, None),
+]
+
+
+@pytest.mark.parametrize("value,expected", SPARK_INT_CASTS)
+def test_cast_int_like_spark(value, expected):
+    assert cast_values(pa.array([value], pa.string()), pa.int32()).to_pylist() == [expected]
+
+
+@pytest.mark.parametrize("value,expected", SPARK_DECIMAL_CASTS)
+def test_cast_decimal_like_spark(value, expected):
+    assert cast_values(pa.array([value], pa.string()), pa.decimal128(28, 4)).to_pylist() == [expected]
+
+
+def test_cast_bigint_range():
+    values = pa.array(["9223372036854775807", "-9223372036854775807", "9223372036854775808", "10000000000000000000"])
+    assert cast_values(values, pa.int64()).to_pylist() == [9223372036854775807, -9223372036854775807, None, None]
+
+
+def test_cast_columns_of_mixed_values():
+    values = pa.array(["1.123456789012", "1e3", None, "99999999999999999999999999"], pa.string())
+    assert cast_values(values, pa.decimal128(28, 4)).to_pylist() == [Decimal("1.1235"), Decimal("1000.0000"), None, None]
+
+
+def test_cast_other_types_like_spark():
+    assert [str(value) for value in cast_values(pa.array(["20240131", "20240229", "20240231", "20230229", "2024-01-31"]), pa.date32()).to_pylist()] == \
+        ["2024-01-31", "2024-02-29", "None", "None", "None"]
+    assert cast_values(pa.array([" TRUE", "0", "n", "maybe"]), pa.bool_()).to_pylist() == [True, False, False, None]
+    assert str(cast_values(pa.array(["2024-01-31 12:30:00.0"]), pa.timestamp("us"))[0]) == "2024-01-31 12:30:00"
+
+
+@pytest.mark.parametrize("header_read_size", [64 * 1024, 4], ids=["whole header", "header in chunks"])
+def test_read_raw_text_file(s3_client, monkeypatch, header_read_size):
+    monkeypatch.setattr(arrow_transform, "HEADER_READ_SIZE", header_read_size)
+    s3_client.put_object(Bucket=BUCKET, Key="DATA/RAW/FS_NUM/2009q1.txt", Body=RAW_NUM)
+    table = read_raw_file(s3_client, BUCKET, {"key": "DATA/RAW/FS_NUM/2009q1.txt"}, "2009q1.txt", "permissive")
+    assert table.column_names == ["adsh", "tag", "version", "ddate", "qtrs", "value", "original_file_name"]
+    assert table.schema.types == [pa.string()] * 7
+    # The malformed row is skipped, empty values are null
+    assert table.column("adsh").to_pylist() == ["0001-1", "0001-3"]
+    assert table.column("value").to_pylist() == ["12.34567", None]
+    assert table.column("original_file_name").to_pylist() == ["2009q1.txt"] * 2
+
+
+def test_read_raw_text_file_failing_on_malformed_rows(s3_client):
+    s3_client.put_object(Bucket=BUCKET, Key="DATA/RAW/FS_NUM/2009q1.txt", Body=RAW_NUM)
+    with pytest.raises(pa.ArrowInvalid):
+        read_raw_file(s3_client, BUCKET, {"key": "DATA/RAW/FS_NUM/2009q1.txt"}, "2009q1.txt", "fail")
+
+
+def test_read_raw_parquet_file(s3_client):
+    sink = pa.BufferOutputStream()
+    pq.write_table(pa.table({"adsh": ["0001-1"], "qtrs": ["4"]}), sink)
+    s3_client.put_object(Bucket=BUCKET, Key="DATA/RAW/FS_NUM/2009q1.parquet", Body=pa.BufferReader(sink.getvalue()))
+    table = read_raw_file(s3_client, BUCKET, {"key": "DATA/RAW/FS_NUM/2009q1.parquet"}, "2009q1.parquet", "permissive")
+    assert table.to_pylist() == [{"adsh": "0001-1", "qtrs": "4", "original_file_name": "2009q1.parquet"}]
+
+
+NUM_FIELDS = [("adsh", "string"), ("tag", "string"), ("ddate", "date"), ("qtrs", "integer"), ("value", "decimal(28,4)"), ("original_file_name", "string")]
+
+
+@pytest.mark.parametrize("schema_parts", [1, 3], ids=["schema in one part", "schema in parts"])
+def test_catalog_table_of_bucketed_spark_table(glue_client, schema_parts):
+    location = "s3a://{}/DATA/TRANSFORM/FS_NUM".format(BUCKET)
+    table_input = spark_table_input("fs_num", NUM_FIELDS, ["original_file_year", "original_file_quarter"], location, schema_parts, 4, ["adsh"])
+    glue_client.create_table(DatabaseName=DATABASE, TableInput=table_input)
+    table = catalog_table(glue_client, DATABASE, "fs_num")
+    assert table["schema"] == pa.schema([
+        ("adsh", pa.string()), ("tag", pa.string()), ("ddate", pa.date32()), ("qtrs", pa.int32()), ("value", pa.decimal128(28, 4)), ("original_file_name", pa.string())
+    ])
+    assert table["partition_cols"] == ["original_file_year", "original_file_quarter"]
+    assert table["location"] == location
+    assert (table["num_buckets"], table["bucket_cols"]) == (4, ["adsh"])
+    # Named like the types of the schemas module, so that the table isn't taken for a stale one
+    assert stale_columns("fs_num", table["column_types"]) == {}
+
+
+def test_catalog_table_of_unbucketed_spark_table(glue_client):
+    fields = [("tag", "string"), ("version", "string"), ("custom", "boolean"), ("original_file_name", "string")]
+    glue_client.create_table(DatabaseName=DATABASE, TableInput=spark_table_input("fs_tag", fields, [], "s3a://{}/DATA/TRANSFORM/FS_TAG".format(BUCKET)))
+    table = catalog_table(glue_client, DATABASE, "fs_tag")
+    assert table["schema"].names == ["tag", "version", "custom", "original_file_name"]
+    assert (table["partition_cols"], table["num_buckets"], table["bucket_cols"]) == ([], None, [])
+
+
+def test_catalog_table_of_hive_table(glue_client):
+    glue_client.create_table(DatabaseName=DATABASE, TableInput={
+        "Name": "fs_other",
+        "PartitionKeys": [{"Name": "original_file_year", "Type": "string"}],
+        "StorageDescriptor": {"Columns": [{"Name": "cik", "Type": "int"}, {"Name": "ein", "Type": "bigint"}], "Location": "s3://{}/DATA/OTHER/".format(BUCKET)},
+    })
+    table = catalog_table(glue_client, DATABASE, "fs_other")
+    assert table["schema"] == pa.schema([("cik", pa.int32()), ("ein", pa.int64())])
+    assert table["location"] == "s3://{}/DATA/OTHER/".format(BUCKET)
+
+
+def test_catalog_table_missing(glue_client):
+    assert catalog_table(glue_client, DATABASE, "fs_missing") is None
+
+
+@pytest.mark.parametrize("partition_cols, fields", [
+    (["original_file_year"], [("adsh", "string"), ("ddate", "date")]),
+    (["original_file_year", "original_file_quarter"], [("adsh", "string"), ("ddate", "string")]),
+], ids=["partitioned_by_year", "all_strings"])
+def test_table_created_by_previous_version_is_rejected(s3_client, glue_client, partition_cols, fields):
+    glue_client.create_table(DatabaseName=DATABASE, TableInput=spark_table_input("fs_num", fields, partition_cols, "s3a://{}/DATA/TRANSFORM/FS_NUM".format(BUCKET)))
+    options = {
+        "database": DATABASE, "table_name": "fs_num", "write_mode": "overwrite_partitions", "malformed_rows": "permissive",
+        "partition_by_file_year": "true", "partition_by_file_quarter": "true",
+    }
+    with pytest.raises(RuntimeError, match="created by a previous version and has to be recreated, see Upgrading the tables in the README"):
+        arrow_transform.transform_table(s3_client, glue_client, options)
+
+
+def table_options(table_name: str, write_mode: str, partitioned: bool, **options) -> dict:
+    return {
+        "database": DATABASE, "s3_bucket": BUCKET, "ledger_s3_prefix": "DATA/LEDGER/", "max_batch_bytes": "1000000",
+        "target_file_bytes": "1000000", "stats_s3_prefix": "DATA/STATS/", "table_name": table_name,
+        "raw_s3_prefix": "DATA/RAW/{}/".format(table_name.upper()), "archive_s3_prefix": "DATA/ARCHIVE/{}/".format(table_name.upper()),
+        "write_mode": write_mode, "partition_by_file_year": str(partitioned).lower(), "partition_by_file_quarter": str(partitioned).lower(),
+        "malformed_rows": "permissive", "merge_keys": "", "sort_cols": "", **options,
+    }
+
+
+def table_rows(s3_client, prefix: str) -> dict:
+    """
+    Rows of the Parquet files under prefix by key
+    """
+    return {
+        obj["Key"]: pq.read_table(pa.BufferReader(s3_client.get_object(Bucket=BUCKET, Key=obj["Key"])["Body"].read())).to_pylist()
+        for obj in s3_client.list_objects_v2(Bucket=BUCKET, Prefix=prefix).get("Contents", [])
+    }
+
+
+def test_overwritten_partition_is_swapped(s3_client, glue_client):
+    location = "s3a://{}/DATA/TRANSFORM/FS_NUM".format(BUCKET)
+    fields = [("adsh", "string"), ("tag", "string"), ("version", "string"), ("ddate", "date"), ("qtrs", "integer"), ("value", "decimal(28,4)"), ("original_file_name", "string")]
+    glue_client.create_table(DatabaseName=DATABASE, TableInput=spark_table_input("fs_num", fields, ["original_file_year", "original_file_quarter"], location))
+    save_ledger(s3_client, BUCKET, "DATA/LEDGER/fs_num.json", new_ledger("fs_num"))
+    options = table_options("fs_num", "overwrite_partitions", True, sort_cols="adsh")
+    s3_client.put_object(Bucket=BUCKET, Key="DATA/RAW/FS_NUM/2009q1.txt", Body=RAW_NUM)
+    arrow_transform.transform_table(s3_client, glue_client, options)
+    [first_key] = table_rows(s3_client, "DATA/TRANSFORM/FS_NUM/")
+    assert first_key.startswith("DATA/TRANSFORM/FS_NUM/original_file_year=2009/original_file_quarter=1/")
+
+    # The file is published again with other rows
+    s3_client.put_object(Bucket=BUCKET, Key="DATA/RAW/FS_NUM/2009q1.txt", Body=RAW_NUM.replace(b"0001-3", b"0001-4"))
+    arrow_transform.transform_table(s3_client, glue_client, options)
+    partition = glue_client.get_partition(DatabaseName=DATABASE, TableName="fs_num", PartitionValues=["2009", "1"])["Partition"]
+    new_location = partition["StorageDescriptor"]["Location"]
+    assert new_location.startswith(location+"_COMPACTED/") and new_location.endswith("/original_file_year=2009/original_file_quarter=1/")
+    assert "path" not in partition["StorageDescriptor"]["SerdeInfo"]["Parameters"]
+    rows = table_rows(s3_client, "DATA/TRANSFORM/")
+    [key] = rows
+    assert key.startswith(new_location.split("/", 3)[3])
+    assert [row["adsh"] for row in rows[key]] == ["0001-1", "0001-4"]
+
+
+def test_upsert_only_rewrites_the_files_of_changed_keys(s3_client, glue_client):
+    location = "s3a://{}/DATA/TRANSFORM/FS_TAG/".format(BUCKET)
+    fields = [("tag", "string"), ("version", "string"), ("tlabel", "string"), ("original_file_name", "string")]
+    glue_client.create_table(DatabaseName=DATABASE, TableInput=spark_table_input("fs_tag", fields, [], location))
+    options = table_options("fs_tag", "upsert", False, merge_keys="tag,version", sort_cols="tag,version")
+    for file_name, raw in [("2009q1.txt", b"tag\tversion\ttlabel\nAssets\tv1\tAssets\nCash\tv1\tCash\n"), ("2009q2.txt", b"tag\tversion\ttlabel\nDebt\tv1\tDebt\n")]:
+        s3_client.put_object(Bucket=BUCKET, Key="DATA/RAW/FS_TAG/"+file_name, Body=raw)
+        arrow_transform.transform_table(s3_client, glue_client, options)
+    files = table_rows(s3_client, "DATA/TRANSFORM/FS_TAG/")
+    assert sorted(row["tag"] for rows in files.values() for row in rows) == ["Assets", "Cash", "Debt"]
+    [debt_key] = [key for key, rows in files.items() if rows[0]["tag"] == "Debt"]
+
+    # A label changed and a tag is new, the file of Debt is left as it is
+    s3_client.put_object(Bucket=BUCKET, Key="DATA/RAW/FS_TAG/2009q3.txt", Body=b"tag\tversion\ttlabel\nCash\tv1\tCash total\nDebt\tv1\tDebt\nEquity\tv1\tEquity\n")
+    arrow_transform.transform_table(s3_client, glue_client, options)
+    table = glue_client.get_table(DatabaseName=DATABASE, Name="fs_tag")["Table"]
+    new_location = table["StorageDescriptor"]["SerdeInfo"]["Parameters"]["path"]
+    assert new_location.startswith("s3a://{}/DATA/TRANSFORM/FS_TAG_COMPACTED/".format(BUCKET))
+    assert table["StorageDescriptor"]["Location"] == new_location.rstrip("/")+"-__PLACEHOLDER__"
+    assert catalog_table(glue_client, DATABASE, "fs_tag")["schema"].names == [name for name, _ in fields]
+    assert table_rows(s3_client, "DATA/TRANSFORM/FS_TAG/") == {}
+    files = table_rows(s3_client, new_location.split("/", 3)[3])
+    assert files[new_location.split("/", 3)[3]+debt_key.split("/")[-1]] == [{"tag": "Debt", "version": "v1", "tlabel": "Debt", "original_file_name": "2009q2.txt"}]
+    assert sorted((row["tag"], row["tlabel"]) for rows in files.values() for row in rows) == [("Assets", "Assets"), ("Cash", "Cash total"), ("Debt", "Debt"), ("Equity", "Equity")]
+
+
+def test_arrow_type():
+    assert arrow_type("decimal(10, 2)") == pa.decimal128(10, 2)
+    assert arrow_type("timestamp") == pa.timestamp("us")
+    with pytest.raises(KeyError):
+        arrow_type("array<string>")
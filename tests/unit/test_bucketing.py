@@ -0,0 +1,45 @@
+import pyarrow as pa
+import pytest
+
+from sec_fs_dataset_transformer.bucketing import bucket_ids, hash_bytes, spark_hash
+
+
+def test_spark_hash_known_values():
+    # SELECT hash(''), hash(1), hash(NULL) in Spark
+    assert spark_hash(("",)) == 142593372
+    assert spark_hash((1,)) == -559580957
+    assert spark_hash((None,)) == 42
+
+
+@pytest.mark.parametrize("data,seed,expected", [
+    (b"", 0, 0),
+    (b"", 1, 0x514E28B7),
+    (b"", 0xFFFFFFFF, 0x81F16F39),
+    (b"\0\0\0\0", 0, 0x2362F9DE),
+    (b"aaaa", 0x9747B28C, 0x5A97808A),
+    (b"abcd", 0x9747B28C, 0xF0478627),
+])
+def test_hash_bytes_matches_murmur3_on_whole_words(data, seed, expected):
+    # Spark only departs from the reference Murmur3 x86_32 on the bytes after the last 4-byte word
+    assert hash_bytes(data, seed) & 0xFFFFFFFF == expected
+
+
+def test_spark_hash_chains_the_values():
+    assert spark_hash(("0001-1", 4)) == spark_hash((4,), seed=spark_hash(("0001-1",)))
+    assert spark_hash(("0001-1", None, True)) == spark_hash(("0001-1", 1))
+
+
+def test_spark_hash_of_unsupported_values():
+    with pytest.raises(TypeError):
+        spark_hash((2 ** 40,))
+    with pytest.raises(TypeError):
+        spark_hash((1.5,))
+
+
+def test_bucket_ids_are_pmod_of_the_hash():
+    table = pa.table({"adsh": ["0001-1", "0001-2", "0001-1", None, "é"], "qtrs": [4, 0, 4, 1, None]})
+    assert bucket_ids(table, ["adsh"], 8).to_pylist() == [spark_hash((value,)) % 8 for value in table["adsh"].to_pylist()]
+    assert bucket_ids(table, ["adsh", "qtrs"], 8).to_pylist() == [spark_hash(row) % 8 for row in zip(table["adsh"].to_pylist(), table["qtrs"].to_pylist())]
+    assert all(0 <= bucket < 8 for bucket in bucket_ids(table, ["adsh"], 8).to_pylist())
+    # Null has the hash of the seed, 42
+    assert bucket_ids(table, ["adsh"], 8)[3].as_py() == 42 % 8
@@ -0,0 +1,114 @@
+import json
+import os
+
+import pytest
+import requests
+
+from sec_fs_dataset_collector.collect_sec_fs_datasets import COLLECTED, UNCHANGED, handle_quarter, handle_quarters, is_unpublished_quarter
+from sec_fs_dataset_collector.manifest import member_manifest_key
+from tests.benchmarks.synthetic_sec_dataset import generate_quarter
+from tests.utils import BUCKET, serve_directory
+
+
+@pytest.fixture
+def source_url(tmp_path):
+    generate_quarter(str(tmp_path), 2009, 1, scale=0.001)
+    # The local server only sends Last-Modified, like servers without ETags
+    with serve_directory(str(tmp_path)) as url:
+        yield url
+
+
+def collect(source_url, **options):
+    return handle_quarter("2009", "1", BUCKET, "DATA/RAW/", source_url, s3_prefix_manifest="DATA/MANIFEST/", **options)
+
+
+@pytest.mark.parametrize("options", [{"ranged": True}, {"streaming": True}, {}], ids=["ranged", "streaming", "buffered"])
+def test_unchanged_quarter_without_etag_is_skipped(s3_client, source_url, options):
+    assert collect(source_url, **options) == COLLECTED
+    assert s3_client.list_objects_v2(Bucket=BUCKET, Prefix="DATA/RAW/FS_NUM/")["KeyCount"] == 1
+    assert collect(source_url, **options) == UNCHANGED
+
+
+def test_changed_quarter_is_collected_again(s3_client, source_url, tmp_path):
+    assert collect(source_url, ranged=True) == COLLECTED
+    os.utime(tmp_path / "2009q1.zip", (0, 0))
+    assert collect(source_url, ranged=True) == COLLECTED
+
+
+def test_forced_quarter_is_collected_again(s3_client, source_url):
+    assert collect(source_url, ranged=True) == COLLECTED
+    assert collect(source_url, ranged=True, force=True) == COLLECTED
+
+
+def test_members_not_collected_yet_are_collected(s3_client, source_url):
+    assert collect(source_url, members=["sub.txt"]) == COLLECTED
+    assert collect(source_url, members=["sub.txt", "num.txt"]) == COLLECTED
+    assert collect(source_url, members=["num.txt"]) == UNCHANGED
+
+
+def test_other_output_format_is_collected_again(s3_client, source_url):
+    assert collect(source_url, members=["sub.txt"]) == COLLECTED
+    assert collect(source_url, members=["sub.txt"], output_format="parquet") == COLLECTED
+
+
+@pytest.fixture
+def archives_url(tmp_path):
+    # 2009q3 isn't published yet
+    for quarter in (1, 2):
+        generate_quarter(str(tmp_path), 2009, quarter, scale=0.001)
+    with serve_directory(str(tmp_path)) as url:
+        yield url
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """
+    Archives requested with GET, by file name
+    """
+    downloads = []
+    get = requests.get
+    def counting_get(url, *args, **kwargs):
+        downloads.append(url.rsplit("/", 1)[-1])
+        return get(url, *args, **kwargs)
+    monkeypatch.setattr(requests, "get", counting_get)
+    return downloads
+
+
+def collect_quarters(url, quarters, **options):
+    return handle_quarters([("2009", str(quarter)) for quarter in quarters], BUCKET, "DATA/RAW/", url, s3_prefix_manifest="DATA/MANIFEST/", max_requests_per_second=1000, **options)
+
+
+def tag_source(s3_client):
+    return json.loads(s3_client.get_object(Bucket=BUCKET, Key=member_manifest_key("DATA/MANIFEST/", "tag.txt"))["Body"].read())["file_name"]
+
+
+def test_quarters_collect_tag_from_latest_published_quarter(s3_client, archives_url, downloads):
+    failures = collect_quarters(archives_url, [3, 1, 2], streaming=True)
+    assert list(failures) == ["2009q3"] and is_unpublished_quarter(failures["2009q3"])
+    assert [obj["Key"] for obj in s3_client.list_objects_v2(Bucket=BUCKET, Prefix="DATA/RAW/FS_NUM/")["Contents"]] == ["DATA/RAW/FS_NUM/2009q1.txt", "DATA/RAW/FS_NUM/2009q2.txt"]
+    assert tag_source(s3_client) == "2009q2.zip"
+    # tag.txt is read while its quarter is streamed, each archive is downloaded once
+    assert sorted(downloads) == ["2009q1.zip", "2009q2.zip", "2009q3.zip"]
+
+
+def test_failing_quarters_are_returned_once_the_others_are_collected(s3_client, archives_url, tmp_path):
+    with open(tmp_path / "2009q1.zip", mode="wb") as file:
+        file.write(b"not an archive")
+    failures = collect_quarters(archives_url, [1, 2, 3], streaming=True)
+    assert sorted(failures) == ["2009q1", "2009q3"]
+    assert not is_unpublished_quarter(failures["2009q1"])
+    assert s3_client.list_objects_v2(Bucket=BUCKET, Prefix="DATA/RAW/FS_NUM/")["KeyCount"] == 1
+
+
+@pytest.mark.parametrize("ranged", [True, False], ids=["ranged", "streaming"])
+def test_tag_of_failing_latest_quarter(s3_client, archives_url, tmp_path, downloads, ranged):
+    with open(tmp_path / "2009q2.zip", mode="wb") as file:
+        file.write(b"not an archive")
+    failures = collect_quarters(archives_url, [1, 2], ranged=ranged, streaming=not ranged)
+    assert list(failures) == ["2009q2"]
+    if ranged:
+        # Only the bytes of tag.txt are requested again
+        assert tag_source(s3_client) == "2009q1.zip"
+    else:
+        assert s3_client.list_objects_v2(Bucket=BUCKET, Prefix="DATA/RAW/FS_TAG/")["KeyCount"] == 0
+        assert sorted(downloads) == ["2009q1.zip", "2009q2.zip"]
@@ -0,0 +1,56 @@
+from sec_fs_dataset_transformer.compaction import compaction_location, partition_spec, plan_swaps
+
+
+def test_compaction_location_is_next_to_the_table():
+    assert compaction_location("s3://sec-fs-test/DATA/fs_num", "run-2") == "s3://sec-fs-test/DATA/fs_num_COMPACTED/run-2/"
+    assert compaction_location("s3a://sec-fs-test/DATA/fs_num/", "run-2") == "s3a://sec-fs-test/DATA/fs_num_COMPACTED/run-2/"
+
+
+def test_compaction_location_of_an_already_compacted_table():
+    assert compaction_location("s3://sec-fs-test/DATA/fs_tag_COMPACTED/run-1", "run-2") == "s3://sec-fs-test/DATA/fs_tag_COMPACTED/run-2/"
+    assert compaction_location("s3://sec-fs-test/DATA/fs_tag_COMPACTED/run-1/", "run-2") == "s3://sec-fs-test/DATA/fs_tag_COMPACTED/run-2/"
+
+
+def test_partition_spec():
+    assert partition_spec("original_file_year=2009/original_file_quarter=1") == "original_file_year='2009', original_file_quarter='1'"
+    assert partition_spec("original_file_year=2009") == "original_file_year='2009'"
+
+
+def test_swaps_of_partitioned_table():
+    new_location = "s3://sec-fs-test/DATA/fs_num_COMPACTED/run-2/"
+    compacted = {
+        "original_file_year=2009/original_file_quarter=1": {
+            "s3_bucket": "sec-fs-test",
+            "files": {"DATA/fs_num/original_file_year=2009/original_file_quarter=1/part-1.parquet": {}, "DATA/fs_num/original_file_year=2009/original_file_quarter=1/part-0.parquet": {}},
+        },
+    }
+    assert plan_swaps("sec_fs.fs_num", compacted, new_location) == [{
+        "partition": "original_file_year=2009/original_file_quarter=1",
+        "statement": "ALTER TABLE sec_fs.fs_num PARTITION (original_file_year='2009', original_file_quarter='1') "
+                     "SET LOCATION 's3://sec-fs-test/DATA/fs_num_COMPACTED/run-2/original_file_year=2009/original_file_quarter=1/'",
+        "s3_bucket": "sec-fs-test",
+        "delete_keys": ["DATA/fs_num/original_file_year=2009/original_file_quarter=1/part-0.parquet", "DATA/fs_num/original_file_year=2009/original_file_quarter=1/part-1.parquet"],
+    }]
+
+
+def test_swaps_of_unpartitioned_table():
+    new_location = compaction_location("s3://sec-fs-test/DATA/fs_tag_COMPACTED/run-1", "run-2")
+    compacted = {None: {"s3_bucket": "sec-fs-test", "files": {"DATA/fs_tag_COMPACTED/run-1/part-0.parquet": {}}}}
+    [swap] = plan_swaps("sec_fs.fs_tag", compacted, new_location)
+    assert swap["statement"] == "ALTER TABLE sec_fs.fs_tag SET LOCATION 's3://sec-fs-test/DATA/fs_tag_COMPACTED/run-2/'"
+    assert swap["delete_keys"] == ["DATA/fs_tag_COMPACTED/run-1/part-0.parquet"]
+
+
+def test_swaps_never_delete_the_compacted_files():
+    # A run compacting again the partitions it already switched, e.g. once retried
+    new_location = "s3://sec-fs-test/DATA/fs_num_COMPACTED/run-2/"
+    compacted = {
+        "original_file_year=2009": {
+            "s3_bucket": "sec-fs-test",
+            "files": {"DATA/fs_num_COMPACTED/run-2/original_file_year=2009/part-0.parquet": {}, "DATA/fs_num/original_file_year=2009/part-0.parquet": {}},
+        },
+    }
+    assert plan_swaps("sec_fs.fs_num", compacted, new_location)[0]["delete_keys"] == ["DATA/fs_num/original_file_year=2009/part-0.parquet"]
+    # The same keys in another bucket aren't the compacted files
+    compacted["original_file_year=2009"]["s3_bucket"] = "sec-fs-other"
+    assert len(plan_swaps("sec_fs.fs_num", compacted, new_location)[0]["delete_keys"]) == 2
@@ -0,0 +1,62 @@
+from sec_fs_dataset_transformer.fact import changed_quarters, source_quarters
+from sec_fs_dataset_transformer.ledger import new_ledger, record_files
+
+
+def ledger(table_name: str, files: dict) -> dict:
+    return {"table_name": table_name, "files": files}
+
+
+SOURCE_LEDGERS = {
+    "fs_num": ledger("fs_num", {"2009q1.txt": {"size": 400, "ingested_at": "num-1"}, "2009q2.txt": {"size": 500, "ingested_at": "num-2"}}),
+    "fs_sub": ledger("fs_sub", {"2009q1.txt": {"size": 40, "ingested_at": "sub-1"}, "2009q2.txt": {"ingested_at": "sub-2"}}),
+}
+
+
+def test_source_quarters_keep_the_files_of_each_table():
+    assert source_quarters(SOURCE_LEDGERS) == {
+        "2009q1": {
+            "sources": {"fs_num/2009q1.txt": "num-1", "fs_sub/2009q1.txt": "sub-1"},
+            "files": {"fs_num/2009q1.txt": {"size": 400}, "fs_sub/2009q1.txt": {"size": 40}},
+        },
+        "2009q2": {
+            "sources": {"fs_num/2009q2.txt": "num-2", "fs_sub/2009q2.txt": "sub-2"},
+            "files": {"fs_num/2009q2.txt": {"size": 500}, "fs_sub/2009q2.txt": {"size": 0}},
+        },
+    }
+
+
+def built(quarters: dict, built_quarters) -> dict:
+    fact_ledger = new_ledger("fs_fact")
+    record_files(fact_ledger, {quarter: {"sources": quarters[quarter]["sources"]} for quarter in built_quarters})
+    return fact_ledger
+
+
+def test_every_quarter_is_built_first():
+    assert changed_quarters(source_quarters(SOURCE_LEDGERS), new_ledger("fs_fact")) == ["2009q1", "2009q2"]
+
+
+def test_built_quarters_are_up_to_date():
+    quarters = source_quarters(SOURCE_LEDGERS)
+    assert changed_quarters(quarters, built(quarters, ["2009q1", "2009q2"])) == []
+    assert changed_quarters(quarters, built(quarters, ["2009q2"])) == ["2009q1"]
+
+
+def test_quarter_of_a_reingested_num_file_is_rebuilt():
+    quarters = source_quarters(SOURCE_LEDGERS)
+    fact_ledger = built(quarters, ["2009q1", "2009q2"])
+    reingested = {**SOURCE_LEDGERS, "fs_num": ledger("fs_num", {**SOURCE_LEDGERS["fs_num"]["files"], "2009q1.txt": {"size": 400, "ingested_at": "num-1-again"}})}
+    assert changed_quarters(source_quarters(reingested), fact_ledger) == ["2009q1"]
+
+
+def test_quarter_of_a_reingested_sub_file_is_rebuilt():
+    quarters = source_quarters(SOURCE_LEDGERS)
+    fact_ledger = built(quarters, ["2009q1", "2009q2"])
+    reingested = {**SOURCE_LEDGERS, "fs_sub": ledger("fs_sub", {**SOURCE_LEDGERS["fs_sub"]["files"], "2009q2.txt": {"ingested_at": "sub-2-again"}})}
+    assert changed_quarters(source_quarters(reingested), fact_ledger) == ["2009q2"]
+
+
+def test_new_quarter_is_built():
+    quarters = source_quarters(SOURCE_LEDGERS)
+    fact_ledger = built(quarters, ["2009q1", "2009q2"])
+    new_quarter = {table_name: ledger(table_name, {**source["files"], "2009q3.txt": {"size": 1, "ingested_at": "3"}}) for table_name, source in SOURCE_LEDGERS.items()}
+    assert changed_quarters(source_quarters(new_quarter), fact_ledger) == ["2009q3"]
@@ -0,0 +1,48 @@
+import pytest
+
+from sec_fs_dataset_transformer.ledger import is_ingested, ledger_key, load_ledger, new_ledger, record_file_names, record_files, save_ledger
+from tests.utils import BUCKET
+
+
+def test_ledger_key():
+    assert ledger_key("DATA/LEDGER/", "fs_num") == "DATA/LEDGER/fs_num.json"
+
+
+def test_missing_ledger(s3_client):
+    assert load_ledger(s3_client, BUCKET, ledger_key("DATA/LEDGER/", "fs_num")) is None
+
+
+def test_save_and_load_ledger(s3_client):
+    key = ledger_key("DATA/LEDGER/", "fs_num")
+    ledger = new_ledger("fs_num")
+    record_files(ledger, {"num_2009q1.txt": {"size": 10, "etag": '"a"'}})
+    save_ledger(s3_client, BUCKET, key, ledger)
+    assert load_ledger(s3_client, BUCKET, key) == ledger
+
+
+def test_saved_ledger_replaces_previous(s3_client):
+    key = ledger_key("DATA/LEDGER/", "fs_num")
+    ledger = new_ledger("fs_num")
+    record_file_names(ledger, ["num_2009q1.txt"])
+    save_ledger(s3_client, BUCKET, key, ledger)
+    record_file_names(ledger, ["num_2009q2.txt"])
+    save_ledger(s3_client, BUCKET, key, ledger)
+    assert sorted(load_ledger(s3_client, BUCKET, key)["files"]) == ["num_2009q1.txt", "num_2009q2.txt"]
+
+
+def test_other_errors_are_raised(s3_client):
+    with pytest.raises(s3_client.exceptions.NoSuchBucket):
+        load_ledger(s3_client, "missing-bucket", "DATA/LEDGER/fs_num.json")
+
+
+def test_is_ingested():
+    ledger = new_ledger("fs_num")
+    record_files(ledger, {"num_2009q1.txt": {"size": 10, "etag": '"a"'}})
+    record_file_names(ledger, ["num_2009q2.txt"])
+    assert ledger["files"]["num_2009q1.txt"]["size"] == 10 and "ingested_at" in ledger["files"]["num_2009q1.txt"]
+    assert is_ingested(ledger, "num_2009q1.txt")
+    assert is_ingested(ledger, "num_2009q1.txt", '"a"')
+    assert not is_ingested(ledger, "num_2009q1.txt", '"b"')
+    # Recorded without an ETag
+    assert is_ingested(ledger, "num_2009q2.txt", '"b"')
+    assert not is_ingested(ledger, "num_2009q3.txt")
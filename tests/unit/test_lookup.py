@@ -0,0 +1,48 @@
+import pytest
+
+from sec_fs_dataset_transformer.lookup import index_query, join_lookup_query, lookup_query, quarters_predicate, sql_literal
+
+
+def test_sql_literal():
+    assert sql_literal(320193) == "320193"
+    assert sql_literal(1.5) == "1.5"
+    assert sql_literal("0000320193-09-000001") == "'0000320193-09-000001'"
+    # Quotes are doubled, so that a value can't end the literal
+    assert sql_literal("O'Reilly") == "'O''Reilly'"
+    assert sql_literal("x' OR '1'='1") == "'x'' OR ''1''=''1'"
+
+
+def test_quarters_predicate():
+    assert quarters_predicate(["2009q2", "2009q1", "2009q2"]) == \
+        "((original_file_year = '2009' AND original_file_quarter = '1') OR (original_file_year = '2009' AND original_file_quarter = '2'))"
+    # No quarter selects no partition
+    assert quarters_predicate([]) == "(FALSE)"
+
+
+def test_index_query():
+    assert index_query("sec_fs", adsh=["0001-1"]) == \
+        "SELECT DISTINCT adsh, original_file_year, original_file_quarter FROM sec_fs.fs_sub_index WHERE adsh IN ('0001-1')"
+    assert index_query("sec_fs", adsh=["0001-1", "0001-2"], cik=[320193], index_table_name="idx") == \
+        "SELECT DISTINCT adsh, original_file_year, original_file_quarter FROM sec_fs.idx WHERE adsh IN ('0001-1', '0001-2') OR cik IN (320193)"
+    with pytest.raises(ValueError):
+        index_query("sec_fs")
+
+
+def test_lookup_query():
+    assert lookup_query("sec_fs", "fs_num", [("0001-1", "2009", "1"), ("0001-2", "2009", "2")], columns="adsh, value") == (
+        "SELECT adsh, value FROM sec_fs.fs_num WHERE "
+        "((original_file_year = '2009' AND original_file_quarter = '1') OR (original_file_year = '2009' AND original_file_quarter = '2')) "
+        "AND adsh IN ('0001-1', '0001-2')"
+    )
+    # Submissions missing from the index read nothing
+    assert lookup_query("sec_fs", "fs_num", []) == "SELECT * FROM sec_fs.fs_num WHERE (FALSE) AND adsh IN (NULL)"
+
+
+def test_join_lookup_query():
+    assert join_lookup_query("sec_fs", "fs_pre", cik=[320193]) == (
+        "SELECT t.* FROM sec_fs.fs_pre t JOIN "
+        "(SELECT DISTINCT adsh, original_file_year, original_file_quarter FROM sec_fs.fs_sub_index WHERE cik IN (320193)) i "
+        "ON t.original_file_year = i.original_file_year AND t.original_file_quarter = i.original_file_quarter AND t.adsh = i.adsh"
+    )
+    with pytest.raises(ValueError):
+        join_lookup_query("sec_fs", "fs_pre")
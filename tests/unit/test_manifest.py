@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+from sec_fs_dataset_collector.manifest import build_manifest, conditional_headers, download_info, is_not_modified, is_same_archive, is_same_version, load_manifest, manifest_key, save_manifest
+from tests.utils import BUCKET
+
+ETAG = '"5d41402abc4b2a76b9719d911017c592"'
+LAST_MODIFIED = "Tue, 01 Oct 2024 12:00:00 GMT"
+MANIFEST = {"etag": ETAG, "last_modified": LAST_MODIFIED, "size": 1000, "sha256": "abc", "members": ["num.txt", "sub.txt"], "member_sha256": {"num.txt": "n", "sub.txt": "s"}}
+
+
+def response(status_code=200, **headers):
+    return SimpleNamespace(status_code=status_code, headers={name.replace("_", "-"): value for name, value in headers.items()})
+
+
+def test_conditional_headers():
+    assert conditional_headers(MANIFEST) == {"If-None-Match": ETAG, "If-Modified-Since": LAST_MODIFIED}
+    assert conditional_headers({"last_modified": LAST_MODIFIED}) == {"If-Modified-Since": LAST_MODIFIED}
+    assert conditional_headers({}) == {}
+
+
+def test_not_modified_response():
+    assert is_not_modified(response(304), MANIFEST)
+
+
+def test_server_ignoring_conditional_headers():
+    assert is_not_modified(response(ETag=ETAG, Content_Length="1000"), MANIFEST)
+    assert not is_not_modified(response(ETag='"other"', Content_Length="1000"), MANIFEST)
+    assert not is_not_modified(response(ETag=ETAG, Content_Length="1001"), MANIFEST)
+    assert not is_not_modified(response(ETag=ETAG), MANIFEST)
+    assert not is_not_modified(response(ETag=ETAG, Content_Length="1000"), None)
+
+
+def test_same_version_by_strong_etag():
+    assert is_same_version(ETAG, "Wed, 02 Oct 2024 12:00:00 GMT", 1000, MANIFEST)
+    assert not is_same_version('"other"', LAST_MODIFIED, 1000, MANIFEST)
+
+
+def test_same_version_by_last_modified_without_strong_etag():
+    assert is_same_version(None, LAST_MODIFIED, 1000, MANIFEST)
+    assert is_same_version("W/" + ETAG, LAST_MODIFIED, 1000, MANIFEST)
+    assert not is_same_version("W/" + ETAG, "Wed, 02 Oct 2024 12:00:00 GMT", 1000, MANIFEST)
+    assert not is_same_version(None, None, 1000, MANIFEST)
+    assert is_same_version(ETAG, LAST_MODIFIED, 1000, {**MANIFEST, "etag": None})
+
+
+def test_same_archive_by_sha256_first():
+    assert is_same_archive(MANIFEST, {"sha256": "abc", "etag": '"other"', "size": 1})
+    assert not is_same_archive(MANIFEST, {"sha256": "def", "etag": ETAG, "last_modified": LAST_MODIFIED, "size": 1000})
+    # Ranged downloads have no sha256 of the whole archive
+    assert is_same_archive(MANIFEST, {"sha256": None, "etag": ETAG, "size": 1000})
+
+
+def test_manifest_of_same_archive_keeps_previous_members():
+    download = download_info(response(ETag=ETAG, Last_Modified=LAST_MODIFIED), 1000, "abc", {"pre.txt": "p"})
+    manifest = build_manifest("2009q1.zip", "https://www.sec.gov/2009q1.zip", download, ["pre.txt"], previous=MANIFEST)
+    assert manifest["members"] == ["num.txt", "pre.txt", "sub.txt"]
+    assert manifest["member_sha256"] == {"num.txt": "n", "sub.txt": "s", "pre.txt": "p"}
+
+
+def test_manifest_of_changed_archive_drops_previous_members():
+    download = download_info(response(ETag='"other"', Last_Modified=LAST_MODIFIED), 1000, "def", {"pre.txt": "p"})
+    manifest = build_manifest("2009q1.zip", "https://www.sec.gov/2009q1.zip", download, ["pre.txt"], previous=MANIFEST)
+    assert manifest["members"] == ["pre.txt"]
+    assert manifest["member_sha256"] == {"pre.txt": "p"}
+
+
+def test_manifest_in_another_format_drops_previous_members():
+    download = download_info(response(ETag=ETAG, Last_Modified=LAST_MODIFIED), 1000, "abc")
+    manifest = build_manifest("2009q1.zip", "https://www.sec.gov/2009q1.zip", download, ["pre.txt"], output_format="parquet", previous=MANIFEST)
+    assert manifest["members"] == ["pre.txt"]
+
+
+def test_save_and_load_manifest(s3_client):
+    key = manifest_key("DATA/MANIFEST/", "2009", "1")
+    assert key == "DATA/MANIFEST/2009q1.json"
+    assert load_manifest(s3_client, BUCKET, key) is None
+    save_manifest(s3_client, BUCKET, key, MANIFEST)
+    assert load_manifest(s3_client, BUCKET, key) == MANIFEST
@@ -0,0 +1,51 @@
+import io
+import json
+
+import pytest
+
+from sec_fs_metrics.metrics import CloudWatchSink, EmfSink, JsonLinesSink, Metrics, NullSink, sink_from_uri
+
+
+def published(cloudwatch_client, namespace="SecFsDatasets"):
+    return {
+        (metric["MetricName"], tuple(sorted((dimension["Name"], dimension["Value"]) for dimension in metric["Dimensions"])))
+        for metric in cloudwatch_client.list_metrics(Namespace=namespace)["Metrics"]
+    }
+
+
+def test_cloudwatch_sink_publishes_stages(cloudwatch_client):
+    sink = CloudWatchSink(cloudwatch_client=cloudwatch_client)
+    metrics = Metrics(sink, job="transform")
+    with metrics.stage("write", table="fs_num", batch=1) as stage:
+        stage.bytes = 100
+    sink.flush()
+    dimensions = (("job", "transform"), ("stage", "write"), ("table", "fs_num"))
+    assert published(cloudwatch_client) == {("duration_ms", dimensions), ("bytes", dimensions), ("s3_calls", dimensions)}
+
+
+def test_cloudwatch_sink_sends_batches(cloudwatch_client):
+    sink = CloudWatchSink(cloudwatch_client=cloudwatch_client, batch_size=2)
+    sink.emit({"job": "collect", "stage": "upload", "duration_ms": 1.0, "bytes": 10, "s3_calls": 2})
+    # The batch is sent once full, the rest waits for the next measures or the flush
+    assert len(published(cloudwatch_client)) == 2
+    sink.flush()
+    assert len(published(cloudwatch_client)) == 3
+
+
+def test_emf_sink():
+    stream = io.StringIO()
+    EmfSink(stream=stream).emit({"job": "collect", "stage": "upload", "quarter": "2009q1", "duration_ms": 1.0, "rows": None})
+    event = json.loads(stream.getvalue())
+    assert event["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["job", "stage"]]
+    assert event["_aws"]["CloudWatchMetrics"][0]["Metrics"] == [{"Name": "duration_ms", "Unit": "Milliseconds"}]
+    assert event["quarter"] == "2009q1" and "rows" not in event
+
+
+def test_sink_from_uri(cloudwatch_client, tmp_path):
+    assert isinstance(sink_from_uri("cloudwatch"), CloudWatchSink)
+    assert sink_from_uri("cloudwatch:Other").namespace == "Other"
+    assert isinstance(sink_from_uri("emf"), EmfSink)
+    assert isinstance(sink_from_uri("jsonl:"+str(tmp_path / "metrics.jsonl")), JsonLinesSink)
+    assert isinstance(sink_from_uri(None), NullSink)
+    with pytest.raises(ValueError):
+        sink_from_uri("statsd")
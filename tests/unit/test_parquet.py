@@ -0,0 +1,46 @@
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sec_fs_dataset_collector.parquet import IterableStream, convert_tsv_to_parquet
+
+
+def convert(text: str, **options):
+    sink = io.BytesIO()
+    rows = convert_tsv_to_parquet(io.BytesIO(text.encode("utf-8")), sink, **options)
+    sink.seek(0)
+    return rows, pq.read_table(sink)
+
+
+def test_round_trip():
+    rows, table = convert('adsh\ttag\tvalue\tfootnote\n0001-1\tAssets\t1.5E3\t"quoted" text\n0001-2\tCash\t\t\n')
+    assert rows == 2
+    # Every column stays a string, the values are kept as they are and the empty ones are null
+    assert table.schema == pa.schema([(name, pa.string()) for name in ("adsh", "tag", "value", "footnote")])
+    assert table.to_pylist() == [
+        {"adsh": "0001-1", "tag": "Assets", "value": "1.5E3", "footnote": '"quoted" text'},
+        {"adsh": "0001-2", "tag": "Cash", "value": None, "footnote": None},
+    ]
+
+
+def test_header_only_file():
+    rows, table = convert("adsh\ttag\n")
+    assert rows == 0
+    assert (table.num_rows, table.column_names) == (0, ["adsh", "tag"])
+
+
+def test_malformed_row_is_skipped():
+    invalid_rows = []
+    rows, table = convert("adsh\ttag\n0001-1\tAssets\n0001-2\tCash\textra\n0001-3\tDebt\n", invalid_rows=invalid_rows)
+    assert rows == 2
+    assert table.column("adsh").to_pylist() == ["0001-1", "0001-3"]
+    assert invalid_rows == ["0001-2\tCash\textra"]
+
+
+def test_conversion_of_chunked_stream():
+    chunks = [b"adsh\tta", b"g\n0001-1\tAss", b"ets\r\n", b"0001-2\tCash\n"]
+    sink = io.BytesIO()
+    assert convert_tsv_to_parquet(IterableStream(chunks), sink) == 2
+    sink.seek(0)
+    assert pq.read_table(sink).column("tag").to_pylist() == ["Assets", "Cash"]
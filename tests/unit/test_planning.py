@@ -0,0 +1,53 @@
+from sec_fs_dataset_transformer.planning import MAX_BUCKETS, MAX_SHUFFLE_PARTITIONS, estimate_output_bytes, plan_batches, plan_buckets, plan_write
+
+MB = 1024 * 1024
+
+
+def files(*sizes, extension="txt"):
+    return {"num_2009q{}.{}".format(index, extension): {"size": size} for index, size in enumerate(sizes, start=1)}
+
+
+def test_batches_in_chronological_order():
+    files = {"num_2010q1.txt": {"size": 1}, "num_2009q2.txt": {"size": 1}, "num_2009q1.txt": {"size": 1}}
+    assert plan_batches(files, max_batch_bytes=10) == [["num_2009q1.txt", "num_2009q2.txt", "num_2010q1.txt"]]
+
+
+def test_batches_bounded_by_size():
+    assert plan_batches(files(4, 4, 4, 4), max_batch_bytes=8) == [["num_2009q1.txt", "num_2009q2.txt"], ["num_2009q3.txt", "num_2009q4.txt"]]
+    assert plan_batches(files(4, 5, 4), max_batch_bytes=8) == [["num_2009q1.txt"], ["num_2009q2.txt"], ["num_2009q3.txt"]]
+
+
+def test_file_bigger_than_a_batch_gets_its_own():
+    assert plan_batches(files(1, 20, 1), max_batch_bytes=8) == [["num_2009q1.txt"], ["num_2009q2.txt"], ["num_2009q3.txt"]]
+
+
+def test_no_files_no_batches():
+    assert plan_batches({}) == []
+
+
+def test_estimate_output_bytes():
+    assert estimate_output_bytes(files(400 * MB)) == 100 * MB
+    assert estimate_output_bytes(files(400 * MB, extension="parquet")) == 400 * MB
+
+
+def test_plan_buckets():
+    assert plan_buckets(files(4 * 1024 * MB), partitions=1, target_file_bytes=256 * MB) == 4
+    assert plan_buckets(files(4 * 1024 * MB), partitions=4, target_file_bytes=256 * MB) == 1
+    assert plan_buckets(files(1), partitions=0) == 1
+    assert plan_buckets(files(1024 * 1024 * MB), partitions=1) == MAX_BUCKETS
+
+
+def test_plan_write():
+    plan = plan_write(files(4 * 1024 * MB, 4 * 1024 * MB), partitions=2, target_file_bytes=256 * MB)
+    assert plan == {"estimated_bytes": 2 * 1024 * MB, "partitions": 2, "files_per_partition": 4, "shuffle_partitions": 8}
+
+
+def test_plan_write_of_bucketed_table():
+    plan = plan_write(files(1), partitions=3, num_buckets=16)
+    assert (plan["files_per_partition"], plan["shuffle_partitions"]) == (16, 48)
+    assert plan_write(files(1), partitions=1000, num_buckets=16)["shuffle_partitions"] == MAX_SHUFFLE_PARTITIONS
+
+
+def test_plan_write_of_fixed_files_per_partition():
+    plan = plan_write(files(64 * 1024 * MB), partitions=3, target_file_bytes=256 * MB, files_per_partition=1)
+    assert (plan["files_per_partition"], plan["shuffle_partitions"]) == (1, 3)
@@ -0,0 +1,45 @@
+import threading
+import time
+
+import pytest
+
+from sec_fs_dataset_collector.rate_limit import RateLimiter
+
+
+def test_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        RateLimiter(0)
+
+
+def test_first_call_is_not_delayed():
+    start = time.monotonic()
+    RateLimiter(1).acquire()
+    assert time.monotonic() - start < 0.5
+
+
+def test_calls_are_spaced_out():
+    rate_limiter = RateLimiter(50)
+    start = time.monotonic()
+    for _ in range(6):
+        rate_limiter.acquire()
+    # The first call returns at once, each following one 1/50 s after the previous
+    assert time.monotonic() - start >= 5 / 50
+
+
+def test_calls_of_several_threads_share_the_rate():
+    rate_limiter = RateLimiter(100)
+    returned = []
+    lock = threading.Lock()
+    def acquire():
+        for _ in range(5):
+            rate_limiter.acquire()
+            with lock:
+                returned.append(time.monotonic())
+    threads = [threading.Thread(target=acquire) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    returned.sort()
+    assert len(returned) == 20
+    assert returned[-1] - returned[0] >= 19 / 100 - 0.01
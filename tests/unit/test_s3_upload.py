@@ -0,0 +1,89 @@
+import hashlib
+import io
+
+import pytest
+
+from sec_fs_dataset_collector.collect_sec_fs_datasets import upload_member
+from sec_fs_dataset_collector.s3_upload import MIN_PART_SIZE, S3MultipartUpload
+from sec_fs_metrics.metrics import Stage
+from tests.utils import BUCKET
+
+MEMBER = b"tag\tversion\nAssets\tus-gaap/2008\n"
+
+
+class UnusedClient:
+    """
+    S3 client failing on any call, for uploads which shouldn't reach S3
+    """
+
+    def __getattr__(self, name):
+        raise AssertionError("Unexpected call to {}".format(name))
+
+
+def test_unchanged_member_is_not_sent():
+    sha256 = hashlib.sha256(MEMBER).hexdigest()
+    assert upload_member(io.BytesIO(MEMBER), UnusedClient(), BUCKET, "FS_TAG/tag.txt", unchanged_sha256=sha256) == sha256
+
+
+def test_changed_member_is_sent_from_its_temporary_file(s3_client):
+    s3_client.put_object(Bucket=BUCKET, Key="FS_TAG/tag.txt", Body=b"previous")
+    assert upload_member(io.BytesIO(MEMBER), s3_client, BUCKET, "FS_TAG/tag.txt", unchanged_sha256="previous") == hashlib.sha256(MEMBER).hexdigest()
+    assert s3_client.get_object(Bucket=BUCKET, Key="FS_TAG/tag.txt")["Body"].read() == MEMBER
+    upload_member(io.BytesIO(MEMBER), s3_client, BUCKET, "FS_TAG/tag.parquet", output_format="parquet", unchanged_sha256="previous")
+    assert s3_client.get_object(Bucket=BUCKET, Key="FS_TAG/tag.parquet")["Body"].read(4) == b"PAR1"
+
+
+def uploaded(s3_client, key: str) -> bytes:
+    return s3_client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+
+
+def test_data_smaller_than_a_part_is_put_at_once(s3_client):
+    with S3MultipartUpload(s3_client, BUCKET, "small", part_size=MIN_PART_SIZE) as upload:
+        upload.write(b"abc")
+        upload.write(b"def")
+    assert (upload.upload_id, upload.parts) == (None, [])
+    assert uploaded(s3_client, "small") == b"abcdef"
+
+
+@pytest.mark.parametrize("size, parts", [(MIN_PART_SIZE, 1), (2 * MIN_PART_SIZE, 2), (2 * MIN_PART_SIZE + 1, 3)])
+def test_parts_are_cut_at_part_size(s3_client, size, parts):
+    data = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+    with S3MultipartUpload(s3_client, BUCKET, "large", part_size=MIN_PART_SIZE) as upload:
+        # Writes which don't line up with the parts
+        for start in range(0, size, 3 * 1024 * 1024):
+            upload.write(data[start:start + 3 * 1024 * 1024])
+        assert upload.tell() == size
+    assert [part["PartNumber"] for part in upload.parts] == list(range(1, parts + 1))
+    assert uploaded(s3_client, "large") == data
+
+
+def test_upload_is_aborted_on_error(s3_client):
+    with pytest.raises(RuntimeError):
+        with S3MultipartUpload(s3_client, BUCKET, "failed", part_size=MIN_PART_SIZE) as upload:
+            upload.write(b"x" * MIN_PART_SIZE)
+            raise RuntimeError("failed while reading the member")
+    assert upload.upload_id is not None
+    assert s3_client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+    assert s3_client.list_objects_v2(Bucket=BUCKET)["KeyCount"] == 0
+    with pytest.raises(ValueError):
+        upload.write(b"x")
+
+
+def test_part_size_below_s3_minimum_is_rejected(s3_client):
+    with pytest.raises(ValueError):
+        S3MultipartUpload(s3_client, BUCKET, "key", part_size=MIN_PART_SIZE - 1)
+
+
+def test_zero_byte_member(s3_client):
+    stage = Stage("member", {})
+    assert upload_member(io.BytesIO(b""), s3_client, BUCKET, "FS_NUM/2009q1.txt", stage=stage) == hashlib.sha256(b"").hexdigest()
+    assert uploaded(s3_client, "FS_NUM/2009q1.txt") == b""
+    assert (stage.bytes, stage.rows) == (0, 0)
+
+
+def test_member_spanning_several_parts(s3_client):
+    member = b"adsh\ttag\n" + b"0001-1\tAssets\n" * (MIN_PART_SIZE // 14 + 1)
+    stage = Stage("member", {})
+    upload_member(io.BytesIO(member), s3_client, BUCKET, "FS_NUM/2009q1.txt", part_size=MIN_PART_SIZE, stage=stage)
+    assert uploaded(s3_client, "FS_NUM/2009q1.txt") == member
+    assert (stage.bytes, stage.rows) == (len(member), MIN_PART_SIZE // 14 + 1)
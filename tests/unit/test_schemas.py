@@ -0,0 +1,64 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from sec_fs_dataset_transformer.schemas import apply_schema, stale_columns, stale_columns_message
+
+
+def test_stale_columns_of_all_string_table():
+    stale = stale_columns("fs_num", {"adsh": "string", "ddate": "string", "qtrs": "int", "value": "string"})
+    assert stale == {"ddate": ("string", "date"), "value": ("string", "decimal(28,4)")}
+    assert stale_columns_message("sec_fs.fs_num", stale).startswith(
+        "sec_fs.fs_num has the columns ddate string, value string instead of ddate date, value decimal(28,4), it was created by a previous version"
+    )
+
+
+def test_table_with_registered_types_is_up_to_date():
+    assert stale_columns("fs_num", {"adsh": "string", "ddate": "date", "qtrs": "int", "value": "decimal(28,4)"}) == {}
+    # Tables without registered types keep their strings
+    assert stale_columns("fs_other", {"adsh": "string"}) == {}
+
+
+@pytest.fixture(scope="module")
+def spark():
+    pyspark = pytest.importorskip("pyspark")
+    spark = pyspark.sql.SparkSession.builder.master("local[1]").appName("test_schemas").getOrCreate()
+    yield spark
+    spark.stop()
+
+
+def raw_num(spark):
+    # Read as strings like the raw files, the second row has a malformed date
+    return spark.createDataFrame(
+        [("0001-1", "20081231", "4", "12.34567"), ("0001-2", "2008-12-31", "0", "1"), ("0001-3", None, None, None)],
+        "adsh string, ddate string, qtrs string, value string",
+    )
+
+
+def test_apply_schema_casts_the_columns(spark):
+    data_frame = apply_schema(raw_num(spark).where("adsh != '0001-2'"), "fs_num")
+    assert dict(data_frame.dtypes) == {"adsh": "string", "ddate": "date", "qtrs": "int", "value": "decimal(28,4)"}
+    assert [tuple(row) for row in data_frame.orderBy("adsh").collect()] == [
+        ("0001-1", datetime.date(2008, 12, 31), 4, Decimal("12.3457")),
+        ("0001-3", None, None, None),
+    ]
+
+
+def test_permissive_policy_nulls_the_malformed_values(spark):
+    rows = {row.adsh: row for row in apply_schema(raw_num(spark), "fs_num", "permissive").collect()}
+    assert (rows["0001-2"].ddate, rows["0001-2"].qtrs) == (None, 0)
+
+
+def test_drop_policy_drops_the_malformed_rows(spark):
+    assert sorted(row.adsh for row in apply_schema(raw_num(spark), "fs_num", "drop").collect()) == ["0001-1", "0001-3"]
+
+
+def test_fail_policy_fails_on_malformed_values(spark):
+    with pytest.raises(Exception, match="Malformed date value for fs_num.ddate: 2008-12-31"):
+        apply_schema(raw_num(spark), "fs_num", "fail").collect()
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        apply_schema(None, "fs_num", "ignore")
@@ -0,0 +1,58 @@
+import json
+from decimal import Decimal
+
+import pyarrow as pa
+
+from sec_fs_dataset_transformer.stats import STATS_COLUMNS, arrow_stats_records, save_stats, spark_stats_records, stats_key
+from tests.utils import BUCKET
+
+PARTITION_COLS = ["original_file_year", "original_file_quarter"]
+
+
+def test_stats_of_partitioned_table():
+    table = pa.table({
+        "adsh": ["0001-1", "0001-1", "0001-2", "0002-1"],
+        "qtrs": pa.array([4, None, 0, 1], pa.int32()),
+        "value": pa.array([Decimal("1.5"), None, Decimal("-2"), Decimal("3")], pa.decimal128(28, 4)),
+        "original_file_name": ["2009q1.txt", "2009q1.txt", "2009q1.txt", "2009q2.txt"],
+    })
+    raw_files = {"2009q1.txt": {"size": 100}, "2009q2.txt": {"size": 50}}
+    records = {(record["file_name"], record["column_name"]): record for record in arrow_stats_records(table, "fs_num", raw_files, PARTITION_COLS)}
+    assert sorted(records) == [(file_name, column) for file_name in ("2009q1.txt", "2009q2.txt") for column in ("adsh", "qtrs", "value")]
+    assert [name for name, _ in STATS_COLUMNS] == list(records["2009q1.txt", "adsh"])
+    value = records["2009q1.txt", "value"]
+    assert (value["original_file_year"], value["original_file_quarter"], value["row_count"], value["raw_bytes"]) == ("2009", "1", 3, 100)
+    assert (value["null_count"], value["min_value"], value["max_value"], value["approx_distinct"]) == (1, "-2.0000", "1.5000", None)
+    assert records["2009q1.txt", "adsh"]["approx_distinct"] == 2
+    assert records["2009q2.txt", "qtrs"]["min_value"] == "1"
+
+
+def test_stats_of_unpartitioned_table():
+    table = pa.table({"tag": ["Assets", "Cash"], "custom": [False, True], "original_file_name": ["tag.txt", "tag.txt"]})
+    records = arrow_stats_records(table, "fs_tag", {"tag.txt": {"size": 10}}, [])
+    assert {(record["original_file_year"], record["original_file_quarter"]) for record in records} == {(None, None)}
+    # Booleans have no min and max
+    assert [record["min_value"] for record in records if record["column_name"] == "custom"] == [None]
+
+
+def test_stats_of_spark_aggregation():
+    names = {"stats_0": (None, "row_count"), "stats_1": ("qtrs", "null_count"), "stats_2": ("qtrs", "min"), "stats_3": ("qtrs", "max")}
+    rows = [
+        {"original_file_name": "2009q1.txt", "stats_0": 3, "stats_1": 1, "stats_2": 0, "stats_3": 4},
+        {"original_file_name": "2009q2.txt", "stats_0": 1, "stats_1": 0, "stats_2": 1, "stats_3": 1},
+    ]
+    raw_files = {"2009q1.txt": {"size": 100}, "2009q2.txt": {"size": 50}}
+    records = {record["file_name"]: record for record in spark_stats_records(rows, names, "fs_num", raw_files, PARTITION_COLS)}
+    assert sorted(records) == ["2009q1.txt", "2009q2.txt"]
+    first = records["2009q1.txt"]
+    assert (first["column_name"], first["row_count"], first["null_count"], first["min_value"], first["max_value"], first["raw_bytes"]) == ("qtrs", 3, 1, "0", "4", 100)
+    assert (records["2009q2.txt"]["original_file_quarter"], records["2009q2.txt"]["row_count"]) == ("2", 1)
+
+
+def test_save_stats_replaces_the_stats_of_a_file(s3_client):
+    table = pa.table({"tag": ["Assets"], "original_file_name": ["tag.txt"]})
+    for _ in range(2):
+        save_stats(s3_client, BUCKET, "DATA/STATS/", arrow_stats_records(table, "fs_tag", {"tag.txt": {"size": 10}}, []))
+    assert [obj["Key"] for obj in s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]] == [stats_key("DATA/STATS/", "fs_tag", "tag.txt")]
+    lines = s3_client.get_object(Bucket=BUCKET, Key="DATA/STATS/fs_tag_tag.json")["Body"].read().decode("utf-8").splitlines()
+    assert [json.loads(line)["column_name"] for line in lines] == ["tag"]
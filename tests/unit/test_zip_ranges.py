@@ -0,0 +1,103 @@
+import io
+import struct
+import zipfile
+
+import pytest
+
+from sec_fs_dataset_collector.zip_ranges import TAIL_SIZE, MemberRange, ZipEntry, find_central_directory, member_ranges, parse_central_directory, parse_zip64_end_of_central_directory
+from sec_fs_dataset_collector.zip_stream import BadZipStream
+
+MEMBERS = {
+    "sub.txt": b"adsh\tcik\tname\n" * 200,
+    "num.txt": b"adsh\ttag\tversion\tvalue\n" * 500,
+    "pre.txt": b"adsh\treport\tline\n" * 300,
+}
+
+
+def zip_archive(comment: bytes = b"") -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in MEMBERS.items():
+            archive.writestr(name, data)
+        archive.comment = comment
+    return buffer.getvalue()
+
+
+def central_directory(archive: bytes, tail_size: int = TAIL_SIZE):
+    tail_offset = max(0, len(archive) - tail_size)
+    offset, size, zip64_end_offset = find_central_directory(archive[tail_offset:], tail_offset)
+    return offset, size, zip64_end_offset
+
+
+@pytest.mark.parametrize("comment", [b"", b"x" * 1000], ids=["no comment", "comment"])
+def test_central_directory_entries_match_zipfile(comment):
+    archive = zip_archive(comment)
+    offset, size, zip64_end_offset = central_directory(archive)
+    assert zip64_end_offset is None
+    entries = parse_central_directory(archive[offset:offset + size])
+    infos = zipfile.ZipFile(io.BytesIO(archive)).infolist()
+    assert entries == [ZipEntry(info.filename, info.header_offset, info.compress_size, info.file_size) for info in infos]
+
+
+def test_central_directory_of_tail_only():
+    archive = zip_archive()
+    offset, size, _ = central_directory(archive, tail_size=200)
+    assert offset + size <= len(archive)
+    assert [entry.name for entry in parse_central_directory(archive[offset:offset + size])] == list(MEMBERS)
+
+
+def test_missing_end_of_central_directory():
+    with pytest.raises(BadZipStream):
+        find_central_directory(b"not an archive" * 10, 0)
+
+
+def test_invalid_central_directory_offset():
+    archive = bytearray(zip_archive())
+    end = archive.rfind(b"PK\x05\x06")
+    archive[end + 16:end + 20] = struct.pack("<I", len(archive))
+    with pytest.raises(BadZipStream):
+        central_directory(bytes(archive))
+
+
+def zip64_central_directory_entry(name: bytes, offset: int, compressed_size: int, size: int) -> bytes:
+    extra = struct.pack("<HHQQQ", 0x0001, 24, size, compressed_size, offset)
+    return struct.pack(
+        "<4sHHHHHHIIIHHHHHII", b"PK\x01\x02", 45, 45, 0, 8, 0, 0, 0, 0xFFFFFFFF, 0xFFFFFFFF, len(name), len(extra), 0, 0, 0, 0, 0xFFFFFFFF
+    ) + name + extra
+
+
+def test_zip64_central_directory():
+    cd_offset = 6 * 2 ** 32
+    directory = zip64_central_directory_entry(b"num.txt", 5 * 2 ** 32, 2 ** 32 + 1, 3 * 2 ** 32)
+    zip64_end_offset = cd_offset + len(directory)
+    zip64_end = struct.pack("<4sQHHIIQQQQ", b"PK\x06\x06", 44, 45, 45, 0, 0, 1, 1, len(directory), cd_offset)
+    locator = struct.pack("<4sIQI", b"PK\x06\x07", 0, zip64_end_offset, 1)
+    end = struct.pack("<4sHHHHIIH", b"PK\x05\x06", 0, 0, 1, 1, 0xFFFFFFFF, 0xFFFFFFFF, 0)
+    tail = directory + zip64_end + locator + end
+
+    _, _, found_zip64_end_offset = find_central_directory(tail, cd_offset)
+    assert found_zip64_end_offset == zip64_end_offset
+    assert parse_zip64_end_of_central_directory(zip64_end) == (cd_offset, len(directory))
+    assert parse_central_directory(directory) == [ZipEntry("num.txt", 5 * 2 ** 32, 2 ** 32 + 1, 3 * 2 ** 32)]
+
+
+def test_member_ranges_span_to_next_record():
+    entries = [ZipEntry("sub.txt", 0, 50, 100), ZipEntry("num.txt", 100, 50, 100), ZipEntry("pre.txt", 200, 50, 100)]
+    assert member_ranges(entries, ["num.txt"], 300, merge_gap=0) == [MemberRange(100, 199, [entries[1]])]
+    assert member_ranges(entries, ["pre.txt"], 300, merge_gap=0) == [MemberRange(200, 299, [entries[2]])]
+
+
+def test_member_ranges_merge_close_members():
+    entries = [ZipEntry("pre.txt", 200, 50, 100), ZipEntry("sub.txt", 0, 50, 100), ZipEntry("num.txt", 100, 50, 100)]
+    assert member_ranges(entries, ["sub.txt", "pre.txt"], 300, merge_gap=0) == [MemberRange(0, 99, [entries[1]]), MemberRange(200, 299, [entries[0]])]
+    assert member_ranges(entries, ["sub.txt", "pre.txt"], 300, merge_gap=101) == [MemberRange(0, 299, [entries[1], entries[0]])]
+
+
+def test_member_ranges_read_the_members():
+    archive = zip_archive()
+    offset, size, _ = central_directory(archive)
+    ranges = member_ranges(parse_central_directory(archive[offset:offset + size]), ["num.txt"], offset)
+    assert len(ranges) == 1
+    infos = zipfile.ZipFile(io.BytesIO(archive))
+    assert (ranges[0].start, ranges[0].end + 1) == (infos.getinfo("num.txt").header_offset, infos.getinfo("pre.txt").header_offset)
+    assert archive[ranges[0].start:ranges[0].start + 4] == b"PK\x03\x04"
@@ -0,0 +1,103 @@
+import io
+import struct
+import zipfile
+
+import pytest
+
+from sec_fs_dataset_collector.zip_stream import BadZipStream, iter_zip_members
+
+
+class NonSeekableWriter(io.RawIOBase):
+    """
+    Writer which can't seek, so that zipfile writes the sizes of the members in data descriptors
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+def chunked(data: bytes, chunk_size: int = 7):
+    return [data[start:start + chunk_size] for start in range(0, len(data), chunk_size)]
+
+
+def read_members(data: bytes, chunk_size: int = 7) -> dict:
+    return {name: b"".join(chunks) for name, chunks in iter_zip_members(chunked(data, chunk_size))}
+
+
+def zip_archive(members: dict, compression=zipfile.ZIP_DEFLATED, force_zip64: bool = False) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=compression) as archive:
+        for name, data in members.items():
+            with archive.open(name, "w", force_zip64=force_zip64) as member:
+                member.write(data)
+    return buffer.getvalue()
+
+
+MEMBERS = {
+    "sub.txt": b"adsh\tcik\n" + b"0000000000-09-000001\t1\n" * 1000,
+    "num.txt": b"adsh\ttag\tvalue\n" + bytes(range(256)) * 100,
+    "empty.txt": b"",
+}
+
+
+def test_deflated_members():
+    assert read_members(zip_archive(MEMBERS)) == MEMBERS
+
+
+def test_stored_members():
+    assert read_members(zip_archive(MEMBERS, compression=zipfile.ZIP_STORED)) == MEMBERS
+
+
+def test_zip64_members():
+    assert read_members(zip_archive(MEMBERS, force_zip64=True)) == MEMBERS
+
+
+def test_deflated_members_with_data_descriptor():
+    writer = NonSeekableWriter()
+    with zipfile.ZipFile(writer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in MEMBERS.items():
+            archive.writestr(name, data)
+    data = bytes(writer.data)
+    assert zipfile.ZipFile(io.BytesIO(data)).infolist()[0].flag_bits & 0x08
+    assert read_members(data) == MEMBERS
+
+
+def test_directory_with_data_descriptor_is_skipped():
+    # Local header of a stored directory entry whose sizes are only given by the data descriptor following it,
+    # as written by streaming writers
+    directory = struct.pack("<4sHHHHHIIIHH", b"PK\x03\x04", 20, 0x08, 0, 0, 0, 0, 0, 0, len(b"dir/"), 0) + b"dir/"
+    descriptor = struct.pack("<4sIII", b"PK\x07\x08", 0, 0, 0)
+    data = directory + descriptor + zip_archive({"dir/sub.txt": MEMBERS["sub.txt"]})
+    assert read_members(data) == {"dir/sub.txt": MEMBERS["sub.txt"]}
+
+
+def test_stored_member_with_data_descriptor_is_rejected():
+    writer = NonSeekableWriter()
+    with zipfile.ZipFile(writer, "w", compression=zipfile.ZIP_STORED) as archive:
+        archive.writestr("sub.txt", MEMBERS["sub.txt"])
+    with pytest.raises(BadZipStream):
+        read_members(bytes(writer.data))
+
+
+def test_unconsumed_members_are_skipped():
+    names = [name for name, _ in iter_zip_members(chunked(zip_archive(MEMBERS)))]
+    assert names == list(MEMBERS)
+
+
+def test_corrupted_member_fails_its_crc():
+    data = bytearray(zip_archive({"sub.txt": MEMBERS["sub.txt"]}, compression=zipfile.ZIP_STORED))
+    data[60] ^= 0xFF
+    with pytest.raises(BadZipStream, match="CRC"):
+        read_members(bytes(data))
+
+
+def test_truncated_archive():
+    with pytest.raises(BadZipStream):
+        read_members(zip_archive(MEMBERS)[:200])
@@ -0,0 +1,63 @@
+"""
+Helpers shared by the unit tests and the benchmarks
+"""
+
+import contextlib
+import functools
+import http.server
+import os
+import re
+import threading
+from typing import Iterator
+
+# Bucket and Glue database created in the mocked AWS account of the unit tests (see conftest.py)
+BUCKET = "sec-fs-test"
+DATABASE = "sec_fs_test"
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Static file handler answering single byte range requests (bytes=start-end and bytes=-suffix), like the SEC website
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path) or self.headers.get("If-Range") not in (None, self._last_modified(path)):
+            return super().do_GET()
+        size = os.path.getsize(path)
+        if match.group(1):
+            start, end = int(match.group(1)), min(int(match.group(2) or size - 1), size - 1)
+        else:
+            start, end = max(0, size - int(match.group(2))), size - 1
+        with open(path, mode="rb") as file:
+            file.seek(start)
+            data = file.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end, size))
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Last-Modified", self._last_modified(path))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _last_modified(self, path: str) -> str:
+        return self.date_time_string(int(os.path.getmtime(path)))
+
+
+@contextlib.contextmanager
+def serve_directory(path: str) -> Iterator[str]:
+    """
+    Serve the files of path over HTTP, like the SEC website serves the archives, and yield the base URL
+    """
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(RangeRequestHandler, directory=path))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield "http://127.0.0.1:{}/".format(server.server_port)
+    finally:
+        server.shutdown()
+        thread.join()